@@ -27,7 +27,8 @@ if __name__ == "__main__":
     parser.add_argument(
         "account_number",
         type=int,
-        help="Account number to use with twikit",
+        nargs="+",
+        help="Account numbers to use with twikit",
     )
 
     args = parser.parse_args()
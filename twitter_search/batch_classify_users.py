@@ -0,0 +1,235 @@
+"""
+Classifies every user of a city with an offline batch job, for backfills
+
+The users' descriptions and tweets are read from S3 and written to a
+batch input file, which is submitted, polled until it completes, and
+ingested back into Neptune. Each step can be run on its own, resuming
+from the job's directory.
+"""
+
+import asyncio
+from argparse import ArgumentParser
+
+from config_utils.cities import CITIES
+from config_utils.constants import (
+    NEPTUNE_ENDPOINT,
+    S3_PREFETCH_USERS,
+    STORAGE_BACKEND,
+)
+from config_utils.neptune_handler import NeptuneHandler
+from config_utils.s3_reader import UserInputReader
+from llm_classification.batch_jobs import (
+    ClassificationBatchJob,
+    create_batch_client,
+)
+from llm_classification.constants import (
+    BATCH_BACKEND,
+    BATCH_JOB_SIZE,
+    BATCH_POLL_INTERVAL,
+    BATCH_TWEET_TOKEN_BUDGET,
+    NEPTUNE_AWS_REGION,
+    NEPTUNE_S3_BUCKET,
+    OPENAI_MODEL,
+)
+from llm_classification.openai_classifier import GPTClassifier
+from llm_classification.prompts import select_tweets
+from llm_classification.response_cache import ResponseCache
+
+
+def list_user_prefixes(s3_client, location, bucket=NEPTUNE_S3_BUCKET):
+    """
+    Lists the classification input prefixes of a city's users
+    """
+    paginator = s3_client.get_paginator("list_objects_v2")
+    pages = paginator.paginate(
+        Bucket=bucket,
+        Prefix=f"networks/{location}/classification/",
+        Delimiter="/",
+    )
+
+    return [
+        f"{common_prefix['Prefix']}input/"
+        for page in pages
+        for common_prefix in page.get("CommonPrefixes", [])
+    ]
+
+
+def load_users(reader, user_prefixes):
+    """
+    Yields the users to classify, reading the next ones in the background
+
+    Args:
+        - reader (UserInputReader)
+        - user_prefixes (list): classification input prefixes
+    """
+    for user_prefix in user_prefixes[:S3_PREFETCH_USERS]:
+        reader.prefetch(user_prefix)
+
+    for i, user_prefix in enumerate(user_prefixes):
+        if i + S3_PREFETCH_USERS < len(user_prefixes):
+            reader.prefetch(user_prefixes[i + S3_PREFETCH_USERS])
+        user = user_prefix.split("/")[3]
+        try:
+            description_text, tweets_list = reader.get(user_prefix)
+        except Exception as error:
+            print(f"Unable to read user {user}: {error}")
+            continue
+        if description_text is None:
+            print(f"Description should be stored for user {user}")
+            continue
+
+        yield {
+            "user_id": user,
+            "description": description_text,
+            "tweets": select_tweets(tweets_list, BATCH_TWEET_TOKEN_BUDGET),
+        }
+
+
+def ingest_classifications(classifications):
+    """
+    Stores the classifications as the category of the users in Neptune
+    """
+    neptune_handler = NeptuneHandler(NEPTUNE_ENDPOINT)
+    neptune_handler.start()
+    try:
+        for user_id, category in classifications.items():
+            try:
+                neptune_handler.update_node_attributes(
+                    "User", user_id, {"category": category}
+                )
+            except Exception as error:
+                print(f"Unable to update user {user_id}: {error}")
+    finally:
+        neptune_handler.stop()
+
+
+async def run_job(job, location, steps, reader, classifier, args):
+    """
+    Runs the requested steps of a city's job. A batch still in progress
+    is polled rather than prepared and submitted again.
+    """
+    if job.batch_in_progress and ({"prepare", "submit"} & set(steps)):
+        print(f"{job.job_name}: resuming batch {job.state['batch']['id']}")
+        steps = [step for step in steps if step in ("poll", "ingest")]
+
+    if "prepare" in steps:
+        user_prefixes = await asyncio.to_thread(
+            list_user_prefixes, reader.s3_client, location
+        )
+        num_requests = await asyncio.to_thread(
+            job.prepare,
+            load_users(reader, user_prefixes),
+            classifier,
+            args.batch_size,
+        )
+        if not num_requests:
+            # Every user is cached, or there are none
+            print(f"{job.job_name}: no requests to submit")
+            steps = [step for step in steps if step == "ingest"]
+
+    if "submit" in steps:
+        await asyncio.to_thread(job.submit)
+
+    if "poll" in steps:
+        status = await job.poll(args.poll_interval)
+        if status != "completed":
+            print(f"{job.job_name}: not ingesting a {status} batch")
+            return
+
+    if "ingest" in steps:
+        classifications, _ = job.read_results(classifier)
+        if not args.skip_graph:
+            await asyncio.to_thread(ingest_classifications, classifications)
+
+
+async def main(args):
+    locations = CITIES if args.location == "all" else [args.location]
+    steps = ["prepare", "submit", "poll", "ingest"]
+    if args.step != "all":
+        steps = [args.step]
+    batch_client = create_batch_client(args.batch_backend)
+    reader = None
+    if "prepare" in steps:
+        reader = UserInputReader(
+            bucket=NEPTUNE_S3_BUCKET,
+            storage_backend=args.storage_backend,
+            region_name=NEPTUNE_AWS_REGION,
+        )
+    cache = None if args.skip_cache else ResponseCache()
+    classifier = GPTClassifier(model=OPENAI_MODEL, cache=cache)
+    # Jobs of different cities are submitted and polled at the same time
+    await asyncio.gather(
+        *(
+            run_job(
+                ClassificationBatchJob(
+                    batch_client,
+                    f"{args.job_prefix}{location.replace(' ', '_')}",
+                ),
+                location,
+                steps,
+                reader,
+                classifier,
+                args,
+            )
+            for location in locations
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser("Parameters to classify users with batch jobs")
+    parser.add_argument(
+        "location", type=str, help="City to classify, or all of them"
+    )
+    parser.add_argument(
+        "--step",
+        type=str,
+        choices=["prepare", "submit", "poll", "ingest", "all"],
+        default="all",
+        help="Step of the job to run, resuming from the job's directory",
+    )
+    parser.add_argument(
+        "--job_prefix",
+        type=str,
+        default="",
+        help="Prefix of the job names, which are the cities otherwise",
+    )
+    parser.add_argument(
+        "--batch_backend",
+        type=str,
+        choices=["openai", "local"],
+        default=BATCH_BACKEND,
+        help="Submit to the OpenAI Batch API or to the local stub",
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=BATCH_JOB_SIZE,
+        help="Users per request",
+    )
+    parser.add_argument(
+        "--poll_interval",
+        type=int,
+        default=BATCH_POLL_INTERVAL,
+        help="Seconds between status checks",
+    )
+    parser.add_argument(
+        "--storage_backend",
+        type=str,
+        choices=["s3", "local"],
+        default=STORAGE_BACKEND,
+        help="Read inputs from AWS S3 or from the local object store",
+    )
+    parser.add_argument(
+        "--skip_graph",
+        action="store_true",
+        help="Only store the classifications in the job's directory",
+    )
+    parser.add_argument(
+        "--skip_cache",
+        action="store_true",
+        help="Send every user, ignoring the cached classifications",
+    )
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
@@ -5,6 +5,7 @@ uploads them in bulk to Neptune
 
 from argparse import ArgumentParser
 
+from config_utils.constants import STORAGE_BACKEND
 from network.neptune_bulk_uploader import NeptuneBulkUploader
 
 
@@ -23,8 +24,17 @@ if __name__ == "__main__":
         help="Edge type to choose",
         choices=["retweet", "follower"],
     )
+    parser.add_argument(
+        "--storage_backend",
+        type=str,
+        choices=["s3", "local"],
+        default=STORAGE_BACKEND,
+        help="Upload the csvs to AWS S3 or to the local object store",
+    )
 
     args = parser.parse_args()
 
-    neptune_bulk_uploader = NeptuneBulkUploader(args.location, args.graph_type)
+    neptune_bulk_uploader = NeptuneBulkUploader(
+        args.location, args.graph_type, args.storage_backend
+    )
     neptune_bulk_uploader.run()
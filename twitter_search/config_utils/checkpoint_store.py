@@ -0,0 +1,100 @@
+"""
+Pagination checkpoints for the SQS workers.
+
+Follower, retweeter and search extractions page through results with a
+cursor. After every page, workers save the next cursor and the results
+gathered so far, so a retry after a crash, a 429 or a visibility timeout
+resumes from the last completed page instead of from page one.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from config_utils.constants import CHECKPOINT_DB_PATH, CHECKPOINT_TTL
+
+
+class CheckpointStore:
+    """
+    SQLite-backed checkpoint store, shared by all the workers on a host
+    """
+
+    def __init__(self, db_path=CHECKPOINT_DB_PATH, ttl=CHECKPOINT_TTL):
+        self.ttl = ttl
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            db_path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                task_key TEXT PRIMARY KEY,
+                cursor TEXT,
+                pages INTEGER NOT NULL,
+                results TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+
+    def load(self, task_key):
+        """
+        Gets the checkpoint of a task. Checkpoints older than the TTL are
+        dropped, since their cursors are likely expired.
+
+        Args:
+            - task_key (str): e.g. "followers#<user_id>"
+
+        Returns:
+            - cursor (str): None when starting from the first page
+            - pages (int): number of pages already fetched
+            - results: results gathered so far, None if no checkpoint
+        """
+        with self.lock:
+            self.connection.execute(
+                "DELETE FROM checkpoints WHERE updated_at < ?",
+                (time.time() - self.ttl,),
+            )
+            row = self.connection.execute(
+                """
+                SELECT cursor, pages, results FROM checkpoints
+                WHERE task_key = ?
+                """,
+                (task_key,),
+            ).fetchone()
+
+        if not row:
+            return None, 0, None
+
+        cursor, pages, results = row
+        return cursor, pages, json.loads(results)
+
+    def save(self, task_key, cursor, pages, results):
+        """
+        Saves a task's progress after a completed page
+
+        Args:
+            - task_key (str)
+            - cursor (str): cursor of the next page, None if there is none
+            - pages (int): number of pages fetched
+            - results: JSON serializable results gathered so far
+        """
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?)",
+                (task_key, cursor, pages, json.dumps(results), time.time()),
+            )
+
+    def delete(self, task_key):
+        """
+        Deletes a task's checkpoint once it is completed
+        """
+        with self.lock:
+            self.connection.execute(
+                "DELETE FROM checkpoints WHERE task_key = ?", (task_key,)
+            )
@@ -22,6 +22,84 @@ SQS_USER_CLASSIFICATION = "UserClassification"
 SQS_USER_TWEETS = "UserTweets"
 SQS_USER_FOLLOWERS = "UserFollowers"
 SQS_USER_RETWEETERS = "UserRetweeters.fifo"
+# Either "sqs" (AWS) or "local" (SQLite file, for offline runs)
+QUEUE_BACKEND = "sqs"
+LOCAL_QUEUE_DB_PATH = project_root / "data" / "local_queues" / "queues.db"
+# Defaults mirroring the SQS queue configuration
+DEFAULT_VISIBILITY_TIMEOUT = 30
+FIFO_DEDUPLICATION_INTERVAL = 300
+# Dispatch deduplication across stages: "local" (SQLite) or "dynamodb".
+# "local" only deduplicates the workers of one host, workers running on
+# several hosts must use "dynamodb"
+DEDUP_BACKEND = "local"
+DEDUP_DB_PATH = project_root / "data" / "local_queues" / "dedup.db"
+DEDUP_TABLE_NAME = "DispatchDedup"
+# Length (in seconds) of the crawl window a dispatch is unique within
+DEDUP_WINDOW = 86400
+# Priority frontier for users found with --further_extraction
+FRONTIER_DB_PATH = project_root / "data" / "local_queues" / "frontier.db"
+# Hops away from the city's root users (which are at depth 0)
+FRONTIER_MAX_DEPTH = 3
+# Maximum number of users released for extraction per city and crawl window
+FRONTIER_CITY_BUDGET = 5000
+# Length (in seconds) of the crawl window a city's budget is spent within
+FRONTIER_BUDGET_WINDOW = 86400
+# Users released from the frontier after each processed user
+FRONTIER_RELEASE_SIZE = 10
+# Pagination checkpoints, dropped after CHECKPOINT_TTL seconds
+CHECKPOINT_DB_PATH = project_root / "data" / "local_queues" / "checkpoints.db"
+CHECKPOINT_TTL = 172800
+# Follower pages fetched ahead of the graph writes
+FOLLOWER_PAGE_BUFFER = 3
+# Follower ids per request, and users hydrated per lookup, in ids mode
+FOLLOWER_IDS_PAGE_SIZE = 5000
+HYDRATION_BATCH_SIZE = 100
+# twikit has no batch users lookup, users of a batch are looked up one by
+# one, this many at a time
+TWIKIT_LOOKUP_CONCURRENCY = 5
+# Profiles shared by every stage, fetched again after PROFILE_TTL seconds
+PROFILE_DB_PATH = project_root / "data" / "local_queues" / "profiles.db"
+PROFILE_TTL = 604800
+# Retweeter pages spent per user, on its most (recently) retweeted tweets
+RETWEETER_PAGE_BUDGET = 20
+RETWEETERS_PAGE_SIZE = 100
+# Days after which a tweet's retweet_count is halved when ranking tweets
+RETWEET_RECENCY_HALF_LIFE = 7
+# Seconds between requests of a twikit account, adapted on rate limits
+RATE_LIMIT_MIN_INTERVAL = 1
+RATE_LIMIT_MAX_INTERVAL = 60
+# Tweets whose retweeters are fetched at the same time in network builds
+RETWEETER_CONCURRENCY = 4
+# Followers outside the city: "full" User nodes or minimal "stub" nodes
+OUT_OF_CITY_USERS = "full"
+# Stub nodes and follower edges written per query in stub mode
+STUB_WRITE_BATCH_SIZE = 50
+# Followers extracted per root user when --num_followers is not given
+DEFAULT_NUM_FOLLOWERS = 1000
+# Adaptive follower sampling: the budget scales with the square root of the
+# user's followers_count relative to ADAPTIVE_REFERENCE_FOLLOWERS, then with
+# the in-city share over the last ADAPTIVE_YIELD_WINDOW pages relative to
+# ADAPTIVE_TARGET_YIELD, within ADAPTIVE_MAX_MULTIPLIER times (or a fraction)
+# of --num_followers. Extraction stops below ADAPTIVE_MIN_YIELD
+ADAPTIVE_REFERENCE_FOLLOWERS = 10000
+ADAPTIVE_MIN_YIELD = 0.01
+ADAPTIVE_TARGET_YIELD = 0.05
+ADAPTIVE_YIELD_WINDOW = 3
+ADAPTIVE_MIN_PAGES = 2
+ADAPTIVE_MAX_MULTIPLIER = 4
+# Background S3 writes: threads (and connections), and writes in flight
+S3_WRITER_WORKERS = 16
+S3_WRITER_MAX_PENDING = 64
+# Size and hash of the objects uploaded by bulk uploads, to skip them
+S3_MANIFEST_DB_PATH = project_root / "data" / "local_queues" / "s3_manifest.db"
+# Queued users whose classification inputs are read ahead, and S3 threads
+S3_PREFETCH_USERS = 3
+S3_READER_WORKERS = 8
+# Either "s3" (AWS) or "local" (a directory, for offline runs and benchmarks)
+STORAGE_BACKEND = "s3"
+LOCAL_OBJECT_STORE_PATH = project_root / "data" / "local_object_store"
+# Seconds added to every request served by the local object store
+LOCAL_OBJECT_STORE_LATENCY = 0
 
 # Construct the path to the cleaned_data directory
 RAW_DATA_PATH = project_root / "data" / "raw_data"
@@ -0,0 +1,278 @@
+"""
+Priority crawl frontier used by the SQS workers with --further_extraction.
+
+Instead of queueing every in-city user as soon as it is discovered, the
+followers and retweeters workers push candidates to the frontier, which
+ranks them by expected in-city yield. After each processed user, workers
+release the best pending candidates of the city to the tweets and
+followers queues, until the city's budget for the current crawl window is
+spent. Idle workers release the remaining candidates too, so the tail of
+the frontier does not wait for users that will never be processed.
+"""
+
+import math
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from config_utils.constants import (
+    FRONTIER_BUDGET_WINDOW,
+    FRONTIER_CITY_BUDGET,
+    FRONTIER_DB_PATH,
+    FRONTIER_MAX_DEPTH,
+)
+from config_utils.util import location_match_score
+
+
+def score_candidate(followers_count, location_confidence, retweets, depth):
+    """
+    Expected in-city yield of crawling a user: larger and more active
+    in-city accounts close to the root users come first
+
+    Args:
+        - followers_count (int)
+        - location_confidence (float): between 0 and 1
+        - retweets (int): times the user was seen retweeting crawled users
+        - depth (int): hops away from the city's root users
+
+    Returns:
+        - score (float)
+    """
+    return (
+        math.log10(max(followers_count, 0) + 1)
+        * location_confidence
+        * (1 + math.log1p(retweets))
+        / (1 + depth)
+    )
+
+
+class CrawlFrontier:
+    """
+    SQLite-backed priority frontier, shared by all the workers on a host
+    """
+
+    def __init__(
+        self,
+        db_path=FRONTIER_DB_PATH,
+        max_depth=FRONTIER_MAX_DEPTH,
+        city_budget=FRONTIER_CITY_BUDGET,
+        budget_window=FRONTIER_BUDGET_WINDOW,
+    ):
+        self.max_depth = max_depth
+        self.city_budget = city_budget
+        self.budget_window = budget_window
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            db_path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS candidates (
+                location TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                followers_count INTEGER NOT NULL,
+                location_confidence REAL NOT NULL,
+                retweets INTEGER NOT NULL,
+                depth INTEGER NOT NULL,
+                score REAL NOT NULL,
+                released_at REAL,
+                PRIMARY KEY (location, user_id)
+            )
+            """
+        )
+        self.connection.execute(
+            """
+            CREATE INDEX IF NOT EXISTS candidates_score_idx
+            ON candidates (location, released_at, score)
+            """
+        )
+
+    def push(self, user_dict, depth, retweets=0):
+        """
+        Adds a candidate, or updates it if it was already pushed: its
+        retweets are accumulated and its depth is the lowest seen
+
+        Args:
+            - user_dict (dict): parsed user, with 'target_location'
+            - depth (int): hops away from the city's root users
+            - retweets (int): retweets observed in this batch
+
+        Returns:
+            - pushed (bool): False if the candidate is too deep
+        """
+        if depth > self.max_depth:
+            return False
+
+        location = user_dict["target_location"]
+        user_id = str(user_dict["user_id"])
+        location_confidence = location_match_score(
+            user_dict["profile_location"], location
+        )
+
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.connection.execute(
+                    """
+                    SELECT retweets, depth FROM candidates
+                    WHERE location = ? AND user_id = ?
+                    """,
+                    (location, user_id),
+                ).fetchone()
+                if row:
+                    retweets += row[0]
+                    depth = min(depth, row[1])
+                score = score_candidate(
+                    user_dict["followers_count"],
+                    location_confidence,
+                    retweets,
+                    depth,
+                )
+                self.connection.execute(
+                    """
+                    INSERT INTO candidates
+                    (location, user_id, followers_count, location_confidence,
+                     retweets, depth, score)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (location, user_id) DO UPDATE SET
+                        followers_count = excluded.followers_count,
+                        retweets = excluded.retweets,
+                        depth = excluded.depth,
+                        score = excluded.score
+                    """,
+                    (
+                        location,
+                        user_id,
+                        user_dict["followers_count"],
+                        location_confidence,
+                        retweets,
+                        depth,
+                        score,
+                    ),
+                )
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+
+        return True
+
+    def record_retweet(self, location, user_id):
+        """
+        Raises the score of a pending candidate seen retweeting another
+        crawled user. Users that are not pending candidates are ignored.
+
+        Args:
+            - location (str)
+            - user_id (str)
+        """
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.connection.execute(
+                    """
+                    SELECT followers_count, location_confidence, retweets,
+                           depth
+                    FROM candidates
+                    WHERE location = ? AND user_id = ?
+                    AND released_at IS NULL
+                    """,
+                    (location, str(user_id)),
+                ).fetchone()
+                if row:
+                    followers_count, location_confidence, retweets, depth = row
+                    score = score_candidate(
+                        followers_count,
+                        location_confidence,
+                        retweets + 1,
+                        depth,
+                    )
+                    self.connection.execute(
+                        """
+                        UPDATE candidates
+                        SET retweets = retweets + 1, score = ?
+                        WHERE location = ? AND user_id = ?
+                        """,
+                        (score, location, str(user_id)),
+                    )
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def pending_locations(self):
+        """
+        Returns the cities that still have pending candidates
+
+        Returns:
+            - locations (list)
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                """
+                SELECT DISTINCT location FROM candidates
+                WHERE released_at IS NULL
+                """
+            ).fetchall()
+
+        return [row[0] for row in rows]
+
+    def release(self, location, num_users):
+        """
+        Marks the best pending candidates of a city as released, without
+        going over the city's budget. Only users released in the current
+        crawl window count towards it, so a city is not starved for good
+        once its budget is spent.
+
+        Args:
+            - location (str)
+            - num_users (int)
+
+        Returns:
+            - released (list): list of (user_id, depth) tuples
+        """
+        window_start = (time.time() // self.budget_window) * self.budget_window
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                released_count = self.connection.execute(
+                    """
+                    SELECT COUNT(*) FROM candidates
+                    WHERE location = ? AND released_at >= ?
+                    """,
+                    (location, window_start),
+                ).fetchone()[0]
+                num_users = min(num_users, self.city_budget - released_count)
+                if num_users <= 0:
+                    self.connection.execute("COMMIT")
+                    return []
+
+                released = self.connection.execute(
+                    """
+                    SELECT user_id, depth FROM candidates
+                    WHERE location = ? AND released_at IS NULL
+                    ORDER BY score DESC
+                    LIMIT ?
+                    """,
+                    (location, num_users),
+                ).fetchall()
+                self.connection.executemany(
+                    """
+                    UPDATE candidates SET released_at = ?
+                    WHERE location = ? AND user_id = ?
+                    """,
+                    [
+                        (time.time(), location, user_id)
+                        for user_id, _ in released
+                    ],
+                )
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+
+        return released
@@ -0,0 +1,194 @@
+"""
+Dispatch deduplication shared by the SQS workers.
+
+A user that shows up as a follower or retweeter of several root users can
+be sent to the same queue several times before its graph node becomes
+visible to the other workers. Before dispatching, workers claim the
+(stage, item id, crawl window) key; only the first claim within a window
+succeeds. Claims expire at the end of their window, and are released if
+the message cannot be sent. Tweets are only claimed once their message
+is sent, so a redelivered tweets message resends the tweets it could not
+send before.
+
+LocalDedupStore is a SQLite file, so it only deduplicates the workers of
+one host. Workers running on several hosts must share DynamoDedupStore.
+"""
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import boto3
+import botocore
+from config_utils.constants import (
+    DEDUP_BACKEND,
+    DEDUP_DB_PATH,
+    DEDUP_TABLE_NAME,
+    DEDUP_WINDOW,
+    REGION_NAME,
+)
+
+
+def build_dedup_key(stage, item_id, window):
+    """
+    Builds the key for a dispatch in the current crawl window
+
+    Args:
+        - stage (str): queue the item is dispatched to
+        - item_id (str): user or tweet id
+        - window (int): window length in seconds
+
+    Returns:
+        - dedup_key (str)
+        - expires_at (int): epoch seconds at which the window closes
+    """
+    window_index = int(time.time() // window)
+    dedup_key = f"{stage}#{item_id}#{window_index}"
+    expires_at = (window_index + 1) * window
+
+    return dedup_key, expires_at
+
+
+class LocalDedupStore:
+    """
+    SQLite-backed dedup store, shared by all the workers on a host. It
+    does not see the claims of workers on other hosts.
+    """
+
+    def __init__(self, db_path=DEDUP_DB_PATH, window=DEDUP_WINDOW):
+        self.window = window
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            db_path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS dispatches (
+                dedup_key TEXT PRIMARY KEY,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+
+    def claim(self, stage, item_id):
+        """
+        Claims a dispatch
+
+        Returns:
+            - claimed (bool): False if the item was already dispatched
+            to this stage within the current window
+        """
+        dedup_key, expires_at = build_dedup_key(stage, item_id, self.window)
+        with self.lock:
+            self.connection.execute(
+                "DELETE FROM dispatches WHERE expires_at <= ?", (time.time(),)
+            )
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO dispatches VALUES (?, ?)",
+                (dedup_key, expires_at),
+            )
+
+        return cursor.rowcount == 1
+
+    def is_claimed(self, stage, item_id):
+        """
+        Checks whether a dispatch was claimed in the current window,
+        without claiming it
+        """
+        dedup_key, _ = build_dedup_key(stage, item_id, self.window)
+        with self.lock:
+            row = self.connection.execute(
+                """
+                SELECT 1 FROM dispatches
+                WHERE dedup_key = ? AND expires_at > ?
+                """,
+                (dedup_key, time.time()),
+            ).fetchone()
+
+        return row is not None
+
+    def release(self, stage, item_id):
+        """
+        Releases a claim, e.g. when sending the message failed
+        """
+        dedup_key, _ = build_dedup_key(stage, item_id, self.window)
+        with self.lock:
+            self.connection.execute(
+                "DELETE FROM dispatches WHERE dedup_key = ?", (dedup_key,)
+            )
+
+
+class DynamoDedupStore:
+    """
+    DynamoDB-backed dedup store, shared by workers across hosts. The
+    table uses 'dedup_key' as partition key and 'expires_at' as TTL
+    attribute.
+    """
+
+    def __init__(self, table_name=DEDUP_TABLE_NAME, window=DEDUP_WINDOW):
+        self.window = window
+        dynamodb = boto3.resource("dynamodb", region_name=REGION_NAME)
+        self.table = dynamodb.Table(table_name)
+
+    def claim(self, stage, item_id):
+        """
+        Claims a dispatch with a conditional put
+
+        Returns:
+            - claimed (bool): False if the item was already dispatched
+            to this stage within the current window
+        """
+        dedup_key, expires_at = build_dedup_key(stage, item_id, self.window)
+        try:
+            self.table.put_item(
+                Item={"dedup_key": dedup_key, "expires_at": expires_at},
+                ConditionExpression="attribute_not_exists(dedup_key)",
+            )
+        except botocore.exceptions.ClientError as err:
+            if (
+                err.response["Error"]["Code"]
+                == "ConditionalCheckFailedException"
+            ):
+                return False
+            raise
+
+        return True
+
+    def is_claimed(self, stage, item_id):
+        """
+        Checks whether a dispatch was claimed in the current window,
+        without claiming it. DynamoDB deletes expired items lazily, so
+        expires_at is checked too.
+        """
+        dedup_key, _ = build_dedup_key(stage, item_id, self.window)
+        item = self.table.get_item(
+            Key={"dedup_key": dedup_key}, ConsistentRead=True
+        ).get("Item")
+
+        return item is not None and item["expires_at"] > time.time()
+
+    def release(self, stage, item_id):
+        """
+        Releases a claim, e.g. when sending the message failed
+        """
+        dedup_key, _ = build_dedup_key(stage, item_id, self.window)
+        self.table.delete_item(Key={"dedup_key": dedup_key})
+
+
+def create_dedup_store(dedup_backend=DEDUP_BACKEND):
+    """
+    Returns the dedup store for the chosen backend
+
+    Args:
+        - dedup_backend (str): "local" or "dynamodb"
+    """
+    if dedup_backend == "local":
+        return LocalDedupStore()
+    elif dedup_backend == "dynamodb":
+        return DynamoDedupStore()
+    else:
+        raise ValueError(f"Unknown dedup backend: {dedup_backend}")
@@ -0,0 +1,133 @@
+"""
+Per-user follower budgets for the followers worker.
+
+A fixed --num_followers spends the same budget on every root user. In
+adaptive mode, the budget first scales with the user's followers_count:
+larger audiences get a larger sample, growing with the square root of
+their size. Once a few pages are in, it follows the share of in-city
+followers in the latest pages, growing for users whose followers are
+mostly in the city and shrinking for the others, and the extraction stops
+early once too few location matches come back.
+"""
+
+from collections import deque
+
+from config_utils.constants import (
+    ADAPTIVE_MAX_MULTIPLIER,
+    ADAPTIVE_MIN_PAGES,
+    ADAPTIVE_MIN_YIELD,
+    ADAPTIVE_REFERENCE_FOLLOWERS,
+    ADAPTIVE_TARGET_YIELD,
+    ADAPTIVE_YIELD_WINDOW,
+    DEFAULT_NUM_FOLLOWERS,
+)
+
+
+class FollowerSampler:
+    """
+    Decides how many followers to extract from a root user
+    """
+
+    def __init__(
+        self,
+        num_followers=None,
+        followers_count=None,
+        adaptive=False,
+        min_yield=ADAPTIVE_MIN_YIELD,
+        target_yield=ADAPTIVE_TARGET_YIELD,
+        window=ADAPTIVE_YIELD_WINDOW,
+        min_pages=ADAPTIVE_MIN_PAGES,
+        max_multiplier=ADAPTIVE_MAX_MULTIPLIER,
+        reference_followers=ADAPTIVE_REFERENCE_FOLLOWERS,
+    ):
+        self.adaptive = adaptive
+        self.min_yield = min_yield
+        self.target_yield = target_yield
+        self.min_pages = min_pages
+        self.max_multiplier = max_multiplier
+        if num_followers is None:
+            num_followers = DEFAULT_NUM_FOLLOWERS
+        # Unknown counts come as None, or -99 from X API profiles
+        if followers_count is not None and int(followers_count) < 0:
+            followers_count = None
+        if followers_count is not None:
+            followers_count = int(followers_count)
+
+        self.min_budget = max(int(num_followers / max_multiplier), 1)
+        self.max_budget = num_followers * max_multiplier
+        self.base_budget = num_followers
+        if adaptive and followers_count is not None:
+            scale = (followers_count / reference_followers) ** 0.5
+            self.base_budget = self.clamp(num_followers * scale)
+        # No point asking for more followers than the user has
+        if followers_count is not None:
+            self.base_budget = min(self.base_budget, followers_count)
+            self.max_budget = min(self.max_budget, followers_count)
+        self.page_yields = deque(maxlen=window)
+        self.num_pages = 0
+
+    def clamp(self, budget):
+        """
+        Keeps an adapted budget between a fraction and a multiple of
+        num_followers
+        """
+        return int(min(max(budget, self.min_budget), self.max_budget))
+
+    def record_page(self, followers_page):
+        """
+        Records the share of in-city followers of a page
+
+        Args:
+            - followers_page (list): list of parsed follower dicts
+        """
+        if not followers_page:
+            return
+        matches = sum(
+            follower_dict["city"] == follower_dict["target_location"]
+            for follower_dict in followers_page
+        )
+        self.page_yields.append(matches / len(followers_page))
+        self.num_pages += 1
+
+    @property
+    def rolling_yield(self):
+        """
+        Share of in-city followers in the latest pages, None before any
+        """
+        if not self.page_yields:
+            return None
+        return sum(self.page_yields) / len(self.page_yields)
+
+    @property
+    def budget(self):
+        """
+        Followers to extract given the pages seen so far
+        """
+        if not self.adaptive or self.num_pages < self.min_pages:
+            return self.base_budget
+        # Users above the target yield get more pages, those below fewer
+        scale = self.rolling_yield / self.target_yield
+        return self.clamp(self.base_budget * scale)
+
+    def should_continue(self, extracted_followers):
+        """
+        Whether to fetch another page of followers
+
+        Args:
+            - extracted_followers (int)
+
+        Returns:
+            - continue (bool)
+        """
+        if extracted_followers >= self.budget:
+            return False
+        if (
+            self.adaptive
+            and self.num_pages >= self.min_pages
+            and self.rolling_yield < self.min_yield
+        ):
+            print(
+                f"Stopping early: {round(self.rolling_yield * 100, 1)}% of the latest followers are in the city"
+            )
+            return False
+        return True
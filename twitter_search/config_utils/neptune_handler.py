@@ -5,6 +5,24 @@ import time
 from gremlin_python.driver import client, serializer
 
 
+# Properties kept on the stub nodes of users outside the target city
+STUB_USER_FIELDS = [
+    "username",
+    "profile_location",
+    "target_location",
+    "followers_count",
+]
+
+
+def escape_gremlin_string(value: str) -> str:
+    """
+    Escapes a string to be written between single quotes in a Gremlin
+    query: JSON escaping (backslashes, newlines...) without the outer
+    quotes, plus the single quotes themselves.
+    """
+    return json.dumps(value)[1:-1].replace("'", "\\'")
+
+
 class NeptuneHandler:
     def __init__(self, endpoint: str, port: int = 8182):
         self.endpoint = f"wss://{endpoint}:{port}/gremlin"
@@ -46,6 +64,15 @@ class NeptuneHandler:
         result = self.run_query(query)
         return len(result) > 0
 
+    def get_existing_user_ids(self, user_ids: list) -> set:
+        """Returns the subset of user_ids that already have a User node."""
+        if not user_ids:
+            return set()
+        ids = ", ".join(f"'{user_id}'" for user_id in user_ids)
+        query = f"g.V({ids}).hasLabel('User').id()"
+        result = self.run_query(query) or []
+        return {str(user_id) for user_id in result}
+
     def city_exists(self, city_id: str) -> bool:
         query = f"g.V('{city_id}').hasLabel('City').limit(1)"
         result = self.run_query(query)
@@ -68,10 +95,7 @@ class NeptuneHandler:
                 if value is None or (value.strip() == ""):
                     safe_value = "null"
                 else:
-                    # Make string as json compliant - ignore outer quotes
-                    safe_value = json.dumps(value)[1:-1]
-                    # additionally escape single quotes for Gremlin
-                    safe_value = safe_value.replace("'", "\\'")
+                    safe_value = escape_gremlin_string(value)
                 query += f".property('{key}', '{safe_value}')"
             elif isinstance(value, (int, float)):
                 if value is None:
@@ -87,6 +111,85 @@ class NeptuneHandler:
 
         _ = self.run_query(query)
 
+    def create_stub_user_nodes(self, user_dicts: list):
+        """
+        Creates minimal User nodes for users that will not be crawled, in
+        a single query. Users that already have a node are left untouched.
+        """
+        if not user_dicts:
+            return
+        query = "g.inject(0)"
+        for user_dict in user_dicts:
+            user_id = user_dict["user_id"]
+            query += (
+                f".sideEffect(__.V('{user_id}').fold().coalesce(__.unfold(), "
+                f"__.addV('User').property(id, '{user_id}').property('stub', 'true')"
+            )
+            for key in STUB_USER_FIELDS:
+                value = user_dict.get(key)
+                if isinstance(value, str):
+                    safe_value = escape_gremlin_string(value)
+                    query += f".property('{key}', '{safe_value}')"
+                elif isinstance(value, (int, float)):
+                    query += f".property('{key}', {value})"
+            query += "))"
+        query += ".iterate()"
+
+        _ = self.run_query(query)
+
+    def get_stub_user_ids(self, user_ids: list) -> set:
+        """Returns the subset of user_ids whose User node is a stub."""
+        if not user_ids:
+            return set()
+        ids = ", ".join(f"'{user_id}'" for user_id in user_ids)
+        query = f"g.V({ids}).hasLabel('User').has('stub', 'true').id()"
+        result = self.run_query(query) or []
+        return {str(user_id) for user_id in result}
+
+    def promote_user_node(self, user_dict: dict):
+        """
+        Turns a stub into a full User node, with the same properties (and
+        City edge) create_user_node would have written.
+        """
+        user_id = user_dict["user_id"]
+        props_dict = {
+            key: value
+            for key, value in user_dict.items()
+            if key not in ["user_id", "description"]
+        }
+        for key, value in props_dict.items():
+            # Empty strings are written as 'null', as in create_user_node
+            if isinstance(value, str) and not value.strip():
+                props_dict[key] = "null"
+        props_dict["stub"] = "false"
+        self.update_node_attributes("User", user_id, props_dict)
+
+        # Stubs never get a City edge, so it cannot exist yet
+        if user_dict["city"] == user_dict["target_location"]:
+            query = (
+                f"g.V('{user_id}').hasLabel('User').as('u')"
+                f".V('{user_dict['city']}').hasLabel('City').as('c')"
+                ".addE('BELONGS_TO').from('u').to('c')"
+            )
+            _ = self.run_query(query)
+
+    def create_follower_edges(self, source_ids: list, target_id: str):
+        """
+        Creates the FOLLOWS edges from several users to target_id in a
+        single query, skipping the ones that already exist.
+        """
+        if not source_ids:
+            return
+        ids = ", ".join(f"'{source_id}'" for source_id in source_ids)
+        query = f"""
+                g.V({ids}).hasLabel('User').
+                coalesce(
+                    __.outE('FOLLOWS').where(__.inV().hasId('{target_id}')),
+                    __.addE('FOLLOWS').to(__.V('{target_id}'))
+                ).iterate()
+                """
+        _ = self.run_query(query)
+
     def create_follower_edge(self, source_id: str, target_id: str):
         # Check if the FOLLOWS edge already exists
         check_query = f"g.V('{source_id}').outE('FOLLOWS').where(inV().hasId('{target_id}')).limit(1)"
@@ -103,6 +206,12 @@ class NeptuneHandler:
         else:
             print("FOLLOWS edge already exists")
 
+    def get_follower_ids(self, user_id: str) -> set:
+        """Returns the ids of the users with a FOLLOWS edge to user_id."""
+        query = f"g.V('{user_id}').in('FOLLOWS').id()"
+        result = self.run_query(query)
+        return {str(follower_id) for follower_id in result}
+
     def create_retweeter_edge(
         self, source_id: str, target_id: str, tweet_id: str
     ):
@@ -165,7 +274,7 @@ class NeptuneHandler:
         for key, value in props_dict.items():
             # Handle types
             if isinstance(value, str):
-                safe_value = value.replace("'", "\\'")
+                safe_value = escape_gremlin_string(value)
                 query += f".property(single, '{key}', '{safe_value}')"
             elif isinstance(value, (int, float)):
                 query += f".property(single, '{key}', {value})"
@@ -0,0 +1,320 @@
+"""
+Object store backends used for the classification inputs and bulk loads.
+
+The scripts only rely on a small subset of the boto3 S3 client
+(put_object, get_object, head_object, delete_object, upload_file,
+download_file and list_objects_v2, with its paginator).
+LocalObjectStoreClient implements that same subset on top of a local
+directory, with one sub-directory per bucket, so the S3 paths can run
+offline. It counts the requests it serves and can add a fixed latency to
+each of them (LOCAL_OBJECT_STORE_LATENCY), to benchmark I/O patterns
+against a deterministic backend.
+
+put_objects, get_objects and list_keys batch the common operations for
+either backend.
+"""
+
+import io
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import boto3
+import botocore
+from config_utils.constants import (
+    LOCAL_OBJECT_STORE_LATENCY,
+    LOCAL_OBJECT_STORE_PATH,
+    NUM_WORKERS,
+    REGION_NAME,
+    STORAGE_BACKEND,
+)
+
+
+MAX_KEYS_PER_LIST = 1000
+
+
+class LocalPaginator:
+    """
+    Stand-in for the boto3 list_objects_v2 paginator
+    """
+
+    def __init__(self, list_objects):
+        self.list_objects = list_objects
+
+    def paginate(self, **kwargs):
+        while True:
+            page = self.list_objects(**kwargs)
+            yield page
+            if not page["IsTruncated"]:
+                return
+            kwargs["ContinuationToken"] = page["NextContinuationToken"]
+
+
+class LocalObjectStoreClient:
+    """
+    Directory-backed stand-in for the boto3 S3 client.
+
+    Objects are stored as files at {root}/{bucket}/{key}, written to a
+    temporary file first so readers never see partial objects. A single
+    client can be shared by several threads.
+    """
+
+    def __init__(
+        self, root=LOCAL_OBJECT_STORE_PATH, latency=LOCAL_OBJECT_STORE_LATENCY
+    ):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir = self.root / ".tmp"
+        self.tmp_dir.mkdir(exist_ok=True)
+        # Seconds added to every request
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests = Counter()
+
+    def _request(self, operation):
+        """
+        Counts a request and waits for the simulated latency
+        """
+        with self.lock:
+            self.requests[operation] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _path(self, bucket, key):
+        return self.root / bucket / key
+
+    @staticmethod
+    def _not_found(code, operation, key):
+        return botocore.exceptions.ClientError(
+            {"Error": {"Code": code, "Message": f"Not found: {key}"}},
+            operation,
+        )
+
+    def _write(self, path, write):
+        """
+        Writes a file through a temporary file, then moves it in place
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.tmp_dir / uuid.uuid4().hex
+        write(tmp_path)
+        os.replace(tmp_path, path)
+
+    def put_object(self, Bucket, Key, Body=b"", **kwargs):
+        self._request("PutObject")
+        if isinstance(Body, str):
+            Body = Body.encode("utf-8")
+        elif not isinstance(Body, bytes):
+            Body = Body.read()
+        self._write(
+            self._path(Bucket, Key), lambda path: path.write_bytes(Body)
+        )
+        return {}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self._request("GetObject")
+        path = self._path(Bucket, Key)
+        if not path.is_file():
+            raise self._not_found("NoSuchKey", "GetObject", Key)
+        body = path.read_bytes()
+        return {"Body": io.BytesIO(body), "ContentLength": len(body)}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self._request("HeadObject")
+        path = self._path(Bucket, Key)
+        if not path.is_file():
+            raise self._not_found("404", "HeadObject", Key)
+        return {"ContentLength": path.stat().st_size}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self._request("DeleteObject")
+        self._path(Bucket, Key).unlink(missing_ok=True)
+        return {}
+
+    def upload_file(self, Filename, Bucket, Key, **kwargs):
+        self._request("PutObject")
+        self._write(
+            self._path(Bucket, Key),
+            lambda path: shutil.copyfile(Filename, path),
+        )
+
+    def download_file(self, Bucket, Key, Filename, **kwargs):
+        self._request("GetObject")
+        path = self._path(Bucket, Key)
+        if not path.is_file():
+            raise self._not_found("404", "HeadObject", Key)
+        shutil.copyfile(path, Filename)
+
+    def list_objects_v2(
+        self,
+        Bucket,
+        Prefix="",
+        Delimiter=None,
+        MaxKeys=MAX_KEYS_PER_LIST,
+        ContinuationToken=None,
+        StartAfter=None,
+        **kwargs,
+    ):
+        self._request("ListObjectsV2")
+        bucket_dir = self.root / Bucket
+        # Only the directory holding the prefix is walked, not the bucket
+        prefix_dir = bucket_dir / Prefix.rpartition("/")[0]
+        keys = sorted(
+            path.relative_to(bucket_dir).as_posix()
+            for path in prefix_dir.rglob("*")
+            if path.is_file()
+        )
+        start_after = ContinuationToken or StartAfter or ""
+
+        # Keys under the same delimiter are grouped as one common prefix
+        entries = []
+        for key in keys:
+            if not key.startswith(Prefix) or key <= start_after:
+                continue
+            if Delimiter and Delimiter in key[len(Prefix) :]:
+                rest = key[len(Prefix) :]
+                common_prefix = Prefix + rest.split(Delimiter)[0] + Delimiter
+                if entries and entries[-1] == ("prefix", common_prefix):
+                    continue
+                if common_prefix <= start_after:
+                    continue
+                entries.append(("prefix", common_prefix))
+            else:
+                entries.append(("key", key))
+
+        page, rest = entries[:MaxKeys], entries[MaxKeys:]
+        response = {
+            "Contents": [
+                {
+                    "Key": key,
+                    "Size": (bucket_dir / key).stat().st_size,
+                }
+                for kind, key in page
+                if kind == "key"
+            ],
+            "CommonPrefixes": [
+                {"Prefix": prefix} for kind, prefix in page if kind == "prefix"
+            ],
+            "KeyCount": len(page),
+            "IsTruncated": bool(rest),
+        }
+        if rest:
+            # Resume after the last key, or after every key of the prefix
+            last_kind, last = page[-1]
+            response["NextContinuationToken"] = (
+                last if last_kind == "key" else last + "\uffff"
+            )
+        return response
+
+    def get_paginator(self, operation_name):
+        if operation_name != "list_objects_v2":
+            raise ValueError(f"Unsupported paginator: {operation_name}")
+        return LocalPaginator(self.list_objects_v2)
+
+
+def create_s3_client(
+    storage_backend=STORAGE_BACKEND, region_name=REGION_NAME, config=None
+):
+    """
+    Returns a client exposing the S3 API for the chosen backend
+
+    Args:
+        - storage_backend (str): "s3" for AWS, "local" for the local
+        directory stand-in
+        - region_name (str)
+        - config (botocore.config.Config): S3 client configuration
+    """
+    if storage_backend == "s3":
+        return boto3.client("s3", region_name=region_name, config=config)
+    elif storage_backend == "local":
+        return LocalObjectStoreClient()
+    else:
+        raise ValueError(f"Unknown storage backend: {storage_backend}")
+
+
+def list_keys(s3_client, bucket, prefix):
+    """
+    Lists every key under a prefix, across pages
+
+    Args:
+        - s3_client (boto3.client)
+        - bucket (str)
+        - prefix (str)
+
+    Returns:
+        - keys (list)
+    """
+    paginator = s3_client.get_paginator("list_objects_v2")
+    return [
+        element["Key"]
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix)
+        for element in page.get("Contents", [])
+    ]
+
+
+def put_objects(s3_client, bucket, objects, pool=None):
+    """
+    Puts several objects concurrently
+
+    Args:
+        - s3_client (boto3.client)
+        - bucket (str)
+        - objects (dict): bodies keyed by key
+        - pool (ThreadPoolExecutor): a new one with NUM_WORKERS threads
+        if None
+
+    Returns:
+        - errors (dict): exceptions keyed by the keys that failed
+    """
+    if pool is None:
+        with ThreadPoolExecutor(max_workers=NUM_WORKERS) as pool:
+            return put_objects(s3_client, bucket, objects, pool)
+
+    futures = {
+        key: pool.submit(
+            s3_client.put_object, Bucket=bucket, Key=key, Body=body
+        )
+        for key, body in objects.items()
+    }
+    errors = {}
+    for key, future in futures.items():
+        error = future.exception()
+        if error is not None:
+            print(f"Unable to put {key}: {error}")
+            errors[key] = error
+
+    return errors
+
+
+def get_objects(s3_client, bucket, keys, pool=None):
+    """
+    Gets several objects concurrently
+
+    Args:
+        - s3_client (boto3.client)
+        - bucket (str)
+        - keys (list)
+        - pool (ThreadPoolExecutor): a new one with NUM_WORKERS threads
+        if None
+
+    Returns:
+        - bodies (dict): bytes keyed by key, None for missing objects
+    """
+    if pool is None:
+        with ThreadPoolExecutor(max_workers=NUM_WORKERS) as pool:
+            return get_objects(s3_client, bucket, keys, pool)
+
+    def get_body(key):
+        try:
+            response = s3_client.get_object(Bucket=bucket, Key=key)
+        except botocore.exceptions.ClientError as error:
+            if error.response["Error"]["Code"] == "NoSuchKey":
+                return None
+            raise
+        return response["Body"].read()
+
+    return dict(zip(keys, pool.map(get_body, keys)))
@@ -0,0 +1,115 @@
+"""
+User profiles shared by every stage on a host.
+
+City search, followers and retweeters extraction, the batch hydrator and
+UserAttributes all store the profiles they fetch here, keyed by user_id.
+Before looking a user up, stages check the store first: profiles fetched
+less than PROFILE_TTL seconds ago are served as they are, saving both the
+request and rate-limit budget.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from config_utils.constants import PROFILE_DB_PATH, PROFILE_TTL
+
+
+# Fields kept from the user dicts built by each stage
+PROFILE_FIELDS = [
+    "user_id",
+    "username",
+    "description",
+    "profile_location",
+    "followers_count",
+    "following_count",
+    "tweets_count",
+    "verified",
+    "created_at",
+]
+
+
+class ProfileStore:
+    """
+    SQLite-backed profile store, shared by all the workers on a host
+    """
+
+    def __init__(self, db_path=PROFILE_DB_PATH, ttl=PROFILE_TTL):
+        self.ttl = ttl
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            db_path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS profiles (
+                user_id TEXT PRIMARY KEY,
+                profile TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+            """
+        )
+
+    def get_many(self, user_ids):
+        """
+        Gets the stored profiles of a list of users. Profiles older than
+        the TTL are left out, so they are fetched again.
+
+        Args:
+            - user_ids (list)
+
+        Returns:
+            - profiles (dict): profile dicts keyed by user_id (as str)
+        """
+        profiles = {}
+        user_ids = [str(user_id) for user_id in user_ids]
+        min_fetched_at = time.time() - self.ttl
+        with self.lock:
+            # Stay under SQLite's limit of host parameters per query
+            for i in range(0, len(user_ids), 500):
+                chunk = user_ids[i : i + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                rows = self.connection.execute(
+                    f"""
+                    SELECT user_id, profile FROM profiles
+                    WHERE user_id IN ({placeholders}) AND fetched_at >= ?
+                    """,
+                    [*chunk, min_fetched_at],
+                ).fetchall()
+                for user_id, profile in rows:
+                    profiles[user_id] = json.loads(profile)
+
+        return profiles
+
+    def put_many(self, user_dicts):
+        """
+        Stores freshly fetched profiles. Only the PROFILE_FIELDS of each
+        user dict are kept, so dicts from any stage can be passed.
+
+        Args:
+            - user_dicts (list): list of user or profile dicts
+        """
+        fetched_at = time.time()
+        rows = []
+        for user_dict in user_dicts:
+            profile = {field: user_dict.get(field) for field in PROFILE_FIELDS}
+            profile["user_id"] = str(profile["user_id"])
+            # Stages store verified either as a bool or as "true"/"false"
+            profile["verified"] = profile["verified"] in (True, "true")
+            rows.append(
+                (
+                    profile["user_id"],
+                    json.dumps(profile, default=str),
+                    fetched_at,
+                )
+            )
+
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO profiles VALUES (?, ?, ?)", rows
+            )
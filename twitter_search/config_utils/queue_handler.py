@@ -0,0 +1,358 @@
+"""
+Queue backends used by the SQS workers.
+
+The workers only rely on a small subset of the boto3 SQS client
+(get_queue_url, send_message, send_message_batch, receive_message,
+delete_message and change_message_visibility). LocalQueueClient implements
+that same subset on top of a SQLite file, so the whole crawl pipeline can
+run on a single machine without AWS.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import boto3
+from config_utils.constants import (
+    DEFAULT_VISIBILITY_TIMEOUT,
+    FIFO_DEDUPLICATION_INTERVAL,
+    LOCAL_QUEUE_DB_PATH,
+    QUEUE_BACKEND,
+    REGION_NAME,
+)
+
+
+LOCAL_QUEUE_URL_PREFIX = "local://"
+MAX_MESSAGES_PER_BATCH = 10
+POLL_INTERVAL = 0.5
+
+
+class LocalQueueClient:
+    """
+    SQLite-backed stand-in for the boto3 SQS client.
+
+    Supports visibility timeouts, deletes, batch sends and, for queues
+    whose name ends in '.fifo', message groups: a group is blocked while
+    one of its messages is in flight, and messages within a group are
+    delivered in the order they were sent. A single client can be shared
+    by several threads.
+    """
+
+    def __init__(
+        self,
+        db_path=LOCAL_QUEUE_DB_PATH,
+        visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT,
+    ):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.visibility_timeout = visibility_timeout
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            self.db_path,
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS messages (
+                message_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                queue_name TEXT NOT NULL,
+                body TEXT NOT NULL,
+                group_id TEXT,
+                deduplication_id TEXT,
+                sent_at REAL NOT NULL,
+                visible_at REAL NOT NULL,
+                receipt_handle TEXT,
+                receive_count INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self.connection.execute(
+            """
+            CREATE INDEX IF NOT EXISTS messages_queue_idx
+            ON messages (queue_name, visible_at)
+            """
+        )
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS deduplication (
+                queue_name TEXT NOT NULL,
+                deduplication_id TEXT NOT NULL,
+                sent_at REAL NOT NULL,
+                PRIMARY KEY (queue_name, deduplication_id)
+            )
+            """
+        )
+
+    @staticmethod
+    def _queue_name(queue_url):
+        """
+        Gets the queue name back from a local queue url
+        """
+        return queue_url.removeprefix(LOCAL_QUEUE_URL_PREFIX)
+
+    @staticmethod
+    def _is_fifo(queue_name):
+        return queue_name.endswith(".fifo")
+
+    def get_queue_url(self, QueueName):
+        """
+        Local queues are created on demand, so any name is valid
+        """
+        return {"QueueUrl": f"{LOCAL_QUEUE_URL_PREFIX}{QueueName}"}
+
+    def _insert_message(
+        self, queue_name, body, group_id, deduplication_id, now
+    ):
+        """
+        Inserts a single message. FIFO messages sent again with the same
+        deduplication id within the deduplication interval are dropped,
+        like SQS does.
+
+        Returns:
+            - message_id (str)
+        """
+        if self._is_fifo(queue_name):
+            if group_id is None:
+                raise ValueError(
+                    f"MessageGroupId is required for FIFO queue {queue_name}"
+                )
+            if deduplication_id is None:
+                deduplication_id = hashlib.sha256(body.encode()).hexdigest()
+            self.connection.execute(
+                "DELETE FROM deduplication WHERE sent_at < ?",
+                (now - FIFO_DEDUPLICATION_INTERVAL,),
+            )
+            duplicate = self.connection.execute(
+                """
+                SELECT 1 FROM deduplication
+                WHERE queue_name = ? AND deduplication_id = ?
+                """,
+                (queue_name, deduplication_id),
+            ).fetchone()
+            if duplicate:
+                return deduplication_id
+            self.connection.execute(
+                "INSERT INTO deduplication VALUES (?, ?, ?)",
+                (queue_name, deduplication_id, now),
+            )
+
+        cursor = self.connection.execute(
+            """
+            INSERT INTO messages
+            (queue_name, body, group_id, deduplication_id, sent_at, visible_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (queue_name, body, group_id, deduplication_id, now, now),
+        )
+        return str(cursor.lastrowid)
+
+    def send_message(
+        self,
+        QueueUrl,
+        MessageBody,
+        MessageGroupId=None,
+        MessageDeduplicationId=None,
+    ):
+        queue_name = self._queue_name(QueueUrl)
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                message_id = self._insert_message(
+                    queue_name,
+                    MessageBody,
+                    MessageGroupId,
+                    MessageDeduplicationId,
+                    time.time(),
+                )
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+
+        return {"MessageId": message_id}
+
+    def send_message_batch(self, QueueUrl, Entries):
+        """
+        Sends up to 10 messages in a single transaction
+        """
+        if len(Entries) > MAX_MESSAGES_PER_BATCH:
+            raise ValueError(
+                f"A batch can hold at most {MAX_MESSAGES_PER_BATCH} messages"
+            )
+        queue_name = self._queue_name(QueueUrl)
+        successful = []
+        failed = []
+        now = time.time()
+
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            for entry in Entries:
+                try:
+                    message_id = self._insert_message(
+                        queue_name,
+                        entry["MessageBody"],
+                        entry.get("MessageGroupId"),
+                        entry.get("MessageDeduplicationId"),
+                        now,
+                    )
+                    successful.append(
+                        {"Id": entry["Id"], "MessageId": message_id}
+                    )
+                except ValueError as err:
+                    failed.append(
+                        {
+                            "Id": entry["Id"],
+                            "SenderFault": True,
+                            "Message": str(err),
+                        }
+                    )
+            self.connection.execute("COMMIT")
+
+        return {"Successful": successful, "Failed": failed}
+
+    def _claim_messages(self, queue_name, max_messages, visibility_timeout):
+        """
+        Atomically picks the next visible messages and hides them for
+        the visibility timeout
+        """
+        with self.lock:
+            now = time.time()
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                if self._is_fifo(queue_name):
+                    # Groups with a message in flight are blocked
+                    rows = self.connection.execute(
+                        """
+                        SELECT message_id, body, group_id, receive_count
+                        FROM messages
+                        WHERE queue_name = ? AND visible_at <= ?
+                        AND group_id NOT IN (
+                            SELECT group_id FROM messages
+                            WHERE queue_name = ? AND visible_at > ?
+                        )
+                        ORDER BY message_id
+                        LIMIT ?
+                        """,
+                        (queue_name, now, queue_name, now, max_messages),
+                    ).fetchall()
+                else:
+                    rows = self.connection.execute(
+                        """
+                        SELECT message_id, body, group_id, receive_count
+                        FROM messages
+                        WHERE queue_name = ? AND visible_at <= ?
+                        ORDER BY message_id
+                        LIMIT ?
+                        """,
+                        (queue_name, now, max_messages),
+                    ).fetchall()
+
+                messages = []
+                for message_id, body, group_id, receive_count in rows:
+                    receipt_handle = uuid.uuid4().hex
+                    self.connection.execute(
+                        """
+                        UPDATE messages
+                        SET receipt_handle = ?, visible_at = ?,
+                            receive_count = receive_count + 1
+                        WHERE message_id = ?
+                        """,
+                        (receipt_handle, now + visibility_timeout, message_id),
+                    )
+                    attributes = {
+                        "ApproximateReceiveCount": str(receive_count + 1)
+                    }
+                    if group_id is not None:
+                        attributes["MessageGroupId"] = group_id
+                    messages.append(
+                        {
+                            "MessageId": str(message_id),
+                            "ReceiptHandle": receipt_handle,
+                            "Body": body,
+                            "Attributes": attributes,
+                        }
+                    )
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+
+        return messages
+
+    def receive_message(
+        self,
+        QueueUrl,
+        MaxNumberOfMessages=1,
+        WaitTimeSeconds=0,
+        VisibilityTimeout=None,
+        **kwargs,
+    ):
+        """
+        Long-polls the queue for up to WaitTimeSeconds. As with boto3, the
+        'Messages' key is missing from the response when the queue is empty.
+        """
+        queue_name = self._queue_name(QueueUrl)
+        max_messages = min(MaxNumberOfMessages, MAX_MESSAGES_PER_BATCH)
+        visibility_timeout = (
+            self.visibility_timeout
+            if VisibilityTimeout is None
+            else VisibilityTimeout
+        )
+        deadline = time.time() + WaitTimeSeconds
+
+        while True:
+            messages = self._claim_messages(
+                queue_name, max_messages, visibility_timeout
+            )
+            if messages:
+                return {"Messages": messages}
+            if time.time() >= deadline:
+                return {}
+            time.sleep(POLL_INTERVAL)
+
+    def delete_message(self, QueueUrl, ReceiptHandle):
+        with self.lock:
+            self.connection.execute(
+                "DELETE FROM messages "
+                "WHERE queue_name = ? AND receipt_handle = ?",
+                (self._queue_name(QueueUrl), ReceiptHandle),
+            )
+        return {}
+
+    def change_message_visibility(
+        self, QueueUrl, ReceiptHandle, VisibilityTimeout
+    ):
+        with self.lock:
+            self.connection.execute(
+                """
+                UPDATE messages SET visible_at = ?
+                WHERE queue_name = ? AND receipt_handle = ?
+                """,
+                (
+                    time.time() + VisibilityTimeout,
+                    self._queue_name(QueueUrl),
+                    ReceiptHandle,
+                ),
+            )
+        return {}
+
+
+def create_sqs_client(queue_backend=QUEUE_BACKEND):
+    """
+    Returns a client exposing the SQS API for the chosen backend
+
+    Args:
+        - queue_backend (str): "sqs" for AWS, "local" for the SQLite stand-in
+    """
+    if queue_backend == "sqs":
+        return boto3.client("sqs", region_name=REGION_NAME)
+    elif queue_backend == "local":
+        return LocalQueueClient()
+    else:
+        raise ValueError(f"Unknown queue backend: {queue_backend}")
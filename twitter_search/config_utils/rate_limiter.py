@@ -0,0 +1,112 @@
+"""
+Adaptive pacing for twikit requests.
+
+Every coroutine using the same account in a process shares one limiter,
+which spaces requests out instead of sleeping a fixed time between
+stages. The spacing doubles on every rate limit, when all callers pause
+until the limit resets, and shrinks back after each successful request.
+"""
+
+import asyncio
+import time
+
+import twikit
+from config_utils.constants import (
+    FIFTEEN_MINUTES,
+    RATE_LIMIT_MAX_INTERVAL,
+    RATE_LIMIT_MIN_INTERVAL,
+)
+
+
+_LIMITERS = {}
+
+
+class RateLimiter:
+    """
+    Paces the requests of a single account
+    """
+
+    def __init__(
+        self,
+        min_interval=RATE_LIMIT_MIN_INTERVAL,
+        max_interval=RATE_LIMIT_MAX_INTERVAL,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.next_request_at = 0.0
+        self.paused_until = 0.0
+
+    async def acquire(self):
+        """
+        Waits for the caller's turn to make a request
+        """
+        while True:
+            now = time.monotonic()
+            # Slots are reserved before sleeping, so callers never collide
+            start = max(now, self.next_request_at, self.paused_until)
+            self.next_request_at = start + self.interval
+            await asyncio.sleep(start - now)
+            # A rate limit may have been hit while waiting
+            if time.monotonic() >= self.paused_until:
+                return
+
+    def record_success(self):
+        """
+        Speeds requests back up after a successful one
+        """
+        self.interval = max(self.min_interval, self.interval * 0.9)
+
+    def record_rate_limit(self, reset_at=None):
+        """
+        Slows requests down and pauses every caller until the limit resets
+
+        Args:
+            - reset_at (int): epoch time of the reset, if the API sent it
+        """
+        self.interval = min(self.max_interval, self.interval * 2)
+        wait = reset_at - time.time() if reset_at else FIFTEEN_MINUTES
+        wait = min(max(wait, 0), FIFTEEN_MINUTES)
+        self.paused_until = max(self.paused_until, time.monotonic() + wait)
+        print(
+            f"Rate limited: pausing {round(wait)}s, then one request every {round(self.interval, 1)}s"
+        )
+
+    async def call(self, request, *args, attempts=3, **kwargs):
+        """
+        Runs a twikit request in turn, waiting out up to `attempts` rate
+        limits. Any other error is raised to the caller.
+
+        Returns:
+            - result: the request's result
+
+        Raises:
+            - twikit.errors.TooManyRequests: if every attempt was limited
+        """
+        for attempt in range(1, attempts + 1):
+            await self.acquire()
+            try:
+                result = await request(*args, **kwargs)
+            except twikit.errors.TooManyRequests as err:
+                self.record_rate_limit(getattr(err, "rate_limit_reset", None))
+                if attempt == attempts:
+                    raise
+                continue
+            self.record_success()
+            return result
+
+
+def get_rate_limiter(account_num):
+    """
+    Returns the rate limiter shared by every user of an account
+
+    Args:
+        - account_num (int)
+
+    Returns:
+        - rate_limiter (RateLimiter)
+    """
+    if account_num not in _LIMITERS:
+        _LIMITERS[account_num] = RateLimiter()
+
+    return _LIMITERS[account_num]
@@ -0,0 +1,105 @@
+"""
+Prefetching reader for the classification inputs in S3.
+
+The classifier used to read a user's description and tweets right before
+classifying them, with a new thread pool per user, so S3 latency sat
+between every pair of LLM calls. The reader loads the inputs of the
+next queued users in the background, on pools shared by the whole
+worker, while the current user is being classified.
+"""
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.config import Config
+from config_utils.constants import (
+    NEPTUNE_AWS_REGION,
+    NEPTUNE_S3_BUCKET,
+    S3_PREFETCH_USERS,
+    S3_READER_WORKERS,
+    STORAGE_BACKEND,
+)
+from config_utils.object_store import create_s3_client
+from config_utils.tweet_packs import get_object_text, read_user_tweets
+
+
+class UserInputReader:
+    """
+    Reads users' descriptions and tweets ahead of their classification
+    """
+
+    def __init__(
+        self,
+        bucket=NEPTUNE_S3_BUCKET,
+        storage_backend=STORAGE_BACKEND,
+        region_name=NEPTUNE_AWS_REGION,
+        max_workers=S3_READER_WORKERS,
+        prefetch_users=S3_PREFETCH_USERS,
+    ):
+        self.bucket = bucket
+        self.s3_client = create_s3_client(
+            storage_backend,
+            region_name,
+            Config(max_pool_connections=max_workers * 2),
+        )
+        # Users are loaded on one pool and their legacy tweet objects on
+        # another, so loads never wait for threads of their own pool
+        self.user_pool = ThreadPoolExecutor(
+            max_workers=prefetch_users + 1, thread_name_prefix="s3-user"
+        )
+        self.object_pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="s3-object"
+        )
+        self.lock = threading.Lock()
+        self.loads = OrderedDict()
+
+    def load_user_input(self, user_prefix):
+        """
+        Reads a user's description and tweets
+
+        Args:
+            - user_prefix (str): user's classification input prefix
+
+        Returns:
+            - description_text (str): None if it is not stored
+            - tweets_list (list): list of tweet dicts
+        """
+        description = self.object_pool.submit(
+            get_object_text,
+            self.s3_client,
+            f"{user_prefix}description.txt",
+            self.bucket,
+        )
+        tweets_list = read_user_tweets(
+            self.s3_client, user_prefix, self.bucket, self.object_pool
+        )
+
+        return description.result(), tweets_list
+
+    def prefetch(self, user_prefix):
+        """
+        Starts loading a user's inputs in the background
+        """
+        with self.lock:
+            if user_prefix not in self.loads:
+                self.loads[user_prefix] = self.user_pool.submit(
+                    self.load_user_input, user_prefix
+                )
+
+    def get(self, user_prefix):
+        """
+        Gets a user's inputs, waiting for them if they are still loading
+
+        Returns:
+            - description_text (str): None if it is not stored
+            - tweets_list (list): list of tweet dicts
+
+        Raises:
+            - Any error raised while reading the inputs
+        """
+        self.prefetch(user_prefix)
+        with self.lock:
+            load = self.loads.pop(user_prefix)
+
+        return load.result()
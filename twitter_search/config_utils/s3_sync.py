@@ -0,0 +1,211 @@
+"""
+Resumable bulk uploads to S3.
+
+Bulk upload scripts used to upload everything on every run. The sync
+engine keeps a local manifest with the size and SHA-256 of every object
+it uploaded, skips the ones whose content did not change, and uploads
+the rest on a bounded thread pool. Each upload is recorded as soon as it
+succeeds, so an interrupted run resumes where it stopped and re-running
+a city only costs its delta.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from botocore.config import Config
+from config_utils.constants import (
+    NUM_WORKERS,
+    REGION_NAME,
+    S3_MANIFEST_DB_PATH,
+    STORAGE_BACKEND,
+)
+from config_utils.object_store import create_s3_client
+from tqdm import tqdm
+
+
+def content_digest(content):
+    """
+    Gets the size and SHA-256 of a body or of a local file
+
+    Args:
+        - content (bytes or Path)
+
+    Returns:
+        - size (int)
+        - digest (str)
+    """
+    sha256 = hashlib.sha256()
+    if isinstance(content, bytes):
+        sha256.update(content)
+        return len(content), sha256.hexdigest()
+
+    size = 0
+    with open(content, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            sha256.update(chunk)
+            size += len(chunk)
+
+    return size, sha256.hexdigest()
+
+
+def put_body(s3_client, bucket, key, body):
+    """
+    Puts an in-memory object in S3
+    """
+    s3_client.put_object(Bucket=bucket, Key=key, Body=body)
+
+
+def upload_file(s3_client, bucket, key, path):
+    """
+    Uploads a local file to S3
+    """
+    s3_client.upload_file(Filename=str(path), Bucket=bucket, Key=key)
+
+
+class S3Sync:
+    """
+    Uploads objects to a bucket, skipping the ones already uploaded
+    """
+
+    def __init__(
+        self,
+        bucket,
+        storage_backend=STORAGE_BACKEND,
+        region_name=REGION_NAME,
+        manifest_path=S3_MANIFEST_DB_PATH,
+        max_workers=NUM_WORKERS,
+        force=False,
+    ):
+        self.bucket = bucket
+        # Uploads to the local backend do not count as uploaded to S3
+        self.manifest_bucket = (
+            bucket if storage_backend == "s3" else f"{storage_backend}:{bucket}"
+        )
+        self.max_workers = max_workers
+        # Re-upload everything, e.g. if objects were deleted from S3
+        self.force = force
+        self.s3_client = create_s3_client(
+            storage_backend,
+            region_name,
+            Config(max_pool_connections=max_workers),
+        )
+        manifest_path = Path(manifest_path)
+        manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            manifest_path,
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS uploads (
+                bucket TEXT NOT NULL,
+                key TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                uploaded_at REAL NOT NULL,
+                PRIMARY KEY (bucket, key)
+            )
+            """
+        )
+
+    def is_uploaded(self, key, size, digest):
+        """
+        Whether an object with the same content was already uploaded
+        """
+        if self.force:
+            return False
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT size, sha256 FROM uploads WHERE bucket = ? AND key = ?",
+                (self.manifest_bucket, key),
+            ).fetchone()
+
+        return row == (size, digest)
+
+    def record_upload(self, key, size, digest):
+        """
+        Adds an uploaded object to the manifest
+        """
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO uploads VALUES (?, ?, ?, ?, ?)",
+                (self.manifest_bucket, key, size, digest, time.time()),
+            )
+
+    def sync(self, items, desc="Uploading"):
+        """
+        Uploads the items whose content changed since their last upload
+
+        Args:
+            - items (list): (key, content, upload) tuples, where content
+            is the bytes or local Path identifying the object's content and
+            upload(s3_client, bucket, key, content) writes it
+            - desc (str): progress bar description
+
+        Returns:
+            - counts (dict): uploaded, skipped and failed items
+        """
+        pending = []
+        for key, content, upload in items:
+            size, digest = content_digest(content)
+            if not self.is_uploaded(key, size, digest):
+                pending.append((key, content, upload, size, digest))
+        counts = {
+            "uploaded": 0,
+            "skipped": len(items) - len(pending),
+            "failed": 0,
+        }
+        if not pending:
+            return counts
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {}
+            for key, content, upload, size, digest in pending:
+                future = pool.submit(
+                    upload, self.s3_client, self.bucket, key, content
+                )
+                futures[future] = (key, size, digest)
+            for future in tqdm(
+                as_completed(futures), total=len(futures), desc=desc
+            ):
+                key, size, digest = futures[future]
+                try:
+                    future.result()
+                except Exception as error:
+                    print(f"Upload failed for {key}: {error}")
+                    counts["failed"] += 1
+                    continue
+                self.record_upload(key, size, digest)
+                counts["uploaded"] += 1
+
+        return counts
+
+    def sync_bodies(self, bodies, desc="Uploading"):
+        """
+        Puts in-memory objects
+
+        Args:
+            - bodies (list): (key, body) tuples, with body as bytes
+        """
+        return self.sync(
+            [(key, body, put_body) for key, body in bodies], desc=desc
+        )
+
+    def sync_files(self, files, desc="Uploading"):
+        """
+        Uploads local files
+
+        Args:
+            - files (list): (key, local_path) tuples
+        """
+        return self.sync(
+            [(key, Path(path), upload_file) for key, path in files], desc=desc
+        )
@@ -0,0 +1,125 @@
+"""
+Background S3 writes for the extraction workers.
+
+Descriptions and tweet packs used to be written with a synchronous
+put_object inside each user's processing, adding the S3 latency to every
+user. The writer runs them on a thread pool with a matching connection
+pool instead, so they overlap with the graph writes and queue sends.
+Submitting blocks once S3_WRITER_MAX_PENDING writes are in flight, and
+failed writes are printed and returned by flush(). Batches of objects
+can also be put at once with put_objects().
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import partial
+
+from botocore.config import Config
+from config_utils.constants import (
+    NEPTUNE_AWS_REGION,
+    S3_WRITER_MAX_PENDING,
+    S3_WRITER_WORKERS,
+    STORAGE_BACKEND,
+)
+from config_utils.object_store import create_s3_client, put_objects
+
+
+class S3Writer:
+    """
+    Thread-pooled S3 writer, shared by all the users a worker processes
+    """
+
+    def __init__(
+        self,
+        storage_backend=STORAGE_BACKEND,
+        region_name=NEPTUNE_AWS_REGION,
+        max_workers=S3_WRITER_WORKERS,
+        max_pending=S3_WRITER_MAX_PENDING,
+    ):
+        # One connection per thread, so writes never wait for a connection
+        self.s3_client = create_s3_client(
+            storage_backend,
+            region_name,
+            Config(
+                max_pool_connections=max_workers,
+                retries={"max_attempts": 5, "mode": "adaptive"},
+            ),
+        )
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="s3-writer"
+        )
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.errors = []
+
+    def submit(self, name, write, *args, **kwargs):
+        """
+        Runs write(s3_client, *args, **kwargs) in the background, waiting
+        first if too many writes are in flight
+
+        Args:
+            - name (str): what is written, used in error messages
+            - write (callable)
+
+        Returns:
+            - future (concurrent.futures.Future)
+        """
+        self.slots.acquire()
+        future = self.executor.submit(write, self.s3_client, *args, **kwargs)
+        with self.lock:
+            self.pending.add(future)
+        future.add_done_callback(partial(self._write_done, name))
+
+        return future
+
+    def _write_done(self, name, future):
+        """
+        Frees the write's slot and keeps its error, if any
+        """
+        with self.lock:
+            self.pending.discard(future)
+        self.slots.release()
+        error = future.exception()
+        if error is not None:
+            print(f"S3 write failed for {name}: {error}")
+            with self.lock:
+                self.errors.append((name, error))
+
+    def put_object(self, **kwargs):
+        """
+        Puts an object in the background, with the put_object arguments
+        """
+        return self.submit(
+            kwargs["Key"], lambda s3_client: s3_client.put_object(**kwargs)
+        )
+
+    def put_objects(self, bucket, objects):
+        """
+        Puts several objects at once on the writer's threads, waiting for
+        all of them
+
+        Args:
+            - bucket (str)
+            - objects (dict): bodies keyed by key
+
+        Returns:
+            - errors (dict): exceptions keyed by the keys that failed
+        """
+        return put_objects(self.s3_client, bucket, objects, self.executor)
+
+    def flush(self):
+        """
+        Waits for every submitted write to finish
+
+        Returns:
+            - errors (list): (name, exception) tuples of the writes that
+            failed since the last flush
+        """
+        with self.lock:
+            pending = list(self.pending)
+        wait(pending)
+        with self.lock:
+            errors, self.errors = self.errors, []
+
+        return errors
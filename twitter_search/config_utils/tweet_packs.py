@@ -0,0 +1,220 @@
+"""
+Packed storage of the tweets used to classify users.
+
+Each crawl of a user's tweets is written as a single gzip-compressed JSONL
+object under the user's classification input prefix, and listed in the
+user's tweets_index.json. Reading a user back takes a GET of the index
+and one GET per pack (usually one), instead of a LIST of the prefix and a
+GET per tweet. Tweets written in the legacy one-object-per-tweet layout
+(tweet_{tweet_id}.txt) are folded into a pack when the user's index is
+first written, and read from a LIST of the prefix until then.
+"""
+
+import datetime
+import gzip
+import json
+
+import botocore
+from config_utils.constants import NEPTUNE_S3_BUCKET
+from config_utils.object_store import get_objects, list_keys
+
+
+TWEET_INDEX_NAME = "tweets_index.json"
+# Pack holding a user's legacy tweet objects
+LEGACY_PACK_NAME = "tweets_legacy.jsonl.gz"
+# Fields of the tweet dicts kept in the packs
+TWEET_PACK_FIELDS = ["tweet_id", "tweet_text", "created_at"]
+
+
+def user_input_prefix(location, user_id):
+    """
+    Returns the S3 prefix holding a user's classification input
+    """
+    return f"networks/{location}/classification/{user_id}/input/"
+
+
+def get_object_text(s3_client, key, bucket=NEPTUNE_S3_BUCKET):
+    """
+    Gets the content of a text object
+
+    Args:
+        - s3_client (boto3.client)
+        - key (str)
+        - bucket (str)
+
+    Returns:
+        - string (str): object content, or None if there is no such object
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+    except botocore.exceptions.ClientError as error:
+        if error.response["Error"]["Code"] == "NoSuchKey":
+            return None
+        raise
+
+    return response["Body"].read().decode("utf-8")
+
+
+def put_pack(s3_client, key, tweets_list, bucket=NEPTUNE_S3_BUCKET):
+    """
+    Writes tweets as one gzip-compressed JSONL object
+
+    Returns:
+        - num_tweets (int)
+    """
+    lines = [
+        json.dumps(
+            {field: tweet_dict.get(field) for field in TWEET_PACK_FIELDS},
+            default=str,
+        )
+        for tweet_dict in tweets_list
+    ]
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=gzip.compress("\n".join(lines).encode("utf-8", errors="ignore")),
+        ContentType="application/gzip",
+    )
+
+    return len(lines)
+
+
+def write_tweet_pack(
+    s3_client, location, user_id, tweets_list, bucket=NEPTUNE_S3_BUCKET
+):
+    """
+    Writes a crawl of a user's tweets as one packed object, and adds it
+    to the user's index. The first time the index is written, the user's
+    legacy tweet objects are folded into a pack of their own, so they
+    keep being read.
+
+    The index is updated with a read-modify-write, so a user must only
+    have one writer at a time: the tweets worker handling its message, or
+    upload_s3_tweets when no worker is running.
+
+    Args:
+        - s3_client (boto3.client)
+        - location (str)
+        - user_id (str)
+        - tweets_list (list): list of tweet dicts
+        - bucket (str)
+
+    Returns:
+        - key (str): key of the pack, None if there were no tweets
+    """
+    if not tweets_list:
+        return None
+
+    prefix = user_input_prefix(location, user_id)
+    index_key = f"{prefix}{TWEET_INDEX_NAME}"
+    index_text = get_object_text(s3_client, index_key, bucket)
+    index = json.loads(index_text) if index_text else {"packs": []}
+
+    crawled_at = datetime.datetime.now(datetime.timezone.utc)
+    if not index.get("legacy_folded"):
+        legacy_tweets = read_legacy_tweets(s3_client, prefix, bucket)
+        if legacy_tweets:
+            legacy_key = f"{prefix}{LEGACY_PACK_NAME}"
+            index["packs"].append(
+                {
+                    "key": legacy_key,
+                    "num_tweets": put_pack(
+                        s3_client, legacy_key, legacy_tweets, bucket
+                    ),
+                    "crawled_at": None,
+                }
+            )
+        index["legacy_folded"] = True
+
+    key = f"{prefix}tweets_{crawled_at.strftime('%Y%m%dT%H%M%S%fZ')}.jsonl.gz"
+    num_tweets = put_pack(s3_client, key, tweets_list, bucket)
+
+    # The pack is only read once it is in the index
+    index["packs"].append(
+        {
+            "key": key,
+            "num_tweets": num_tweets,
+            "crawled_at": crawled_at.isoformat(),
+        }
+    )
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=index_key,
+        Body=json.dumps(index).encode("utf-8"),
+        ContentType="application/json",
+    )
+
+    return key
+
+
+def read_legacy_tweets(s3_client, prefix, bucket=NEPTUNE_S3_BUCKET, pool=None):
+    """
+    Reads the tweets of a prefix written one object per tweet
+
+    Args:
+        - s3_client (boto3.client)
+        - prefix (str)
+        - bucket (str)
+        - pool (ThreadPoolExecutor): pool reading the objects, see
+        get_objects
+
+    Returns:
+        - tweets_list (list): list of tweet dicts
+    """
+    tweet_keys = [
+        key
+        for key in list_keys(s3_client, bucket, prefix)
+        if key.endswith(".txt") and key.rsplit("/", 1)[-1].startswith("tweet_")
+    ]
+    bodies = get_objects(s3_client, bucket, tweet_keys, pool)
+
+    return [
+        {
+            "tweet_id": key.rsplit("/", 1)[-1][len("tweet_") : -len(".txt")],
+            "tweet_text": body.decode("utf-8"),
+        }
+        for key, body in bodies.items()
+        if body is not None
+    ]
+
+
+def read_user_tweets(s3_client, prefix, bucket=NEPTUNE_S3_BUCKET, pool=None):
+    """
+    Reads every tweet stored for a user, from its packs and, until they
+    are folded into a pack, from its legacy tweet objects. Tweets found in
+    several crawls are only returned once.
+
+    Args:
+        - s3_client (boto3.client)
+        - prefix (str): user's classification input prefix
+        - bucket (str)
+        - pool (ThreadPoolExecutor): pool reading the packs and legacy
+        tweet objects
+
+    Returns:
+        - tweets_list (list): list of tweet dicts
+    """
+    index_text = get_object_text(
+        s3_client, f"{prefix}{TWEET_INDEX_NAME}", bucket
+    )
+    if index_text is None:
+        return read_legacy_tweets(s3_client, prefix, bucket, pool)
+
+    index = json.loads(index_text)
+    tweets_dict = {}
+    # Indexes written before legacy tweets were folded into packs
+    if not index.get("legacy_folded"):
+        for tweet_dict in read_legacy_tweets(s3_client, prefix, bucket, pool):
+            tweets_dict[str(tweet_dict["tweet_id"])] = tweet_dict
+    pack_keys = [pack["key"] for pack in index["packs"]]
+    # Packs are read concurrently, and merged in crawl order
+    bodies = get_objects(s3_client, bucket, pack_keys, pool)
+    for key in pack_keys:
+        if bodies[key] is None:
+            raise ValueError(f"Tweet pack {key} is in the index but missing")
+        lines = gzip.decompress(bodies[key]).decode("utf-8")
+        for line in lines.splitlines():
+            tweet_dict = json.loads(line)
+            tweets_dict[str(tweet_dict["tweet_id"])] = tweet_dict
+
+    return list(tweets_dict.values())
@@ -0,0 +1,36 @@
+"""
+Long-lived twikit clients shared by the SQS workers.
+
+A twikit client holds an httpx connection pool bound to the event loop it
+first runs on, so workers create their clients once per account and keep
+running every message on that same loop.
+"""
+
+from pathlib import Path
+
+import twikit
+from config_utils.constants import TWIKIT_COOKIES_DICT
+
+
+_CLIENTS = {}
+
+
+def get_twikit_client(account_num):
+    """
+    Returns the twikit client for an account, creating it and loading its
+    cookies on first use
+
+    Args:
+        - account_num (int)
+
+    Returns:
+        - client (twikit.Client)
+    """
+    if account_num not in _CLIENTS:
+        cookies_dir = TWIKIT_COOKIES_DICT[f"account_{account_num}"]
+        cookies_dir = Path(__file__).parents[2] / cookies_dir
+        client = twikit.Client("en-US")
+        client.load_cookies(cookies_dir)
+        _CLIENTS[account_num] = client
+
+    return _CLIENTS[account_num]
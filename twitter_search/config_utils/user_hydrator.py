@@ -0,0 +1,214 @@
+"""
+Batch user hydration.
+
+Root users read from files only come with their ids. Instead of looking
+them up one at a time, the hydrator fetches their profiles in batches of
+HYDRATION_BATCH_SIZE, either with the X API users lookup or with twikit,
+spreading the batches over several accounts. twikit only looks users up
+one by one, so the users of a batch are looked up concurrently, and only
+the ones that hit rate limits are retried. Profiles already in the shared
+profile store are not looked up again.
+"""
+
+import asyncio
+
+import twikit
+from config_utils.constants import (
+    FIFTEEN_MINUTES,
+    HYDRATION_BATCH_SIZE,
+    TWIKIT_LOOKUP_CONCURRENCY,
+    USER_FIELDS,
+)
+from config_utils.profile_store import ProfileStore
+from config_utils.twikit_clients import get_twikit_client
+from config_utils.util import client_creator, convert_to_iso_format
+
+
+def parse_twikit_profile(user):
+    """
+    Parses a twikit.User into a profile dict
+    """
+    return {
+        "user_id": str(user.id),
+        "username": user.screen_name,
+        "description": user.description,
+        "profile_location": user.location,
+        "followers_count": user.followers_count,
+        "following_count": user.following_count,
+        "tweets_count": user.statuses_count,
+        "verified": user.verified,
+        "created_at": convert_to_iso_format(user.created_at),
+    }
+
+
+def parse_x_profile(user):
+    """
+    Parses a tweepy.User into a profile dict
+    """
+    return {
+        "user_id": str(user["id"]),
+        "username": user["username"],
+        "description": user["description"],
+        "profile_location": user["location"],
+        "followers_count": user["public_metrics"].get("followers_count", -99),
+        "following_count": user["public_metrics"].get("following_count", -99),
+        "tweets_count": user["public_metrics"].get("tweet_count", -99),
+        "verified": user["verified"],
+        "created_at": user["created_at"].isoformat(),
+    }
+
+
+async def twikit_get_users(
+    client, user_ids, max_concurrency=TWIKIT_LOOKUP_CONCURRENCY
+):
+    """
+    Looks up several users with twikit, with up to max_concurrency
+    get_user_by_id requests at a time. Users that cannot be looked up
+    (suspended, deleted, bad requests...) are left out one by one.
+
+    Args:
+        - client (twikit.Client)
+        - user_ids (list)
+        - max_concurrency (int)
+
+    Returns:
+        - users (list): list of twikit.User
+        - rate_limited_ids (list): ids that hit rate limits, to retry
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    rate_limited_ids = []
+
+    async def get_user(user_id):
+        async with semaphore:
+            try:
+                return await client.get_user_by_id(str(user_id))
+            except twikit.errors.TooManyRequests:
+                rate_limited_ids.append(user_id)
+            except (
+                twikit.errors.UserNotFound,
+                twikit.errors.UserUnavailable,
+            ):
+                pass
+            except twikit.errors.TwitterException as err:
+                print(f"Unable to look up user {user_id}: {err}")
+            return None
+
+    results = await asyncio.gather(*(get_user(user_id) for user_id in user_ids))
+
+    return [user for user in results if user is not None], rate_limited_ids
+
+
+class UserHydrator:
+    """
+    Looks up user profiles in batches, through the shared profile store
+    """
+
+    def __init__(
+        self,
+        source="twikit",
+        account_nums=None,
+        profile_store=None,
+        batch_size=HYDRATION_BATCH_SIZE,
+    ):
+        if source == "twikit" and not account_nums:
+            raise ValueError("twikit hydration needs at least one account")
+        self.source = source
+        self.account_nums = account_nums
+        self.profile_store = profile_store or ProfileStore()
+        self.batch_size = batch_size
+
+    async def twikit_lookup(self, account_num, batches):
+        """
+        Looks up a share of the batches with one twikit account. Users
+        that keep hitting rate limits are skipped.
+
+        Args:
+            - account_num (int)
+            - batches (list): lists of user ids
+
+        Returns:
+            - profiles (list): list of profile dicts
+        """
+        client = get_twikit_client(account_num)
+        profiles = []
+        for batch in batches:
+            for _ in range(3):
+                users, batch = await twikit_get_users(client, batch)
+                profiles.extend(parse_twikit_profile(user) for user in users)
+                if not batch:
+                    break
+                print(f"Hydration: Too Many Requests (account {account_num})")
+                await asyncio.sleep(FIFTEEN_MINUTES)
+            else:
+                print(f"Hydration: skipping {len(batch)} users")
+
+        return profiles
+
+    def x_lookup(self, batches):
+        """
+        Looks up the batches with the X API users endpoint. The client
+        waits out rate limits itself.
+
+        Args:
+            - batches (list): lists of user ids
+
+        Returns:
+            - profiles (list): list of profile dicts
+        """
+        client = client_creator()
+        profiles = []
+        for batch in batches:
+            response = client.get_users(ids=batch, user_fields=USER_FIELDS)
+            if response.errors:
+                print(f"Hydration: {len(response.errors)} users unavailable")
+            profiles.extend(
+                parse_x_profile(user) for user in response.data or []
+            )
+
+        return profiles
+
+    async def hydrate(self, user_ids):
+        """
+        Gets the profiles of a list of users, looking up only the ones
+        missing from the profile store (or older than its TTL). Users that
+        cannot be found (suspended, deleted...) are left out.
+
+        Args:
+            - user_ids (list)
+
+        Returns:
+            - profiles (dict): profile dicts keyed by user_id (as str)
+        """
+        user_ids = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+        profiles = self.profile_store.get_many(user_ids)
+        missing_ids = [
+            user_id for user_id in user_ids if user_id not in profiles
+        ]
+        if not missing_ids:
+            return profiles
+
+        batches = [
+            missing_ids[i : i + self.batch_size]
+            for i in range(0, len(missing_ids), self.batch_size)
+        ]
+        print(
+            f"Hydrating {len(missing_ids)} users in {len(batches)} lookups "
+            f"({len(profiles)} stored)"
+        )
+
+        if self.source == "X":
+            fetched = await asyncio.to_thread(self.x_lookup, batches)
+        else:
+            # Round-robin the batches so every account runs concurrently
+            num_accounts = len(self.account_nums)
+            results = await asyncio.gather(
+                *(
+                    self.twikit_lookup(account_num, batches[i::num_accounts])
+                    for i, account_num in enumerate(self.account_nums)
+                )
+            )
+            fetched = [profile for result in results for profile in result]
+
+        self.profile_store.put_many(fetched)
+        profiles.update((profile["user_id"], profile) for profile in fetched)
+        return profiles
@@ -7,14 +7,14 @@ import os
 import re
 from datetime import datetime
 
-import boto3
 import botocore
 import tweepy
 
 # Local imports
 from config_utils import config
 from config_utils.cities import ALIAS_DICT
-from config_utils.constants import REGION_NAME
+from config_utils.constants import REGION_NAME, STORAGE_BACKEND
+from config_utils.object_store import create_s3_client
 
 
 LIST_FIELDS = ["id", "name", "description"]
@@ -369,6 +369,46 @@ def check_location(raw_location, target_location):
         return False
 
 
+def location_match_score(raw_location, target_location):
+    """
+    Confidence (0 to 1) that a profile location refers to the target
+    location. Each alternative listed in the profile location (e.g.
+    "Lagos | London") is compared on its own: a part matching exactly
+    scores highest, so "Lagos, Nigeria" counts as Lagos, then whole-phrase
+    matches (so multi-word names like "chiang mai" count), then substring
+    matches. The best score is discounted by the number of alternatives,
+    while the comma-separated region and country parts are not.
+    """
+    if not check_location(raw_location, target_location):
+        return 0.0
+
+    target_locations = [target_location]
+    for alias, value in ALIAS_DICT.items():
+        if value == target_location:
+            target_locations.append(alias)
+
+    places = [
+        place.strip()
+        for place in re.split(r"[|/;&]", raw_location.lower())
+        if place.strip()
+    ]
+
+    def place_score(place):
+        if any(part.strip() in target_locations for part in place.split(",")):
+            return 1.0
+        # Whole-phrase matches are more reliable than substring matches
+        for location in target_locations:
+            if re.search(rf"\b{re.escape(location)}\b", place):
+                return 0.8
+        for location in target_locations:
+            if location in place:
+                return 0.5
+        return 0.0
+
+    score = max((place_score(place) for place in places), default=0.0)
+    return score / max(len(places), 1) ** 0.5
+
+
 # ============================== JSON Creators =========================
 
 
@@ -463,11 +503,13 @@ def convert_to_iso_format(date_string):
 # ========================== AWS Utils ================================
 
 
-def upload_to_s3(local_filename, s3_filename, bucket_name):
+def upload_to_s3(
+    local_filename, s3_filename, bucket_name, storage_backend=STORAGE_BACKEND
+):
     """
     Uploads a given file to S3
     """
-    s3_client = boto3.client("s3", region_name=REGION_NAME)
+    s3_client = create_s3_client(storage_backend, REGION_NAME)
     try:
         s3_client.upload_file(
             Filename=local_filename, Bucket=bucket_name, Key=s3_filename
@@ -1,19 +1,20 @@
 """
 This script will upload the resulting files to AWS
+
+Files already uploaded with the same content are skipped, see S3Sync.
 """
 
 import logging
 import os
 import time
+from argparse import ArgumentParser
 from pathlib import Path
 
-# Global imports
-import boto3
-import botocore
-from tqdm import tqdm
+# Local imports
+from config_utils.constants import STORAGE_BACKEND
+from config_utils.s3_sync import S3Sync
 
 
-# Local imports
 BUCKET_NAME = "global-rct-users"
 REGION_NAME = "us-west-1"
 FOLDERS = [
@@ -31,27 +32,10 @@ logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
-s3_client = boto3.client("s3", region_name=REGION_NAME)
-
-
-def upload_to_s3(local_filename, s3_filename):
-    """
-    Uploads a given file to S3
-    """
-
-    try:
-        s3_client.upload_file(
-            Filename=local_filename, Bucket=BUCKET_NAME, Key=s3_filename
-        )
-
-    except botocore.exceptions.ClientError:
-        logger.info("Upload unsuccessful")
-
-
-def upload_directory(directory_path):
+def upload_directory(directory_path, s3_sync):
     """
-    Uploads all the files in a single
-    directory to S3
+    Uploads all the new or changed files in a
+    single directory to S3
     """
     # Path of interest is from element 10 onwards
     PATH_INDEX = 10
@@ -64,18 +48,45 @@ def upload_directory(directory_path):
     ]
 
     # Should either be raw_data or clean_data
-    for data_path in tqdm(data_paths):
+    files = []
+    for data_path in data_paths:
         split_path = data_path.split("/")
         s3_path = "/".join(split_path[PATH_INDEX:])
-        upload_to_s3(data_path, s3_path)
+        files.append((s3_path, data_path))
+
+    counts = s3_sync.sync_files(files)
+    logger.info(f"Uploads: {counts}")
+    if counts["failed"]:
+        logger.info("Upload unsuccessful for some files, run again to retry")
 
 
 if __name__ == "__main__":
+    parser = ArgumentParser(description="Upload the data folders to S3")
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Upload everything again, ignoring the upload manifest",
+    )
+    parser.add_argument(
+        "--storage_backend",
+        type=str,
+        choices=["s3", "local"],
+        default=STORAGE_BACKEND,
+        help="Upload to AWS S3 or to the local object store",
+    )
+    args = parser.parse_args()
+
+    s3_sync = S3Sync(
+        BUCKET_NAME,
+        args.storage_backend,
+        region_name=REGION_NAME,
+        force=args.force,
+    )
     directories = [
         Path(__file__).parent.parent.parent / f"data/{folder}"
         for folder in FOLDERS
     ]
     for directory in directories:
         print(f"Uploading {directory} directory...")
-        upload_directory(directory)
+        upload_directory(directory, s3_sync)
         time.sleep(2)
@@ -0,0 +1,443 @@
+"""
+Offline classification with provider batch jobs.
+
+Backfills do not need answers right away, so instead of one synchronous
+call per batch of users, every request of a job is written to a JSONL
+file in the provider's batch format, uploaded and submitted at once, and
+polled until the provider completes it. Batch endpoints cost half as
+much and do not count against the synchronous rate limits.
+
+Each job keeps its files under BATCH_JOBS_PATH/<job_name>:
+    - requests.jsonl: the batch input file
+    - job.json: the users of each request, and the submitted batch
+    - results.jsonl, errors.jsonl: the batch output files
+    - classifications.json: category keyed by user_id
+
+Users with a cached classification are not sent again, and the new
+classifications are added to the classifier's cache.
+
+A local stub reads and writes the same files, so jobs can be run
+offline, end to end.
+"""
+
+import asyncio
+import io
+import json
+import re
+import time
+import uuid
+from pathlib import Path
+from types import SimpleNamespace
+
+from llm_classification.constants import (
+    BATCH_BACKEND,
+    BATCH_COMPLETION_WINDOW,
+    BATCH_ENDPOINT,
+    BATCH_JOB_SIZE,
+    BATCH_JOBS_PATH,
+    BATCH_POLL_INTERVAL,
+    LOCAL_BATCH_DELAY,
+    LOCAL_BATCH_PATH,
+)
+from llm_classification.prompts import parse_batch_response
+
+
+BATCH_FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+class LocalBatchFiles:
+    """
+    Files endpoint of the local batch stub
+    """
+
+    def __init__(self, root):
+        self.root = Path(root) / "files"
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def create(self, file, purpose="batch"):
+        file_id = f"file-{uuid.uuid4().hex}"
+        content = file.read()
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        (self.root / file_id).write_bytes(content)
+
+        return SimpleNamespace(id=file_id, purpose=purpose, bytes=len(content))
+
+    def content(self, file_id):
+        return SimpleNamespace(
+            text=(self.root / file_id).read_text(encoding="utf-8")
+        )
+
+
+class LocalBatches:
+    """
+    Batches endpoint of the local batch stub. A batch completes on the
+    first status check after `delay` seconds, and every user in a
+    request is classified as "other".
+    """
+
+    def __init__(self, root, files, delay=LOCAL_BATCH_DELAY):
+        self.root = Path(root) / "batches"
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.files = files
+        self.delay = delay
+
+    def _save(self, batch):
+        path = self.root / f"{batch['id']}.json"
+        path.write_text(json.dumps(batch), encoding="utf-8")
+
+    @staticmethod
+    def stub_response(custom_id, body):
+        """
+        Builds the output line of a request, in the provider's format
+        """
+        user_content = body["messages"][-1]["content"]
+        user_ids = re.findall(r"^User ID: (\S+)$", user_content, re.MULTILINE)
+        content = json.dumps(
+            {
+                "classifications": [
+                    {"user_id": user_id, "category": "other"}
+                    for user_id in user_ids
+                ]
+            }
+        )
+
+        return {
+            "id": f"batch_req_{uuid.uuid4().hex}",
+            "custom_id": custom_id,
+            "response": {
+                "status_code": 200,
+                "request_id": uuid.uuid4().hex,
+                "body": {
+                    "object": "chat.completion",
+                    "model": body["model"],
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {
+                                "role": "assistant",
+                                "content": content,
+                            },
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {"total_tokens": 0},
+                },
+            },
+            "error": None,
+        }
+
+    def _complete(self, batch):
+        input_text = self.files.content(batch["input_file_id"]).text
+        lines = []
+        for line in input_text.splitlines():
+            if line.strip():
+                request = json.loads(line)
+                lines.append(
+                    json.dumps(
+                        self.stub_response(
+                            request["custom_id"], request["body"]
+                        )
+                    )
+                )
+
+        output = self.files.create(
+            io.BytesIO(("\n".join(lines) + "\n").encode("utf-8"))
+        )
+        batch.update(
+            status="completed",
+            output_file_id=output.id,
+            completed_at=time.time(),
+            request_counts={
+                "total": len(lines),
+                "completed": len(lines),
+                "failed": 0,
+            },
+        )
+
+    def create(
+        self,
+        input_file_id,
+        endpoint,
+        completion_window,
+        metadata=None,
+    ):
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex}",
+            "endpoint": endpoint,
+            "input_file_id": input_file_id,
+            "completion_window": completion_window,
+            "metadata": metadata,
+            "status": "in_progress",
+            "created_at": time.time(),
+            "output_file_id": None,
+            "error_file_id": None,
+        }
+        self._save(batch)
+
+        return self.retrieve(batch["id"])
+
+    def retrieve(self, batch_id):
+        path = self.root / f"{batch_id}.json"
+        batch = json.loads(path.read_text(encoding="utf-8"))
+        if (
+            batch["status"] not in BATCH_FINAL_STATUSES
+            and time.time() >= batch["created_at"] + self.delay
+        ):
+            self._complete(batch)
+            self._save(batch)
+
+        return SimpleNamespace(**batch)
+
+
+class LocalBatchClient:
+    """
+    Stub of the OpenAI client's files and batches endpoints, backed by a
+    directory
+    """
+
+    def __init__(self, root=LOCAL_BATCH_PATH, delay=LOCAL_BATCH_DELAY):
+        self.files = LocalBatchFiles(root)
+        self.batches = LocalBatches(root, self.files, delay)
+
+
+def create_batch_client(batch_backend=BATCH_BACKEND):
+    """
+    Returns a client exposing the OpenAI files and batches endpoints for
+    the chosen backend
+
+    Args:
+        - batch_backend (str): "openai" for the Batch API, "local" for the
+        local stub
+    """
+    if batch_backend == "openai":
+        # Imported here, so the local stub runs without the OpenAI client
+        from llm_classification.openai_classifier import client
+
+        return client
+    elif batch_backend == "local":
+        return LocalBatchClient()
+    else:
+        raise ValueError(f"Unknown batch backend: {batch_backend}")
+
+
+class ClassificationBatchJob:
+    """
+    A batch job classifying many users, resumable from its directory
+
+    Args:
+        - batch_client: OpenAI client or LocalBatchClient
+        - job_name (str): directory of the job under jobs_path
+    """
+
+    def __init__(self, batch_client, job_name, jobs_path=BATCH_JOBS_PATH):
+        self.batch_client = batch_client
+        self.job_name = job_name
+        self.job_dir = Path(jobs_path) / job_name
+        self.job_dir.mkdir(parents=True, exist_ok=True)
+        self.state_path = self.job_dir / "job.json"
+        if self.state_path.exists():
+            self.state = json.loads(self.state_path.read_text(encoding="utf-8"))
+        else:
+            self.state = {"requests": {}, "batch": None}
+
+    def save_state(self):
+        self.state_path.write_text(json.dumps(self.state), encoding="utf-8")
+
+    @property
+    def batch_in_progress(self):
+        """
+        Whether a batch was submitted and has not reached a final status
+        """
+        batch = self.state.get("batch")
+        return batch is not None and batch["status"] not in BATCH_FINAL_STATUSES
+
+    def check_not_in_progress(self):
+        """
+        Refuses to overwrite the job of a batch still in progress, which
+        would be paid for again once resubmitted
+        """
+        if self.batch_in_progress:
+            batch = self.state["batch"]
+            raise ValueError(
+                f"{self.job_name}: batch {batch['id']} is {batch['status']}, poll it first"
+            )
+
+    def prepare(self, users, classifier, batch_size=BATCH_JOB_SIZE):
+        """
+        Writes the batch input file, with batch_size users per request.
+        Users with a cached classification keep it instead.
+
+        Args:
+            - users (iterable): dicts with user_id, description and tweets
+            - classifier (GPTClassifier): builds the request bodies, and
+            holds the response cache
+            - batch_size (int)
+
+        Returns:
+            - num_requests (int)
+
+        Raises:
+            - ValueError: if the job's batch is still in progress
+        """
+        self.check_not_in_progress()
+        requests = {}
+        cache_keys = {}
+        cached = {}
+        with open(self.job_dir / "requests.jsonl", "w", encoding="utf-8") as f:
+
+            def write_request(batch):
+                custom_id = f"request-{len(requests)}"
+                request = {
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": classifier.build_batch_request(batch),
+                }
+                f.write(json.dumps(request) + "\n")
+                requests[custom_id] = [user["user_id"] for user in batch]
+
+            batch = []
+            for user in users:
+                user_tweets = "\n".join(user["tweets"])
+                category = classifier.get_cached(
+                    user["description"],
+                    user_tweets,
+                    mode="batch",
+                )
+                if category is not None:
+                    cached[user["user_id"]] = category
+                    continue
+                cache_keys[user["user_id"]] = classifier.cache_key(
+                    user["description"],
+                    user_tweets,
+                    mode="batch",
+                )
+                batch.append(user)
+                if len(batch) == batch_size:
+                    write_request(batch)
+                    batch = []
+            if batch:
+                write_request(batch)
+
+        self.state = {
+            "requests": requests,
+            "cache_keys": cache_keys,
+            "cached": cached,
+            "batch": None,
+        }
+        self.save_state()
+        num_users = sum(len(user_ids) for user_ids in requests.values())
+        print(
+            f"{self.job_name}: {num_users} users in {len(requests)} requests, {len(cached)} cached"
+        )
+
+        return len(requests)
+
+    def submit(self):
+        """
+        Uploads the input file and creates the batch
+
+        Raises:
+            - ValueError: if the job's batch is still in progress
+        """
+        self.check_not_in_progress()
+        with open(self.job_dir / "requests.jsonl", "rb") as f:
+            input_file = self.batch_client.files.create(file=f, purpose="batch")
+        batch = self.batch_client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=BATCH_COMPLETION_WINDOW,
+            metadata={"job_name": self.job_name},
+        )
+        self.state["batch"] = {"id": batch.id, "status": batch.status}
+        self.save_state()
+        print(f"{self.job_name}: submitted batch {batch.id}")
+
+    async def poll(self, poll_interval=BATCH_POLL_INTERVAL):
+        """
+        Waits until the batch is done, then downloads its output files
+
+        Returns:
+            - status (str): final status of the batch
+        """
+        batch_id = self.state["batch"]["id"]
+        while True:
+            batch = await asyncio.to_thread(
+                self.batch_client.batches.retrieve, batch_id
+            )
+            self.state["batch"]["status"] = batch.status
+            self.save_state()
+            if batch.status in BATCH_FINAL_STATUSES:
+                break
+            print(f"{self.job_name}: batch {batch_id} is {batch.status}")
+            await asyncio.sleep(poll_interval)
+
+        for file_id, name in [
+            (batch.output_file_id, "results.jsonl"),
+            (getattr(batch, "error_file_id", None), "errors.jsonl"),
+        ]:
+            if file_id:
+                content = await asyncio.to_thread(
+                    self.batch_client.files.content, file_id
+                )
+                (self.job_dir / name).write_text(content.text, encoding="utf-8")
+        print(f"{self.job_name}: batch {batch_id} is {batch.status}")
+
+        return batch.status
+
+    def read_results(self, classifier=None):
+        """
+        Validates the output file against the users of each request, and
+        stores the classifications in the job directory, along with the
+        cached ones
+
+        Args:
+            - classifier (GPTClassifier): its cache gets the new
+            classifications, if any
+
+        Returns:
+            - classifications (dict): category keyed by user_id
+            - missing (list): user_ids without a valid classification, to
+            be sent in a later job
+        """
+        classifications = {}
+        results_path = self.job_dir / "results.jsonl"
+        if results_path.exists():
+            with open(results_path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    result = json.loads(line)
+                    user_ids = self.state["requests"].get(result["custom_id"])
+                    response = result.get("response") or {}
+                    if user_ids is None or response.get("status_code") != 200:
+                        continue
+                    content = response["body"]["choices"][0]["message"][
+                        "content"
+                    ]
+                    classifications.update(
+                        parse_batch_response(content, user_ids)
+                    )
+
+        if classifier is not None and classifier.cache is not None:
+            for user_id, category in classifications.items():
+                cache_key = self.state.get("cache_keys", {}).get(user_id)
+                if cache_key:
+                    classifier.cache.put(cache_key, classifier.model, category)
+        classifications = {**self.state.get("cached", {}), **classifications}
+
+        missing = [
+            user_id
+            for user_ids in self.state["requests"].values()
+            for user_id in user_ids
+            if user_id not in classifications
+        ]
+        (self.job_dir / "classifications.json").write_text(
+            json.dumps(classifications), encoding="utf-8"
+        )
+        print(
+            f"{self.job_name}: {len(classifications)} users classified, {len(missing)} missing"
+        )
+
+        return classifications, missing
@@ -0,0 +1,285 @@
+"""
+Concurrent classification of users with several LLM providers.
+
+Each user is sent to every provider at the same time, and many users are
+classified at once. Requests go through a limiter per provider, which
+keeps them under the provider's requests and tokens per minute, so the
+throughput is bounded by the quotas rather than by the latency of each
+call. Failed requests are retried with exponential backoff.
+
+In batched mode several users share one request, and the users missing
+from a response are sent again. Users with a cached response skip the
+limiter and the provider altogether.
+"""
+
+import asyncio
+import random
+import time
+
+from llm_classification.constants import (
+    BACKOFF_BASE,
+    BACKOFF_MAX,
+    BATCH_MAX_ROUNDS,
+    BATCH_RESPONSE_TOKENS,
+    MAX_ATTEMPTS,
+    MAX_USERS_IN_FLIGHT,
+    RESPONSE_TOKENS,
+)
+from llm_classification.prompts import parse_batch_response
+
+
+class ProviderLimiter:
+    """
+    Requests and tokens per minute budget of a provider, refilled
+    continuously. Callers are served in order.
+    """
+
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = float(rpm)
+        self.tokens = float(tpm)
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+        self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+
+    async def acquire(self, tokens):
+        """
+        Waits until a request of `tokens` tokens fits in the budget
+
+        Args:
+            - tokens (int): estimated tokens of the request
+        """
+        tokens = min(tokens, self.tpm)
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.requests >= 1 and self.tokens >= tokens:
+                    self.requests -= 1
+                    self.tokens -= tokens
+                    return
+                wait = max(
+                    (1 - self.requests) * 60 / self.rpm,
+                    (tokens - self.tokens) * 60 / self.tpm,
+                )
+                await asyncio.sleep(wait)
+
+    def record_usage(self, estimated_tokens, used_tokens):
+        """
+        Corrects the budget with the tokens a request actually used
+        """
+        self.tokens -= used_tokens - estimated_tokens
+
+
+class ClassificationEngine:
+    """
+    Classifies users with every provider, under their limits
+
+    Args:
+        - classifiers (dict): GeminiClassifier or GPTClassifier keyed by
+        provider name
+        - limiters (dict): ProviderLimiter keyed by provider name
+        - max_rounds (int): requests per batch, including the re-issues
+        for missing users
+    """
+
+    def __init__(
+        self,
+        classifiers,
+        limiters,
+        max_users=MAX_USERS_IN_FLIGHT,
+        max_attempts=MAX_ATTEMPTS,
+        max_rounds=BATCH_MAX_ROUNDS,
+    ):
+        self.classifiers = classifiers
+        self.limiters = limiters
+        self.max_attempts = max_attempts
+        self.max_rounds = max_rounds
+        self.users_in_flight = asyncio.Semaphore(max_users)
+
+    async def request(self, provider, estimated_tokens, classify, *args):
+        """
+        Sends a request to a provider under its limiter, retrying with
+        backoff
+
+        Args:
+            - provider (str)
+            - estimated_tokens (int): tokens of the prompt and response
+            - classify (coroutine function): returns the content and the
+            tokens used
+
+        Returns:
+            - content (str): the provider's response
+
+        Raises:
+            - The last error, if every attempt failed
+        """
+        limiter = self.limiters[provider]
+
+        for attempt in range(1, self.max_attempts + 1):
+            await limiter.acquire(estimated_tokens)
+            try:
+                content, used_tokens = await classify(*args)
+            except Exception as error:
+                if attempt == self.max_attempts:
+                    raise
+                # Full jitter, so retries of many users do not line up
+                delay = random.uniform(
+                    0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+                )
+                print(
+                    f"{provider}: attempt {attempt} failed ({error}), retrying in {round(delay, 1)}s"
+                )
+                await asyncio.sleep(delay)
+                continue
+            if used_tokens:
+                limiter.record_usage(estimated_tokens, used_tokens)
+            return content
+
+    async def classify_with(self, provider, user_description, user_tweets):
+        """
+        Classifies a user with one provider
+
+        Returns:
+            - content (str): the provider's response
+        """
+        classifier = self.classifiers[provider]
+        cached = classifier.get_cached(user_description, user_tweets)
+        if cached is not None:
+            return cached
+        estimated_tokens = (
+            classifier.count_prompt_tokens(user_description, user_tweets)
+            + RESPONSE_TOKENS
+        )
+
+        content = await self.request(
+            provider,
+            estimated_tokens,
+            classifier.classify,
+            user_description,
+            user_tweets,
+        )
+        classifier.put_cached(user_description, user_tweets, content)
+
+        return content
+
+    async def classify_batch_with(self, provider, users):
+        """
+        Classifies a batch of users with one provider. Users missing from
+        a response, or with an invalid category, are sent again in a
+        smaller batch.
+
+        Args:
+            - provider (str)
+            - users (list): dicts with user_id, description and tweets
+
+        Returns:
+            - classifications (dict): category keyed by user_id, without
+            the users that could not be classified
+        """
+        classifier = self.classifiers[provider]
+        classifications = {}
+        for user in users:
+            category = classifier.get_cached(
+                user["description"],
+                "\n".join(user["tweets"]),
+                mode="batch",
+            )
+            if category is not None:
+                classifications[user["user_id"]] = category
+        pending = [
+            user for user in users if user["user_id"] not in classifications
+        ]
+
+        for round_number in range(1, self.max_rounds + 1):
+            if not pending:
+                break
+            estimated_tokens = classifier.count_batch_tokens(
+                pending
+            ) + BATCH_RESPONSE_TOKENS * len(pending)
+            content = await self.request(
+                provider, estimated_tokens, classifier.classify_batch, pending
+            )
+            round_classifications = parse_batch_response(
+                content, [user["user_id"] for user in pending]
+            )
+            for user in pending:
+                category = round_classifications.get(user["user_id"])
+                if category is not None:
+                    classifier.put_cached(
+                        user["description"],
+                        "\n".join(user["tweets"]),
+                        category,
+                        mode="batch",
+                    )
+            classifications.update(round_classifications)
+            pending = [
+                user
+                for user in pending
+                if user["user_id"] not in classifications
+            ]
+            if pending:
+                print(
+                    f"{provider}: {len(pending)} users missing from round {round_number}"
+                )
+
+        return classifications
+
+    async def classify_batch(self, users):
+        """
+        Classifies a batch of users with every provider at the same time
+
+        Returns:
+            - results (dict): classifications keyed by provider, each of
+            them a category keyed by user_id
+        """
+        providers = list(self.classifiers)
+        responses = await asyncio.gather(
+            *(
+                self.classify_batch_with(provider, users)
+                for provider in providers
+            ),
+            return_exceptions=True,
+        )
+
+        results = {}
+        for provider, response in zip(providers, responses):
+            if isinstance(response, Exception):
+                print(f"{provider}: batch classification failed - {response}")
+                response = {}
+            results[provider] = response
+
+        return results
+
+    async def classify_user(self, user_description, user_tweets):
+        """
+        Classifies a user with every provider at the same time
+
+        Returns:
+            - results (dict): responses keyed by provider, None for the
+            providers that failed
+        """
+        async with self.users_in_flight:
+            providers = list(self.classifiers)
+            responses = await asyncio.gather(
+                *(
+                    self.classify_with(provider, user_description, user_tweets)
+                    for provider in providers
+                ),
+                return_exceptions=True,
+            )
+
+        results = {}
+        for provider, response in zip(providers, responses):
+            if isinstance(response, Exception):
+                print(f"{provider}: classification failed - {response}")
+                response = None
+            results[provider] = response
+
+        return results
@@ -1,3 +1,8 @@
+from pathlib import Path
+
+
+project_root = Path(__file__).resolve().parents[2]
+
 GEMINI_PROMPT = """
 You are an experienced analyst with the task of determining if a given twitter
 user belongs to the provided categories. We will provide the user's
@@ -87,9 +92,97 @@ Category = {'category': str}
 Return: category
 """
 
+# Batched prompts, with several users per request. The instructions are
+# sent once per batch, and the response must follow a JSON schema.
+CATEGORIES = [
+    "media",
+    "organizations",
+    "non-profits",
+    "policymaker",
+    "politicians",
+    "environment",
+    "researchers",
+    "healthcare",
+    "other",
+]
+BATCH_INSTRUCTIONS = (
+    OPENAI_INSTRUCTIONS
+    + """
+You will receive several users at once, each one introduced by its user ID.
+Classify every user on their own, and return exactly one classification for
+each user ID, using the IDs exactly as they were given.
+"""
+)
+BATCH_PROMPT = """
+Classify the following users:
+
+users_block
+"""
+
 
 OPENAI_MODEL = "gpt-4o-mini"
 GEMINI_MODEL = "gemini-2.0-flash"
 
+# Requests and tokens per minute allowed by each provider (Tier 1 quotas)
+OPENAI_RPM = 500
+OPENAI_TPM = 200000
+GEMINI_RPM = 2000
+GEMINI_TPM = 4000000
+# Tokens reserved for each response, on top of the prompt
+RESPONSE_TOKENS = 300
+# Users classified at the same time
+MAX_USERS_IN_FLIGHT = 16
+# Tokens of each user's tweets in single-user and batched prompts. Tweets
+# are ranked by informativeness and recency, and packed up to the budget.
+TWEET_TOKEN_BUDGET = 1500
+BATCH_TWEET_TOKEN_BUDGET = 300
+# Days after which a tweet's recency weight is halved
+TWEET_RECENCY_HALF_LIFE = 90
+# Local tokenizer used to count tokens, if tiktoken is installed
+TOKENIZER_ENCODING = "o200k_base"
+# Users per batched prompt, 1 keeps the single-user prompts
+BATCH_SIZE = 1
+# Tokens reserved for each user's classification in a batched response
+BATCH_RESPONSE_TOKENS = 20
+# Requests per batch, re-issuing the users missing from the previous response
+BATCH_MAX_ROUNDS = 3
+
+# Offline batch jobs, either "openai" (Batch API) or "local" (a stub that
+# answers from files, for offline runs and tests)
+BATCH_BACKEND = "openai"
+# Users per request in batch jobs
+BATCH_JOB_SIZE = 10
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+# Seconds between status checks of a submitted job
+BATCH_POLL_INTERVAL = 60
+# Requests files, job state and results of each job
+BATCH_JOBS_PATH = project_root / "data" / "llm_batches"
+LOCAL_BATCH_PATH = project_root / "data" / "local_batches"
+# Seconds the local stub takes to complete a job
+LOCAL_BATCH_DELAY = 0
+
+# Versions of the prompts, part of the response cache keys along with a
+# hash of the prompts' text. Editing a prompt invalidates its cached
+# responses; bump its version to invalidate them without an edit, e.g. after
+# a change in how the responses are parsed. This invalidates them for every
+# user, even if only one category changed.
+GEMINI_PROMPT_VERSION = 1
+OPENAI_PROMPT_VERSION = 1
+BATCH_PROMPT_VERSION = 1
+# Responses cached on disk, evicted after LLM_CACHE_MAX_AGE seconds or, least
+# recently used first, once they add up to LLM_CACHE_MAX_BYTES
+LLM_CACHE_DB_PATH = project_root / "data" / "local_queues" / "llm_cache.db"
+LLM_CACHE_MAX_AGE = 7776000
+LLM_CACHE_MAX_BYTES = 500000000
+# Lookups between hit rate reports, and writes between evictions
+LLM_CACHE_REPORT_EVERY = 100
+LLM_CACHE_EVICT_EVERY = 1000
+# Attempts per request, waiting up to BACKOFF_BASE * 2^n seconds (at most
+# BACKOFF_MAX) between them
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 2
+BACKOFF_MAX = 60
+
 NEPTUNE_S3_BUCKET = "global-rct-network-data"
 NEPTUNE_AWS_REGION = "us-east-2"
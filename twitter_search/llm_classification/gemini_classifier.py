@@ -3,19 +3,63 @@ Code with generative model
 """
 
 import google.generativeai as genai
-from llm_classification.constants import GEMINI_MODEL, GEMINI_PROMPT
+from llm_classification.constants import (
+    BATCH_INSTRUCTIONS,
+    BATCH_PROMPT,
+    BATCH_PROMPT_VERSION,
+    GEMINI_MODEL,
+    GEMINI_PROMPT,
+    GEMINI_PROMPT_VERSION,
+)
 
 # Local imports
 from llm_classification.keys import GEMINI_KEY
+from llm_classification.prompts import (
+    batch_response_schema,
+    build_batch_prompt,
+    count_tokens,
+    fill_prompt,
+)
+from llm_classification.response_cache import CachedClassifier, hash_prompt
 
 
 # Parameters
-class GeminiClassifier:
-    def __init__(self, model=GEMINI_MODEL):
+class GeminiClassifier(CachedClassifier):
+    def __init__(self, model=GEMINI_MODEL, cache=None):
         genai.configure(api_key=GEMINI_KEY)
         self.model = model
+        # Built once, and reused for every user
+        self.generative_model = genai.GenerativeModel(self.model)
+        # Batched prompts carry the instructions once, and must answer
+        # with the batch schema
+        self.batch_model = genai.GenerativeModel(
+            self.model,
+            system_instruction=BATCH_INSTRUCTIONS,
+            generation_config=genai.GenerationConfig(
+                response_mime_type="application/json",
+                response_schema=batch_response_schema(strict=False),
+            ),
+        )
         # Prompts
-        self.user_content = GEMINI_PROMPT
+        self.prompt_template = GEMINI_PROMPT
+        self.prompt_version = GEMINI_PROMPT_VERSION
+        self.batch_prompt_version = BATCH_PROMPT_VERSION
+        self.prompt_hash = hash_prompt(self.prompt_template)
+        self.batch_prompt_hash = hash_prompt(BATCH_INSTRUCTIONS, BATCH_PROMPT)
+        # ResponseCache consulted before sending prompts, if any
+        self.cache = cache
+
+    def build_prompt(self, user_description, user_tweets):
+        """
+        Builds the prompt of a user
+        """
+        return fill_prompt(self.prompt_template, user_description, user_tweets)
+
+    def count_prompt_tokens(self, user_description, user_tweets):
+        """
+        Estimates the tokens of a user's prompt
+        """
+        return count_tokens(self.build_prompt(user_description, user_tweets))
 
     def send_prompt(
         self,
@@ -25,16 +69,56 @@ class GeminiClassifier:
         """
         Send prompt to Gemini and parse response to DataFrame
         """
-        self.user_content = self.user_content.replace(
-            "user_description", user_description
+        self.user_content = self.build_prompt(user_description, user_tweets)
+        cached = self.get_cached(user_description, user_tweets)
+        if cached is not None:
+            self.content = cached
+            return
+        print(f"Sending prompt to model {self.model}...")
+        response = self.generative_model.generate_content(self.user_content)
+        self.content = response.text
+        self.put_cached(user_description, user_tweets, self.content)
+
+    async def classify(self, user_description, user_tweets):
+        """
+        Sends a user's prompt without blocking the event loop. Errors are
+        raised, so the caller can retry.
+
+        Returns:
+            - content (str): response text
+            - total_tokens (int): tokens used, None if not reported
+        """
+        prompt = self.build_prompt(user_description, user_tweets)
+        response = await self.generative_model.generate_content_async(prompt)
+        usage = getattr(response, "usage_metadata", None)
+
+        return response.text, getattr(usage, "total_token_count", None)
+
+    def count_batch_tokens(self, users):
+        """
+        Estimates the tokens of a batch's prompt and instructions
+        """
+        return count_tokens(BATCH_INSTRUCTIONS) + count_tokens(
+            build_batch_prompt(users)
         )
-        self.user_content = self.user_content.replace(
-            "user_tweets", user_tweets
+
+    async def classify_batch(self, users):
+        """
+        Sends a batch of users in one request
+
+        Args:
+            - users (list): dicts with user_id, description and tweets
+
+        Returns:
+            - content (str): JSON response
+            - total_tokens (int): tokens used, None if not reported
+        """
+        response = await self.batch_model.generate_content_async(
+            build_batch_prompt(users)
         )
-        print(f"Sending prompt to model {GEMINI_MODEL}...")
-        model = genai.GenerativeModel(self.model)
-        response = model.generate_content(self.user_content)
-        self.content = response.text
+        usage = getattr(response, "usage_metadata", None)
+
+        return response.text, getattr(usage, "total_token_count", None)
 
     def run(self, save=True):
         """
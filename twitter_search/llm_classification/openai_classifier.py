@@ -3,45 +3,80 @@ Code with GPT Agent class
 """
 
 from llm_classification.constants import (
+    BATCH_INSTRUCTIONS,
+    BATCH_PROMPT,
+    BATCH_PROMPT_VERSION,
     OPENAI_INSTRUCTIONS,
     OPENAI_MODEL,
     OPENAI_PROMPT,
+    OPENAI_PROMPT_VERSION,
 )
 
 # Local
 from llm_classification.keys import OPENAI_KEY
-from openai import OpenAI
+from llm_classification.prompts import (
+    batch_response_schema,
+    build_batch_prompt,
+    count_tokens,
+    fill_prompt,
+)
+from llm_classification.response_cache import CachedClassifier, hash_prompt
+from openai import AsyncOpenAI, OpenAI
 
 
 # Parameters
 client = OpenAI(api_key=OPENAI_KEY)
+# Retries are handled by the classification engine
+async_client = AsyncOpenAI(api_key=OPENAI_KEY, max_retries=0)
 
 
-class GPTClassifier:
-    def __init__(self, model=OPENAI_MODEL):
+class GPTClassifier(CachedClassifier):
+    def __init__(self, model=OPENAI_MODEL, cache=None):
         self.model = model
         # Read files and get ticker mapping
         # Prompts
         self.system_content = OPENAI_INSTRUCTIONS
-        self.user_content = OPENAI_PROMPT
+        self.prompt_template = OPENAI_PROMPT
+        self.prompt_version = OPENAI_PROMPT_VERSION
+        self.batch_prompt_version = BATCH_PROMPT_VERSION
+        self.prompt_hash = hash_prompt(
+            self.system_content, self.prompt_template
+        )
+        self.batch_prompt_hash = hash_prompt(BATCH_INSTRUCTIONS, BATCH_PROMPT)
+        # ResponseCache consulted before sending prompts, if any
+        self.cache = cache
 
-    # Define the prompt
-    def send_prompt(self, user_description, user_tweets):
+    def build_messages(self, user_description, user_tweets):
         """
-        Sends prompt to OpenAI API and returns the response
+        Builds the chat messages of a user
         """
-        self.user_content = self.user_content.replace(
-            "user_description", user_description
-        )
-        self.user_content = self.user_content.replace(
-            "user_tweets", user_tweets
+        user_content = fill_prompt(
+            self.prompt_template, user_description, user_tweets
         )
-
-        messages = [
+        return [
             {"role": "system", "content": self.system_content},
-            {"role": "user", "content": self.user_content},
+            {"role": "user", "content": user_content},
         ]
 
+    def count_prompt_tokens(self, user_description, user_tweets):
+        """
+        Estimates the tokens of a user's messages
+        """
+        messages = self.build_messages(user_description, user_tweets)
+        return sum(count_tokens(message["content"]) for message in messages)
+
+    # Define the prompt
+    def send_prompt(self, user_description, user_tweets):
+        """
+        Sends prompt to OpenAI API and returns the response
+        """
+        messages = self.build_messages(user_description, user_tweets)
+        self.user_content = messages[1]["content"]
+        cached = self.get_cached(user_description, user_tweets)
+        if cached is not None:
+            self.content = cached
+            return
+
         try:
             print(f"Sending prompt to model {self.model}...")
             response = client.chat.completions.create(
@@ -53,6 +88,82 @@ class GPTClassifier:
             return
 
         self.content = response.choices[0].message.content
+        self.put_cached(user_description, user_tweets, self.content)
+
+    async def classify(self, user_description, user_tweets):
+        """
+        Sends a user's prompt without blocking the event loop. Errors are
+        raised, so the caller can retry.
+
+        Returns:
+            - content (str): response text
+            - total_tokens (int): tokens used, None if not reported
+        """
+        messages = self.build_messages(user_description, user_tweets)
+        response = await async_client.chat.completions.create(
+            model=self.model, messages=messages
+        )
+        usage = getattr(response, "usage", None)
+
+        return (
+            response.choices[0].message.content,
+            getattr(usage, "total_tokens", None),
+        )
+
+    def build_batch_messages(self, users):
+        """
+        Builds the chat messages of a batch of users
+        """
+        return [
+            {"role": "system", "content": BATCH_INSTRUCTIONS},
+            {"role": "user", "content": build_batch_prompt(users)},
+        ]
+
+    def build_batch_request(self, users):
+        """
+        Builds the chat completion request of a batch of users, with the
+        response held to the batch schema. Batch jobs send the same body.
+        """
+        return {
+            "model": self.model,
+            "messages": self.build_batch_messages(users),
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "user_classifications",
+                    "strict": True,
+                    "schema": batch_response_schema(),
+                },
+            },
+        }
+
+    def count_batch_tokens(self, users):
+        """
+        Estimates the tokens of a batch's messages
+        """
+        messages = self.build_batch_messages(users)
+        return sum(count_tokens(message["content"]) for message in messages)
+
+    async def classify_batch(self, users):
+        """
+        Sends a batch of users in one request
+
+        Args:
+            - users (list): dicts with user_id, description and tweets
+
+        Returns:
+            - content (str): JSON response
+            - total_tokens (int): tokens used, None if not reported
+        """
+        response = await async_client.chat.completions.create(
+            **self.build_batch_request(users)
+        )
+        usage = getattr(response, "usage", None)
+
+        return (
+            response.choices[0].message.content,
+            getattr(usage, "total_tokens", None),
+        )
 
     def run(self):
         """
@@ -0,0 +1,240 @@
+"""
+Prompt building for the LLM classifiers
+"""
+
+import datetime
+import functools
+import html
+import json
+import re
+
+from llm_classification.constants import (
+    BATCH_PROMPT,
+    CATEGORIES,
+    TOKENIZER_ENCODING,
+    TWEET_RECENCY_HALF_LIFE,
+    TWEET_TOKEN_BUDGET,
+)
+
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+PLACEHOLDERS = re.compile(r"user_description|user_tweets")
+URLS = re.compile(r"https?://\S+|www\.\S+")
+MENTIONS = re.compile(r"@\w+")
+WORDS = re.compile(r"[^\W\d_]{3,}")
+
+
+def fill_prompt(template, user_description, user_tweets):
+    """
+    Fills a prompt template with a user's description and tweets. The
+    template itself is left untouched, so it can be reused across users.
+
+    Args:
+        - template (str): prompt with user_description and user_tweets
+        placeholders
+        - user_description (str)
+        - user_tweets (str)
+
+    Returns:
+        - prompt (str)
+    """
+    values = {
+        "user_description": user_description,
+        "user_tweets": user_tweets,
+    }
+    # A single pass, so placeholders inside the user's text are kept as is
+    return PLACEHOLDERS.sub(lambda match: values[match.group()], template)
+
+
+def estimate_tokens(text):
+    """
+    Rough token count of a text, about 4 characters per token
+    """
+    return len(text) // 4 + 1
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding():
+    """
+    Loads the local tokenizer once. Returns None if tiktoken is not
+    installed or the encoding cannot be loaded.
+    """
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception as error:
+        print(f"Unable to load tokenizer, estimating tokens: {error}")
+        return None
+
+
+def count_tokens(text):
+    """
+    Token count of a text with the local tokenizer, or an estimate
+    without it
+    """
+    encoding = get_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def clean_tweet(tweet_text):
+    """
+    Strips URLs and mentions from a tweet, which tell the model little
+    about the user, and collapses whitespace
+    """
+    tweet_text = URLS.sub(" ", html.unescape(tweet_text))
+    tweet_text = MENTIONS.sub(" ", tweet_text)
+    return " ".join(tweet_text.split())
+
+
+def select_tweets(tweets_list, token_budget=TWEET_TOKEN_BUDGET, now=None):
+    """
+    Picks the tweets of a user to include in a prompt. Cleaned tweets are
+    deduplicated, ranked by their distinct words, weighted up by recency,
+    and packed up to the token budget. The selected tweets are returned by
+    tweet_id rather than by rank, so recency shifting the ranking of the
+    same tweets does not change the prompt, or its cache key.
+
+    Args:
+        - tweets_list (list): tweet dicts with tweet_text, and tweet_id and
+        created_at in ISO format if known
+        - token_budget (int): tokens of the selected tweets, one per line
+        - now (datetime): reference time for recency, utcnow by default
+
+    Returns:
+        - tweets (list): cleaned tweet texts, oldest tweet_id first
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+
+    def recency(tweet_dict):
+        try:
+            created_at = datetime.datetime.fromisoformat(
+                tweet_dict["created_at"]
+            )
+            age_days = max((now - created_at).total_seconds(), 0) / 86400
+        except (KeyError, TypeError, ValueError):
+            # Unknown dates rank as old tweets
+            return 0
+        return 0.5 ** (age_days / TWEET_RECENCY_HALF_LIFE)
+
+    candidates = {}
+    for tweet_dict in tweets_list:
+        tweet_text = clean_tweet(tweet_dict["tweet_text"])
+        if not tweet_text:
+            continue
+        informativeness = len(set(WORDS.findall(tweet_text.casefold())))
+        score = informativeness * (1 + recency(tweet_dict))
+        # Keep the best scored copy of repeated tweets
+        key = tweet_text.casefold()
+        if key not in candidates or score > candidates[key][0]:
+            # Zero-padded so numeric ids sort in numeric order
+            tweet_id = str(tweet_dict.get("tweet_id", "")).zfill(20)
+            candidates[key] = (score, tweet_text, tweet_id)
+
+    selected = []
+    remaining_tokens = token_budget
+    for _, tweet_text, tweet_id in sorted(
+        candidates.values(), key=lambda candidate: candidate[0], reverse=True
+    ):
+        tokens = count_tokens(f"{tweet_text}\n")
+        # Skip tweets that do not fit, shorter ones further down may
+        if tokens > remaining_tokens:
+            continue
+        selected.append((tweet_id, tweet_text))
+        remaining_tokens -= tokens
+
+    return [tweet_text for _, tweet_text in sorted(selected)]
+
+
+def batch_response_schema(strict=True):
+    """
+    JSON schema of a batched response, with one category per user ID
+
+    Args:
+        - strict (bool): forbid extra properties, which OpenAI's strict
+        mode requires and Gemini does not support
+    """
+    classification = {
+        "type": "object",
+        "properties": {
+            "user_id": {"type": "string"},
+            "category": {"type": "string", "enum": CATEGORIES},
+        },
+        "required": ["user_id", "category"],
+    }
+    schema = {
+        "type": "object",
+        "properties": {
+            "classifications": {"type": "array", "items": classification}
+        },
+        "required": ["classifications"],
+    }
+    if strict:
+        classification["additionalProperties"] = False
+        schema["additionalProperties"] = False
+
+    return schema
+
+
+def build_batch_prompt(users):
+    """
+    Builds the prompt of a batch of users, with their description and
+    their selected tweets
+
+    Args:
+        - users (list): dicts with user_id, description and tweets (list
+        of tweet texts, from select_tweets)
+
+    Returns:
+        - prompt (str)
+    """
+    blocks = []
+    for user in users:
+        tweets = "\n".join(
+            f"- {' '.join(tweet.split())}" for tweet in user["tweets"]
+        )
+        blocks.append(
+            f"User ID: {user['user_id']}\n"
+            f"Description: {' '.join(user['description'].split())}\n"
+            f"Tweets:\n{tweets}"
+        )
+
+    # The placeholder comes before any user text
+    return BATCH_PROMPT.replace("users_block", "\n\n---\n\n".join(blocks), 1)
+
+
+def parse_batch_response(text, user_ids):
+    """
+    Validates a batched response against the users that were sent
+
+    Args:
+        - text (str): JSON response
+        - user_ids (list): IDs of the users in the batch
+
+    Returns:
+        - classifications (dict): category keyed by user_id, only for the
+        users with a valid classification
+    """
+    try:
+        items = json.loads(text)["classifications"]
+    except (TypeError, ValueError, KeyError) as error:
+        print(f"Invalid batched response: {error}")
+        return {}
+
+    expected = set(user_ids)
+    classifications = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        user_id = str(item.get("user_id"))
+        if user_id in expected and item.get("category") in CATEGORIES:
+            classifications.setdefault(user_id, item["category"])
+
+    return classifications
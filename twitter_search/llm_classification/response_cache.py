@@ -0,0 +1,279 @@
+"""
+Disk-backed cache of LLM responses.
+
+Reclassification runs send the same description and tweets to the same
+model again, even when nothing changed. Responses are stored keyed by a
+hash of the model, the prompt mode (single-user or batched), the prompt
+version, the prompt's text and the user's normalized content, so
+unchanged users are answered from disk. Editing a prompt or its
+instructions, or bumping its version in constants.py, invalidates its
+cached responses, for every user: a tweak to a single category can move
+any user in or out of it, so responses cannot be kept per category.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from llm_classification.constants import (
+    CATEGORIES,
+    LLM_CACHE_DB_PATH,
+    LLM_CACHE_EVICT_EVERY,
+    LLM_CACHE_MAX_AGE,
+    LLM_CACHE_MAX_BYTES,
+    LLM_CACHE_REPORT_EVERY,
+)
+
+
+def normalize_text(text):
+    """
+    Collapses whitespace, so formatting changes do not change the key
+    """
+    return " ".join(text.split())
+
+
+def hash_prompt(*texts):
+    """
+    Hash of a prompt's templates and instructions, so editing them
+    changes the cache keys even if the prompt version is not bumped
+
+    Returns:
+        - prompt_hash (str): hex digest
+    """
+    return hashlib.sha256(json.dumps(texts).encode("utf-8")).hexdigest()
+
+
+def cache_key(
+    model, mode, prompt_version, prompt_hash, user_description, user_tweets
+):
+    """
+    Hash of everything that determines a response
+
+    Args:
+        - model (str)
+        - mode (str): "single" for the free-text responses of single-user
+        prompts, "batch" for the categories of batched prompts
+        - prompt_version (int)
+        - prompt_hash (str): from hash_prompt
+        - user_description (str)
+        - user_tweets (str)
+
+    Returns:
+        - key (str): hex digest
+    """
+    content = json.dumps(
+        [
+            model,
+            mode,
+            prompt_version,
+            prompt_hash,
+            normalize_text(user_description),
+            normalize_text(user_tweets),
+        ]
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite-backed response cache, shared by all the classifiers on a host
+    """
+
+    def __init__(
+        self,
+        db_path=LLM_CACHE_DB_PATH,
+        max_age=LLM_CACHE_MAX_AGE,
+        max_bytes=LLM_CACHE_MAX_BYTES,
+        report_every=LLM_CACHE_REPORT_EVERY,
+    ):
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.report_every = report_every
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            db_path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                content TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                used_at REAL NOT NULL
+            )
+            """
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)"
+        )
+        self.evict()
+
+    def get(self, key):
+        """
+        Gets a cached response
+
+        Args:
+            - key (str): from cache_key
+
+        Returns:
+            - content (str): None if it is not cached, or too old
+        """
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT content FROM responses WHERE key = ? AND created_at >= ?",
+                (key, now - self.max_age),
+            ).fetchone()
+            if row:
+                self.hits += 1
+                self.connection.execute(
+                    "UPDATE responses SET used_at = ? WHERE key = ?",
+                    (now, key),
+                )
+            else:
+                self.misses += 1
+            lookups = self.hits + self.misses
+
+        if self.report_every and lookups % self.report_every == 0:
+            self.report()
+
+        return row[0] if row else None
+
+    def put(self, key, model, content):
+        """
+        Stores a response
+
+        Args:
+            - key (str): from cache_key
+            - model (str)
+            - content (str)
+        """
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, content, len(content.encode("utf-8")), now, now),
+            )
+            self.writes += 1
+            writes = self.writes
+
+        if writes % LLM_CACHE_EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self, max_age=None, max_bytes=None):
+        """
+        Deletes the responses older than max_age seconds, then the least
+        recently used ones until the rest fit in max_bytes
+
+        Returns:
+            - num_evicted (int)
+        """
+        max_age = self.max_age if max_age is None else max_age
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        with self.lock:
+            num_evicted = self.connection.execute(
+                "DELETE FROM responses WHERE created_at < ?",
+                (time.time() - max_age,),
+            ).rowcount
+            total_bytes = self.connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()[0]
+            if total_bytes > max_bytes:
+                keys = []
+                rows = self.connection.execute(
+                    "SELECT key, size FROM responses ORDER BY used_at"
+                ).fetchall()
+                for key, size in rows:
+                    if total_bytes <= max_bytes:
+                        break
+                    keys.append((key,))
+                    total_bytes -= size
+                self.connection.executemany(
+                    "DELETE FROM responses WHERE key = ?", keys
+                )
+                num_evicted += len(keys)
+
+        if num_evicted:
+            print(f"LLM cache: evicted {num_evicted} responses")
+
+        return num_evicted
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def report(self):
+        print(
+            f"LLM cache: {self.hits} hits, {self.misses} misses ({round(100 * self.hit_rate, 1)}% hit rate)"
+        )
+
+
+class CachedClassifier:
+    """
+    Cache lookups shared by the classifiers, which set the cache (a
+    ResponseCache, or None), model, prompt_version, batch_prompt_version,
+    prompt_hash and batch_prompt_hash attributes
+    """
+
+    def cache_key(self, user_description, user_tweets, mode="single"):
+        """
+        Cache key of a user's prompt for this model
+
+        Args:
+            - user_description (str)
+            - user_tweets (str)
+            - mode (str): "single" or "batch"
+        """
+        if mode == "batch":
+            prompt_version = self.batch_prompt_version
+            prompt_hash = self.batch_prompt_hash
+        else:
+            prompt_version = self.prompt_version
+            prompt_hash = self.prompt_hash
+        return cache_key(
+            self.model,
+            mode,
+            prompt_version,
+            prompt_hash,
+            user_description,
+            user_tweets,
+        )
+
+    def get_cached(self, user_description, user_tweets, mode="single"):
+        """
+        Cached response of a user, None without a cache or if it is not
+        cached. Batched responses are only returned if they are a valid
+        category.
+        """
+        if self.cache is None:
+            return None
+        content = self.cache.get(
+            self.cache_key(user_description, user_tweets, mode)
+        )
+        if mode == "batch" and content not in CATEGORIES:
+            return None
+
+        return content
+
+    def put_cached(self, user_description, user_tweets, content, mode="single"):
+        """
+        Stores a user's response, if there is a cache
+        """
+        if self.cache is not None:
+            self.cache.put(
+                self.cache_key(user_description, user_tweets, mode),
+                self.model,
+                content,
+            )
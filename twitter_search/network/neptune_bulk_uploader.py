@@ -14,14 +14,18 @@ from config_utils.constants import (
     IAM_ROLE_ARN,
     NEPTUNE_AWS_REGION,
     NEPTUNE_S3_BUCKET,
+    STORAGE_BACKEND,
 )
+from config_utils.object_store import create_s3_client
 
 
 class NeptuneBulkUploader:
 
-    def __init__(self, location, interaction_type):
+    def __init__(
+        self, location, interaction_type, storage_backend=STORAGE_BACKEND
+    ):
         # AWS clients
-        self.s3_client = boto3.client("s3")
+        self.s3_client = create_s3_client(storage_backend, NEPTUNE_AWS_REGION)
         self.location = location
         self.interaction_type = interaction_type
         self.base_dir = Path(__file__).parent.parent / "data/"
@@ -25,6 +25,7 @@ from config_utils.constants import (
     TWIKIT_TWEETS_THRESHOLD,
     USER_FIELDS,
 )
+from config_utils.user_hydrator import UserHydrator
 from config_utils.util import client_creator, convert_to_iso_format, load_json
 from network.user_network import UserNetwork
 from tqdm import tqdm
@@ -664,40 +665,22 @@ class NetworkHandler:
             f"Successfully stored {self.location} {edge_type} edges json file"
         )
 
-    async def get_csv_user_attributes(self, client, user_id):
+    def get_csv_user_attributes(self, user_id, profile):
         """
         Function to get all user attributes when we only get their
         ids from the existing file
 
         Args:
-            - client: twikit.client object
             - user_id: str
+            - profile (dict): hydrated profile, None if it was not found
         """
         user_dict = {}
         user_dict["user_id"] = user_id
-        try:
-            # Get source user information
-            user_obj = await client.get_user_by_id(user_id)
-        except twikit.errors.BadRequest:
-            print("User Attributes: Bad Request")
-            return user_dict
-        except twikit.errors.NotFound:
-            print("User Attributes: Not Found")
+        if not profile:
+            print(f"User Attributes: Not Found ({user_id})")
             return user_dict
-        except twikit.errors.TwitterException as err:
-            print(f"User Attributes: Twitter Error ({err} - {user_id})")
-            return user_dict
-        user_dict["user_id"] = user_obj.id
-        user_dict["username"] = user_obj.screen_name
-        user_dict["description"] = user_obj.description
-        user_dict["profile_location"] = user_obj.location
+        user_dict.update(profile)
         user_dict["target_location"] = self.location
-        user_dict["followers_count"] = user_obj.followers_count
-        user_dict["following_count"] = user_obj.following_count
-        user_dict["tweets_count"] = user_obj.statuses_count
-        # TODO: Check difference between verified and is_blue_verified
-        user_dict["verified"] = user_obj.verified
-        user_dict["created_at"] = convert_to_iso_format(user_obj.created_at)
         # TODO: Adding new attributes
         user_dict["category"] = "null"
         user_dict["treatment_arm"] = "null"
@@ -709,7 +692,9 @@ class NetworkHandler:
         user_dict["last_updated"] = datetime.now().isoformat()
 
         # See if location matches to add city
-        location_match = self.check_location(user_obj.location, self.location)
+        location_match = self.check_location(
+            profile["profile_location"], self.location
+        )
         user_dict["city"] = self.location if location_match else None
 
         return user_dict
@@ -739,10 +724,11 @@ class NetworkHandler:
             missing_users = list(
                 set(users_list).difference(set(self.already_processed_users))
             )
-            client = twikit.Client("en-US")
-            client.load_cookies(TWIKIT_COOKIES_DIR)
             print(f"Already processed {len(set(self.already_processed_users))}")
             print(f"Missing {len(set(missing_users))} to process")
+            # Look up all the missing root users upfront, in batches
+            hydrator = UserHydrator("twikit", [account_num])
+            profiles = await hydrator.hydrate(missing_users)
 
         # TODO: user_id will come from a queue
         for user_to_process in tqdm(users_list):
@@ -750,8 +736,8 @@ class NetworkHandler:
                 print(f"Already processed {user_to_process}, skipping...")
                 continue
             if file_flag:
-                user_to_process_dict = await self.get_csv_user_attributes(
-                    client, user_to_process
+                user_to_process_dict = self.get_csv_user_attributes(
+                    user_to_process, profiles.get(str(user_to_process))
                 )
             user_network = UserNetwork(
                 self.location_file_path, self.location, account_num
@@ -2,13 +2,13 @@
 Script to pull tweets and retweeters from a particular user,
 """
 
-import time
+import asyncio
 from datetime import datetime, timezone
 
 import tweepy
 import twikit
 from config_utils.constants import (
-    FIFTEEN_MINUTES,
+    RETWEETER_CONCURRENCY,
     TWIKIT_COOKIES_DICT,
     TWIKIT_COUNT,
     TWIKIT_FOLLOWERS_THRESHOLD,
@@ -20,6 +20,7 @@ from config_utils.constants import (
     X_MAX_USER_TWEETS,
     X_TWEETS_PAGE_SIZE,
 )
+from config_utils.rate_limiter import get_rate_limiter
 from config_utils.util import (
     api_v1_creator,
     check_location,
@@ -35,7 +36,6 @@ class UserNetwork:
     TWIKIT_RETWEETERS_THRESHOLD = TWIKIT_RETWEETERS_THRESHOLD
     TWIKIT_COOKIES_DICT = TWIKIT_COOKIES_DICT
     TWIKIT_COUNT = TWIKIT_COUNT
-    SLEEP_TIME = 2
 
     def __init__(self, output_file_path, location, account_num=1):
         # Twikit Client
@@ -43,6 +43,8 @@ class UserNetwork:
         self.client.load_cookies(
             self.TWIKIT_COOKIES_DICT[f"account_{account_num}"]
         )
+        # Shared by every request made with this account
+        self.rate_limiter = get_rate_limiter(account_num)
 
         # X Tweepy Client
         self.x_client = client_creator()
@@ -215,19 +217,17 @@ class UserNetwork:
             - retweeters_list (list): List with retweeters info
         """
         retweeters_list = []
-        more_retweeters_available = True
         self.retweeters_counter += 1
-        attempt_number = 1
 
         # Maxed out retweeters threshold
-        if self.retweeters_counter == self.TWIKIT_RETWEETERS_THRESHOLD:
+        if self.retweeters_counter >= self.TWIKIT_RETWEETERS_THRESHOLD:
             print("Maxed out on retweeters threshold")
             self.retweeters_maxed_out = True
             return []
 
         try:
-            retweeters = await self.client.get_retweeters(
-                tweet_id, count=self.TWIKIT_COUNT
+            retweeters = await self.rate_limiter.call(
+                self.client.get_retweeters, tweet_id, count=self.TWIKIT_COUNT
             )
             if retweeters:
                 parsed_retweeters = self.parse_twikit_users(retweeters)
@@ -237,47 +237,38 @@ class UserNetwork:
             self.retweeters_maxed_out = True
             return None
 
-        while more_retweeters_available:
+        while retweeters:
             self.retweeters_counter += 1
-            if self.retweeters_counter < self.TWIKIT_RETWEETERS_THRESHOLD:
-                try:
-                    if attempt_number == 1:
-                        more_retweeters = await retweeters.next()
-                    else:
-                        more_retweeters = await more_retweeters.next()
-                # Stop here if failure and return what you had so far
-                except twikit.errors.TooManyRequests:
-                    print("Retweeters: Too Many Requests")
-                    print(f"Made {self.retweeters_counter} retweets requests")
-                    self.retweeters_maxed_out = True
-                    return retweeters_list
-                except twikit.errors.BadRequest:
-                    print("Retweeters: Bad Request")
-                    return retweeters_list
-                except twikit.errors.TwitterException as e:
-                    print(f"Retweeters: Twitter Exception {e}")
-                    return retweeters_list
-                if more_retweeters:
-                    more_parsed_retweeters = self.parse_twikit_users(
-                        more_retweeters
-                    )
-                    retweeters_list.extend(more_parsed_retweeters)
-                else:
-                    more_retweeters_available = False
-            else:
+            if self.retweeters_counter >= self.TWIKIT_RETWEETERS_THRESHOLD:
                 print("Maxed out on retweeters threshold")
                 print(f"Made {self.retweeters_counter} retweets requests")
                 self.retweeters_maxed_out = True
                 return retweeters_list
-
-            attempt_number += 1
+            try:
+                retweeters = await self.rate_limiter.call(retweeters.next)
+            # Stop here if failure and return what you had so far
+            except twikit.errors.TooManyRequests:
+                print("Retweeters: Too Many Requests")
+                print(f"Made {self.retweeters_counter} retweets requests")
+                self.retweeters_maxed_out = True
+                return retweeters_list
+            except twikit.errors.BadRequest:
+                print("Retweeters: Bad Request")
+                return retweeters_list
+            except twikit.errors.TwitterException as e:
+                print(f"Retweeters: Twitter Exception {e}")
+                return retweeters_list
+            if retweeters:
+                more_parsed_retweeters = self.parse_twikit_users(retweeters)
+                retweeters_list.extend(more_parsed_retweeters)
 
         return retweeters_list
 
     async def twikit_add_retweeters(self, tweets_list):
         """
         For every tweet in a list of dictionaries, attempt to
-        get all possible retweeters.
+        get all possible retweeters. Up to RETWEETER_CONCURRENCY tweets
+        are fetched at the same time, paced by the account's rate limiter.
 
         Args:
         --------
@@ -287,33 +278,38 @@ class UserNetwork:
         --------
             new_tweets_list (list): List of dictionaries
         """
-        new_tweets_list = []
-        counter = 1
         # Variable to determine if no more requests on the retweeters
         self.retweeters_maxed_out = False
+        semaphore = asyncio.Semaphore(RETWEETER_CONCURRENCY)
+        processed_tweets = 0
+
+        async def add_retweeters(tweet_dict):
+            nonlocal processed_tweets
+            async with semaphore:
+                if self.retweeters_maxed_out:
+                    return
+                retweeters = await self.get_single_tweet_retweeters(
+                    tweet_dict["tweet_id"]
+                )
+                # If retweeters, we add that field to the dict
+                if isinstance(retweeters, list):
+                    # TODO: Send to SQS for network processing
+                    tweet_dict["retweeters"] = retweeters
+                processed_tweets += 1
+                if processed_tweets % 200 == 0:
+                    print(f"Processed {processed_tweets} tweets")
+
+        # Only get retweeters if tweet is not a repost and retweet_count > 0
+        await asyncio.gather(
+            *(
+                add_retweeters(tweet_dict)
+                for tweet_dict in tweets_list
+                if (not tweet_dict["tweet_text"].startswith("RT @"))
+                and (tweet_dict["retweet_count"] > 0)
+            )
+        )
 
-        for tweet_dict in tweets_list:
-            # TODO: Upload tweet data to DynamoDB - store_data('tweet')
-            # Only get retweeters if tweet is not a repost and retweet_count > 0
-            if (not tweet_dict["tweet_text"].startswith("RT @")) and (
-                tweet_dict["retweet_count"] > 0
-            ):
-                if not self.retweeters_maxed_out:
-                    retweeters = await self.get_single_tweet_retweeters(
-                        tweet_dict["tweet_id"]
-                    )
-                    # If retweeters, we add that field to the dict
-                    if isinstance(retweeters, list):
-                        # Check user location (?)
-                        # TODO: Upload users data to DynamoDB - store_data('user')
-                        # TODO: Send to SQS for network processing
-                        tweet_dict["retweeters"] = retweeters
-            if counter % 200 == 0:
-                print(f"Processed {counter} tweets")
-            counter += 1
-            new_tweets_list.append(tweet_dict)
-
-        return new_tweets_list
+        return tweets_list
 
     def x_get_single_tweet_retweeters(self, tweet_id):
         """
@@ -396,8 +392,11 @@ class UserNetwork:
 
         # Parse first set of tweets
         try:
-            user_tweets = await self.client.get_user_tweets(
-                user_id, "Tweets", count=self.TWIKIT_COUNT
+            user_tweets = await self.rate_limiter.call(
+                self.client.get_user_tweets,
+                user_id,
+                "Tweets",
+                count=self.TWIKIT_COUNT,
             )
         except KeyError:
             print(f"No Tweets available for user: {user_id}")
@@ -410,9 +409,9 @@ class UserNetwork:
             num_iter += 1
             try:
                 if num_iter == 1:
-                    next_tweets = await user_tweets.next()
+                    next_tweets = await self.rate_limiter.call(user_tweets.next)
                 else:
-                    next_tweets = await next_tweets.next()
+                    next_tweets = await self.rate_limiter.call(next_tweets.next)
                 if next_tweets:
                     # Parse next tweets
                     next_tweets_list = self.parse_twikit_tweets(next_tweets)
@@ -425,7 +424,6 @@ class UserNetwork:
                 return dict_list
             if num_iter % 5 == 0:
                 print(f"Processed {num_iter} user tweets batches")
-                time.sleep(self.SLEEP_TIME)
 
             if num_iter >= self.TWIKIT_THRESHOLD:
                 print("Tweets: Maxed out on requests")
@@ -488,8 +486,10 @@ class UserNetwork:
         for attempt in range(1, max_retries + 1):
             try:
                 # try to fetch
-                followers = await self.client.get_user_followers(
-                    user_id, count=self.TWIKIT_COUNT
+                followers = await self.rate_limiter.call(
+                    self.client.get_user_followers,
+                    user_id,
+                    count=self.TWIKIT_COUNT,
                 )
                 break
             except twikit.errors.NotFound as error:
@@ -498,7 +498,7 @@ class UserNetwork:
                     print(
                         f"Followers: Not Found - retrying (attempt {attempt})"
                     )
-                    time.sleep(60)
+                    await asyncio.sleep(60)
                 else:
                     print(
                         f"Followers: Not Found after {max_retries} attempts - giving up"
@@ -529,9 +529,13 @@ class UserNetwork:
             num_iter += 1
             try:
                 if num_iter == 1:
-                    more_followers = await followers.next()
+                    more_followers = await self.rate_limiter.call(
+                        followers.next
+                    )
                 else:
-                    more_followers = await more_followers.next()
+                    more_followers = await self.rate_limiter.call(
+                        more_followers.next
+                    )
                 if more_followers:
                     more_parsed_followers = self.parse_twikit_users(
                         more_followers
@@ -558,8 +562,7 @@ class UserNetwork:
                 print(f"Followers: Twitter Exception {e}")
                 return followers_list
             if num_iter % 5 == 0:
-                print(f"Processed {num_iter} follower batches, sleeping...")
-                time.sleep(self.SLEEP_TIME)
+                print(f"Processed {num_iter} follower batches")
             if num_iter == self.TWIKIT_FOLLOWERS_THRESHOLD:
                 print("Followers: maxed out number of requests")
                 return followers_list
@@ -613,7 +616,6 @@ class UserNetwork:
         print("Getting user tweets")
         user_tweets = await self.twikit_get_user_tweets(user_dict["user_id"])
 
-        time.sleep(30)
         user_dict["retweeter_status"] = "in progress"
         print("Getting user retweeters")
         user_tweets = await self.twikit_add_retweeters(user_tweets)
@@ -624,7 +626,6 @@ class UserNetwork:
         user_dict["tweets"] = user_tweets
 
         print("Getting user followers...")
-        time.sleep(30)
         user_dict["follower_status"] = "in progress"
         followers = await self.twikit_get_followers(user_dict["user_id"])
         user_dict["follower_last_processed"] = datetime.now(
@@ -688,6 +689,6 @@ class UserNetwork:
         if extraction_type == "x":
             self.run_x()
         else:
-            # If file or twikit extraction method, use twikit
+            # If file or twikit extraction method, use twikit. Requests
+            # are paced by the rate limiter, so there is no need to sleep
             await self.run_twikit(user_dict)
-            time.sleep(FIFTEEN_MINUTES)
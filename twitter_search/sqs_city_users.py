@@ -13,27 +13,34 @@ from argparse import ArgumentParser
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
-import boto3
-import botocore
 import pandas as pd
 import twikit
+from config_utils.checkpoint_store import CheckpointStore
 from config_utils.cities import CITIES_LANGS, LOCATION_ALIAS_DICT
 from config_utils.constants import (
+    DEDUP_BACKEND,
     EXPANSIONS,
     FIFTEEN_MINUTES,
     INFLUENCER_FOLLOWERS_THRESHOLD,
     NEPTUNE_ENDPOINT,
     NEPTUNE_S3_BUCKET,
+    QUEUE_BACKEND,
     SQS_USER_FOLLOWERS,
     SQS_USER_TWEETS,
+    STORAGE_BACKEND,
     TWEET_FIELDS,
-    TWIKIT_COOKIES_DICT,
     USER_FIELDS,
     X_SEARCH_MAX_TWEETS,
     X_SEARCH_MIN_TWEETS,
 )
+from config_utils.dedup_store import create_dedup_store
 from config_utils.neptune_handler import NeptuneHandler
+from config_utils.profile_store import ProfileStore
 from config_utils.queries import QUERIES_DICT
+from config_utils.queue_handler import create_sqs_client
+from config_utils.s3_writer import S3Writer
+from config_utils.twikit_clients import get_twikit_client
+from config_utils.user_hydrator import UserHydrator
 from config_utils.util import (
     check_location,
     client_creator,
@@ -42,11 +49,21 @@ from config_utils.util import (
 
 
 class CityUsers:
-    def __init__(self, location, neptune_handler):
+    def __init__(
+        self,
+        location,
+        neptune_handler,
+        queue_backend=QUEUE_BACKEND,
+        dedup_backend=DEDUP_BACKEND,
+        storage_backend=STORAGE_BACKEND,
+    ):
         self.base_dir = Path(__file__).parent / "data/"
         self.location = location
-        self.sqs_client = boto3.client("sqs", region_name="us-west-1")
-        self.s3_client = boto3.client("s3", region_name="us-east-2")
+        self.sqs_client = create_sqs_client(queue_backend)
+        self.dedup_store = create_dedup_store(dedup_backend)
+        self.checkpoint_store = CheckpointStore()
+        self.profile_store = ProfileStore()
+        self.s3_writer = S3Writer(storage_backend)
         self.language = CITIES_LANGS.get(self.location, None)
         self.neptune_handler = neptune_handler
 
@@ -200,75 +217,47 @@ class CityUsers:
 
         return user_dicts
 
-    async def get_user_attributes(self, users_list, account_num):
+    async def get_user_attributes(
+        self, users_list, account_nums, hydration_source="twikit"
+    ):
         """
         Function to get all user attributes when we only get their
-        ids from the existing file
+        ids from the existing file. Profiles are looked up in batches.
 
         Args:
-            - client: twikit.client object
-            - user_id: str
+            - users_list (list): list of user ids
+            - account_nums (list): twikit accounts to spread lookups over
+            - hydration_source (str): "twikit" or "X"
         """
-        client = twikit.Client("en-US")
-        client.load_cookies(TWIKIT_COOKIES_DICT[f"account_{account_num}"])
+        hydrator = UserHydrator(
+            hydration_source, account_nums, self.profile_store
+        )
+        profiles = await hydrator.hydrate(users_list)
 
         new_users_list = []
         for user in users_list:
-            user_dict = {}
-            user_dict["user_id"] = user
-            success = False
-            while not success:
-                # Get source user information
-                try:
-                    user_obj = await client.get_user_by_id(user_dict["user_id"])
-                except twikit.errors.TooManyRequests:
-                    print("User Attributes: Too Many Requests...")
-                    time.sleep(FIFTEEN_MINUTES)
-                    user_obj = await client.get_user_by_id(user_dict["user_id"])
-                except twikit.errors.BadRequest:
-                    print("User Attributes: Bad Request")
-                    continue
-                except twikit.errors.NotFound:
-                    print("User Attributes: Not Found")
-                    continue
-                except twikit.errors.TwitterException as err:
-                    print(
-                        f"User Attributes: Twitter Error ({err} - {user['user_id']})"
-                    )
-                    continue
-                user_dict["user_id"] = user_obj.id
-                user_dict["username"] = user_obj.screen_name
-                user_dict["description"] = user_obj.description
-                user_dict["profile_location"] = user_obj.location
-                user_dict["target_location"] = self.location
-                user_dict["followers_count"] = user_obj.followers_count
-                user_dict["following_count"] = user_obj.following_count
-                user_dict["tweets_count"] = user_obj.statuses_count
-                user_dict["verified"] = user_obj.verified
-                user_dict["created_at"] = convert_to_iso_format(
-                    user_obj.created_at
-                )
-                user_dict["category"] = "null"
-                user_dict["treatment_arm"] = "null"
-                user_dict["retweeter_status"] = "pending"
-                user_dict["retweeter_last_processed"] = "null"
-                user_dict["follower_status"] = "pending"
-                user_dict["follower_last_processed"] = "null"
-                user_dict["last_tweeted_at"] = "null"
-                user_dict["extracted_at"] = datetime.now(
-                    timezone.utc
-                ).isoformat()
-                user_dict["last_updated"] = datetime.now(
-                    timezone.utc
-                ).isoformat()
-
-                # See if location matches to add city
-                location_match = check_location(
-                    user_obj.location, self.location
-                )
-                user_dict["city"] = self.location if location_match else None
-                new_users_list.append(user_dict)
-                success = True
+            profile = profiles.get(str(user))
+            if not profile:
+                print(f"User Attributes: Not Found ({user})")
+                continue
+            user_dict = dict(profile)
+            user_dict["target_location"] = self.location
+            user_dict["category"] = "null"
+            user_dict["treatment_arm"] = "null"
+            user_dict["retweeter_status"] = "pending"
+            user_dict["retweeter_last_processed"] = "null"
+            user_dict["follower_status"] = "pending"
+            user_dict["follower_last_processed"] = "null"
+            user_dict["last_tweeted_at"] = "null"
+            user_dict["extracted_at"] = datetime.now(timezone.utc).isoformat()
+            user_dict["last_updated"] = datetime.now(timezone.utc).isoformat()
+
+            # See if location matches to add city
+            location_match = check_location(
+                profile["profile_location"], self.location
+            )
+            user_dict["city"] = self.location if location_match else None
+            new_users_list.append(user_dict)
 
         return new_users_list
 
@@ -316,10 +305,7 @@ class CityUsers:
             - date_until (str): End date for tweet search
             - account_num (int): Twitter account to use for extraction
         """
-        client = twikit.Client("en-US")
-        cookies_dir = TWIKIT_COOKIES_DICT[f"account_{account_num}"]
-        cookies_dir = Path(__file__).parent.parent / cookies_dir
-        client.load_cookies(cookies_dir)
+        client = get_twikit_client(account_num)
         users_dict = {}
 
         date_range = f"since:{date_since} until:{date_until}"
@@ -329,24 +315,46 @@ class CityUsers:
         print(f"Number of tweets per account: {num_tweets}")
 
         for account_type, query in queries_dict.items():
-            num_extracted_tweets = 0
-            num_iter = 0
             print()
             print(
                 f" =============== PROCESSING: {account_type} ======================"
             )
+            # Resume from the last completed page of an interrupted run.
+            # The key leaves out the default dates, which shift every run
+            task_key = f"search#{self.location}#{account_type}"
+            cursor, num_iter, checkpoint = self.checkpoint_store.load(task_key)
+            if num_iter:
+                print(f"Resuming search after page {num_iter}")
+                query_users = checkpoint["users"]
+                num_extracted_tweets = checkpoint["num_tweets"]
+                if cursor is None:
+                    users_dict = users_dict | query_users
+                    continue
+            else:
+                query_users = {}
+                num_extracted_tweets = 0
+
             flag = False
             for _ in range(3):
                 try:
                     tweets = await client.search_tweet(
-                        query, "Latest", count=num_tweets
+                        query, "Latest", count=num_tweets, cursor=cursor
                     )
                     print(f"First request, got : {len(tweets)} tweets")
                     flag = True
                     num_extracted_tweets += len(tweets)
                     parsed_users = self.parse_twikit_users(tweets)
-                    users_dict = users_dict | parsed_users
+                    query_users = query_users | parsed_users
                     num_iter += 1
+                    self.checkpoint_store.save(
+                        task_key,
+                        tweets.next_cursor,
+                        num_iter,
+                        {
+                            "users": query_users,
+                            "num_tweets": num_extracted_tweets,
+                        },
+                    )
                     break
                 except twikit.errors.TooManyRequests:
                     print("Tweets: Too Many Requests...")
@@ -358,21 +366,29 @@ class CityUsers:
 
             if not flag:
                 print(f"No tweets extracted for account type: {account_type}")
+                users_dict = users_dict | query_users
                 continue
 
             while num_extracted_tweets < num_tweets:
                 try:
-                    if num_iter == 1:
-                        next_tweets = await tweets.next()
-                    else:
-                        next_tweets = await next_tweets.next()
+                    next_tweets = await tweets.next()
 
                     if next_tweets:
                         # Just getting the exactly necessary tweets - It will be more than required!
                         next_users = self.parse_twikit_users(next_tweets)
-                        users_dict = users_dict | next_users
+                        query_users = query_users | next_users
                         num_extracted_tweets += len(next_tweets)
                         num_iter += 1
+                        tweets = next_tweets
+                        self.checkpoint_store.save(
+                            task_key,
+                            tweets.next_cursor,
+                            num_iter,
+                            {
+                                "users": query_users,
+                                "num_tweets": num_extracted_tweets,
+                            },
+                        )
                         print(
                             f"Request {num_iter}, got : {len(next_tweets)} tweets"
                         )
@@ -386,8 +402,22 @@ class CityUsers:
                 if num_iter % 5 == 0:
                     print(f"Processed {num_iter} batches")
 
+            # Mark the query as completed until the whole search finishes
+            self.checkpoint_store.save(
+                task_key,
+                None,
+                num_iter,
+                {"users": query_users, "num_tweets": num_extracted_tweets},
+            )
+            users_dict = users_dict | query_users
             print(f"Extracted {num_extracted_tweets} tweets for {account_type}")
 
+        for account_type in queries_dict:
+            self.checkpoint_store.delete(
+                f"search#{self.location}#{account_type}"
+            )
+
+        self.profile_store.put_many(users_dict.values())
         return list(users_dict.values())
 
     def _get_x_city_users(self, tweet_count, date_since, date_until):
@@ -454,6 +484,7 @@ class CityUsers:
 
             print(f"Extracted {result_count} tweets for {account_type}")
 
+        self.profile_store.put_many(users_dict.values())
         return list(users_dict.values())
 
     @staticmethod
@@ -473,41 +504,58 @@ class CityUsers:
 
     def send_to_queue(self, user_id, queue_name):
         """
-        Sends twikit or X users to the corresponding queue
+        Sends twikit or X users to the corresponding queue, unless
+        they were already dispatched to it in the current crawl window
 
         Args:
             - user_id (str)
             - queue_name (str)
         """
-        queue_url = self.sqs_client.get_queue_url(QueueName=queue_name)[
-            "QueueUrl"
-        ]
+        if not self.dedup_store.claim(queue_name, user_id):
+            print(f"User {user_id} already dispatched to {queue_name}")
+            return
+
         message = {
             "user_id": user_id,
             "location": self.location,
+            # City users are the crawl's root users
+            "depth": 0,
         }
         try:
+            queue_url = self.sqs_client.get_queue_url(QueueName=queue_name)[
+                "QueueUrl"
+            ]
             self.sqs_client.send_message(
                 QueueUrl=queue_url,
                 MessageBody=json.dumps(message),
             )
         except Exception as err:
+            self.dedup_store.release(queue_name, user_id)
             print(f"Unable to send user {user_id} to {queue_name} SQS: {err}")
 
-    def insert_description_to_s3(self, user_dict):
+    def insert_descriptions_to_s3(self, users_list):
         """
         Function to insert each user's description as
-        a txt file to S3
+        a txt file to S3. The descriptions are put
+        concurrently, in one batch
+
+        Args:
+        ----------
+            - users_list (list): list of user dicts
+
+        Returns:
+        ----------
+            - num_inserted (int): descriptions written
         """
-        s3_path = f"networks/{self.location}/classification/{user_dict['user_id']}/input/description.txt"
-        try:
-            self.s3_client.put_object(
-                Bucket=NEPTUNE_S3_BUCKET,
-                Key=s3_path,
-                Body=user_dict["description"].encode("utf-8", errors="ignore"),
+        descriptions = {}
+        for user_dict in users_list:
+            s3_path = f"networks/{self.location}/classification/{user_dict['user_id']}/input/description.txt"
+            descriptions[s3_path] = user_dict["description"].encode(
+                "utf-8", errors="ignore"
             )
-        except botocore.exceptions.ClientError:
-            print(f"Unable to upload description for {user_dict['user_id']}")
+        errors = self.s3_writer.put_objects(NEPTUNE_S3_BUCKET, descriptions)
+
+        return len(descriptions) - len(errors)
 
     def validate_root_user(self, user_dict):
         """
@@ -549,18 +597,15 @@ class CityUsers:
                 "City node must exist prior to storing additional information"
             )
 
-        root_user_counter = 0
-        s3_counter = 0
+        root_users = []
 
         for index, user_dict in enumerate(users_list, start=1):
             print(f"Validating User {index}: {user_dict['user_id']}")
             validation_status = self.validate_root_user(user_dict)
             if not validation_status:
                 continue
-            root_user_counter += 1
+            root_users.append(user_dict)
             self.neptune_handler.create_user_node(user_dict)
-            self.insert_description_to_s3(user_dict)
-            s3_counter += 1
             self.send_to_queue(user_dict["user_id"], SQS_USER_TWEETS)
             self.send_to_queue(user_dict["user_id"], SQS_USER_FOLLOWERS)
             props_dict = {
@@ -576,9 +621,11 @@ class CityUsers:
         # Stop Neptune client
         self.neptune_handler.stop()
 
+        s3_counter = self.insert_descriptions_to_s3(root_users)
+
         print()
         print(
-            f"### Root users extracted: {root_user_counter}, S3 insertions: {s3_counter} ###"
+            f"### Root users extracted: {len(root_users)}, S3 insertions: {s3_counter} ###"
         )
 
 
@@ -603,6 +650,19 @@ if __name__ == "__main__":
         type=int,
         help="Account number to use with twikit",
     )
+    parser.add_argument(
+        "--hydration_accounts",
+        type=int,
+        nargs="+",
+        help="Twikit accounts to look up file users with (default: account_num)",
+    )
+    parser.add_argument(
+        "--hydration_source",
+        type=str,
+        choices=["twikit", "X"],
+        default="twikit",
+        help="Look up file users with twikit or the X API",
+    )
     parser.add_argument(
         "--date_since",
         type=str,
@@ -613,6 +673,27 @@ if __name__ == "__main__":
         type=str,
         help="Upper bound date to get the tweets",
     )
+    parser.add_argument(
+        "--queue_backend",
+        type=str,
+        choices=["sqs", "local"],
+        default=QUEUE_BACKEND,
+        help="Send users to AWS SQS or to the local SQLite queues",
+    )
+    parser.add_argument(
+        "--dedup_backend",
+        type=str,
+        choices=["local", "dynamodb"],
+        default=DEDUP_BACKEND,
+        help="Store used to skip users already dispatched in this crawl window",
+    )
+    parser.add_argument(
+        "--storage_backend",
+        type=str,
+        choices=["s3", "local"],
+        default=STORAGE_BACKEND,
+        help="Write descriptions to AWS S3 or to the local object store",
+    )
 
     print("Parsing arguments...")
     print()
@@ -641,7 +722,13 @@ if __name__ == "__main__":
     print()
 
     neptune_handler = NeptuneHandler(NEPTUNE_ENDPOINT)
-    city_users = CityUsers(args.location, neptune_handler)
+    city_users = CityUsers(
+        args.location,
+        neptune_handler,
+        args.queue_backend,
+        args.dedup_backend,
+        args.storage_backend,
+    )
 
     if args.extraction_type == "twikit":
         print("Initiating twikit extraction...")
@@ -660,7 +747,11 @@ if __name__ == "__main__":
         users_list = city_users._get_file_city_users(args.num_users)
         print("Got users from file")
         users_list = asyncio.run(
-            city_users.get_user_attributes(users_list, args.account_num)
+            city_users.get_user_attributes(
+                users_list,
+                args.hydration_accounts or [args.account_num],
+                args.hydration_source,
+            )
         )
         print("Got user attributes")
 
@@ -2,171 +2,323 @@
 Classifies a user by using their tweets and description
 """
 
+import asyncio
 import json
-from concurrent.futures import ThreadPoolExecutor
-
-import boto3
-import botocore
-from config_utils.constants import REGION_NAME, SQS_USER_CLASSIFICATION
+from argparse import ArgumentParser
+
+from config_utils.constants import (
+    FIFTEEN_MINUTES,
+    QUEUE_BACKEND,
+    S3_PREFETCH_USERS,
+    SQS_USER_CLASSIFICATION,
+    STORAGE_BACKEND,
+)
+from config_utils.queue_handler import create_sqs_client
+from config_utils.s3_reader import UserInputReader
+from config_utils.tweet_packs import user_input_prefix
+from llm_classification.classification_engine import (
+    ClassificationEngine,
+    ProviderLimiter,
+)
 from llm_classification.constants import (
+    BATCH_SIZE,
+    BATCH_TWEET_TOKEN_BUDGET,
     GEMINI_MODEL,
+    GEMINI_RPM,
+    GEMINI_TPM,
+    MAX_USERS_IN_FLIGHT,
     NEPTUNE_AWS_REGION,
     NEPTUNE_S3_BUCKET,
     OPENAI_MODEL,
+    OPENAI_RPM,
+    OPENAI_TPM,
 )
 
 # Local imports
 from llm_classification.gemini_classifier import GeminiClassifier
 from llm_classification.openai_classifier import GPTClassifier
-from tqdm import tqdm
-
+from llm_classification.prompts import select_tweets
+from llm_classification.response_cache import ResponseCache
 
-s3_client = boto3.client("s3", region_name=NEPTUNE_AWS_REGION)
-SQS_CLIENT = boto3.client("sqs", region_name=REGION_NAME)
 
-
-def list_user_objects(bucket, prefix, extract_tweets=True):
+def message_input_prefix(message):
     """
-    Return a list of all 'sub-folder' prefixes under the given prefix,
-    even if there are more than 1,000.
-
-    Args:
-        - bucket (str): bucket name
-        - prefix (str): path to analyze
-        - extract_tweets (bool): determines if tweets are being extracted
+    Classification input prefix of the user in a queue message
     """
-    paginator = s3_client.get_paginator("list_objects_v2")
-    pages = paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter="/")
-
-    user_dirs = []
-    for page in pages:
-        if not extract_tweets:
-            for cp in page.get("CommonPrefixes", []):
-                user_dir = f"{cp['Prefix']}input/"
-                user_dirs.append(user_dir)
-        # Get user tweets and description
-        else:
-            for element in page.get("Contents", []):
-                user_dirs.append(element["Key"])
-
-    return user_dirs
+    clean_data = json.loads(message["Body"])
+    return user_input_prefix(clean_data["location"], str(clean_data["user_id"]))
 
 
-def extract_text(filename):
+async def process_and_classify_user(user_prefix, engine, reader):
     """
-    Extracts the content of an s3 file
+    Given a user's directory:
+        - get and process her description and their tweets
+        - classify them with every provider at the same time
 
-    Args:
-        - filename (str): path to txt file in S3
+    The inputs are usually prefetched by the reader while the
+    previous users are classified.
 
     Returns:
-        - string (str): File content
+        - results (dict): responses keyed by provider
     """
-    try:
-        object = s3_client.get_object(Bucket=NEPTUNE_S3_BUCKET, Key=filename)
-        string = object["Body"].read().decode("utf-8")
-    except botocore.exceptions.ClientError as error:
-        print(f"Error for {filename} - {error}")
-        string = ""
+    user = user_prefix.split("/")[3]
+    # Packed tweets, or one object per tweet for older crawls
+    description_text, tweets_list = await asyncio.to_thread(
+        reader.get, user_prefix
+    )
+    if description_text is None:
+        raise Exception(f"Description should be stored for user {user}")
+    print(f"User id {user} - {len(tweets_list)} tweets - {description_text}")
 
-    return string
+    # Best ranked tweets, up to TWEET_TOKEN_BUDGET tokens
+    user_tweets_str = "\n".join(select_tweets(tweets_list))
+    results = await engine.classify_user(description_text, user_tweets_str)
 
+    print(f"User id {user} - Gemini classification: {results['gemini']}")
+    print(f"User id {user} - GPT Classifier: {results['gpt']}")
 
-def extract_several_files(file_keys, max_workers=8):
+    # TODO: Adding classification result to user attributes in neptune
+    return results
+
+
+async def process_and_classify_batch(user_prefixes, engine, reader):
     """
-    Reads content from an array of files by using multiprocessing
+    Classifies several users with one batched prompt per provider
 
-    Args:
-        file_keys (str): list with file names in S3
-        max_workers (int): max number of workers to use
     Returns:
-        tweets_list (list)
+        - results (dict): classifications keyed by provider, each of them
+        a category keyed by user_id
     """
-    # Submit all jobs
-    results = []
-    with ThreadPoolExecutor(max_workers=max_workers) as pool:
-        # executor.map yields results in the same order as file_keys
-        for content in tqdm(
-            pool.map(extract_text, file_keys),
-            total=len(file_keys),
-            desc="Reading from S3",
-        ):
-            results.append(content)
+    users = []
+    for user_prefix in user_prefixes:
+        user = user_prefix.split("/")[3]
+        description_text, tweets_list = await asyncio.to_thread(
+            reader.get, user_prefix
+        )
+        if description_text is None:
+            print(f"Description should be stored for user {user}")
+            continue
+        users.append(
+            {
+                "user_id": user,
+                "description": description_text,
+                "tweets": select_tweets(tweets_list, BATCH_TWEET_TOKEN_BUDGET),
+            }
+        )
+    if not users:
+        return {}
+
+    results = await engine.classify_batch(users)
+    for user in users:
+        user_id = user["user_id"]
+        print(
+            f"User id {user_id} - Gemini classification: {results['gemini'].get(user_id)}"
+        )
+        print(
+            f"User id {user_id} - GPT Classifier: {results['gpt'].get(user_id)}"
+        )
 
     return results
 
 
-def process_and_classify_user(user_prefix, gemini_classifier, gpt_classifier):
+async def classify_messages(sqs_client, queue_url, messages, engine, reader):
     """
-    Given a user's directory:
-        - get and process her description and their tweets
-        - classify them
+    Classifies the users of several messages in one batch, then deletes
+    the messages of the users every provider classified
     """
-    user = user_prefix.split("/")[3]
-    user_content = list_user_objects(
-        NEPTUNE_S3_BUCKET, user_prefix, extract_tweets=True
-    )
-    description_path = f"{user_prefix}description.txt"
-    if description_path in user_content:
-        description_text = extract_text(f"{user_prefix}description.txt")
-        user_content.remove(description_path)
-        print(f"User id {user} - {description_text}")
-    else:
-        description_text = ""
-        raise Exception(f"Description should be stored for user {user}")
-
-    if len(user_content) > 1:
-        # Add a more robust check
-        tweets_list = extract_several_files(user_content)
+    user_ids = [
+        str(json.loads(message["Body"])["user_id"]) for message in messages
+    ]
+    try:
+        results = await process_and_classify_batch(
+            [message_input_prefix(message) for message in messages],
+            engine,
+            reader,
+        )
+    except Exception as error:
+        print(f"Unable to classify users {user_ids}: {error}")
+        return
 
-    user_tweets_str = "\n".join(tweets_list) if len(user_content) > 1 else ""
-    gemini_classifier.send_prompt(description_text, user_tweets_str)
-    gpt_classifier.send_prompt(description_text, user_tweets_str)
+    for user_id, message in zip(user_ids, messages):
+        if results and all(
+            user_id in classifications for classifications in results.values()
+        ):
+            await asyncio.to_thread(
+                sqs_client.delete_message,
+                QueueUrl=queue_url,
+                ReceiptHandle=message["ReceiptHandle"],
+            )
 
-    print(f"Gemini classification: {gemini_classifier.content}")
-    print(f"GPT Classifier: {gpt_classifier.content}")
 
-    # TODO: Adding classification result to user attributes in neptune
+async def classify_message(sqs_client, queue_url, message, engine, reader):
+    """
+    Classifies the user of a message, then deletes the message. Messages
+    of users that could not be classified are left in the queue.
+    """
+    clean_data = json.loads(message["Body"])
+    try:
+        results = await process_and_classify_user(
+            message_input_prefix(message), engine, reader
+        )
+    except Exception as error:
+        print(f"Unable to classify user {clean_data['user_id']}: {error}")
+        return
+    if None in results.values():
+        return
+
+    await asyncio.to_thread(
+        sqs_client.delete_message,
+        QueueUrl=queue_url,
+        ReceiptHandle=message["ReceiptHandle"],
+    )
 
 
-if __name__ == "__main__":
-    user_classification_queue_url = SQS_CLIENT.get_queue_url(
-        QueueName=SQS_USER_CLASSIFICATION
-    )["QueueUrl"]
+async def consume_classification_queue(
+    sqs_client,
+    queue_url,
+    engine,
+    reader,
+    max_users,
+    prefetch_users,
+    batch_size=BATCH_SIZE,
+):
+    """
+    Keeps up to max_users users being classified, plus prefetch_users
+    users whose inputs are read ahead. With a batch_size above 1, users
+    are classified in full batches, and a partial batch is only sent once
+    the queue has no more messages.
+    """
+    if not 1 <= batch_size <= max_users + prefetch_users:
+        raise ValueError(
+            f"batch_size must be between 1 and max_users + prefetch_users "
+            f"({max_users + prefetch_users}), got {batch_size}"
+        )
 
+    in_flight = {}
+    pending = []
     while True:
-        # Pass Queue Name and get its URL
-        response = SQS_CLIENT.receive_message(
-            QueueUrl=user_classification_queue_url,
-            MaxNumberOfMessages=1,
-            WaitTimeSeconds=10,
+        num_messages = (
+            max_users + prefetch_users - sum(in_flight.values()) - len(pending)
         )
-        try:
-            message = response["Messages"][0]
-            receipt_handle = message["ReceiptHandle"]
-            clean_data = json.loads(message["Body"])
+        messages = []
+        queue_empty = False
+        if num_messages > 0:
+            response = await asyncio.to_thread(
+                sqs_client.receive_message,
+                QueueUrl=queue_url,
+                MaxNumberOfMessages=min(num_messages, 10),
+                WaitTimeSeconds=0 if in_flight or pending else 10,
+                # Received messages may wait for the users before them
+                VisibilityTimeout=FIFTEEN_MINUTES,
+            )
+            messages = response.get("Messages", [])
+            for message in messages:
+                reader.prefetch(message_input_prefix(message))
+            pending.extend(messages)
+            queue_empty = not messages
+
+        while len(pending) >= batch_size or (pending and queue_empty):
+            group, pending = pending[:batch_size], pending[batch_size:]
+            if batch_size == 1:
+                task = classify_message(
+                    sqs_client, queue_url, group[0], engine, reader
+                )
+            else:
+                task = classify_messages(
+                    sqs_client, queue_url, group, engine, reader
+                )
+            in_flight[asyncio.create_task(task)] = len(group)
+        # Top up the users in flight before waiting for any of them
+        if messages:
+            continue
 
-        except KeyError:
+        if not in_flight:
             # Empty queue
             print("Empty queue")
             continue
 
-        # Getting information from body message
-        print(clean_data)
-        root_user_id = str(clean_data["user_id"])
-        location = clean_data["location"]
-
-        gemini_classifier = GeminiClassifier(model=GEMINI_MODEL)
-        gpt_classifier = GPTClassifier(model=OPENAI_MODEL)
-        user_prefix = (
-            f"networks/{location}/classification/{root_user_id}/input/"
+        done, _ = await asyncio.wait(
+            in_flight, return_when=asyncio.FIRST_COMPLETED
         )
+        for task in done:
+            del in_flight[task]
 
-        process_and_classify_user(
-            user_prefix, gemini_classifier, gpt_classifier
-        )
 
-        SQS_CLIENT.delete_message(
-            QueueUrl=user_classification_queue_url,
-            ReceiptHandle=receipt_handle,
+if __name__ == "__main__":
+    parser = ArgumentParser("Parameters to classify users from the queue")
+    parser.add_argument(
+        "--queue_backend",
+        type=str,
+        choices=["sqs", "local"],
+        default=QUEUE_BACKEND,
+        help="Consume from AWS SQS or from the local SQLite queues",
+    )
+    parser.add_argument(
+        "--max_users",
+        type=int,
+        default=MAX_USERS_IN_FLIGHT,
+        help="Users classified at the same time",
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=BATCH_SIZE,
+        help="Users per prompt, above 1 uses the batched JSON prompts",
+    )
+    parser.add_argument(
+        "--prefetch_users",
+        type=int,
+        default=S3_PREFETCH_USERS,
+        help="Queued users whose inputs are read while classifying",
+    )
+    parser.add_argument(
+        "--storage_backend",
+        type=str,
+        choices=["s3", "local"],
+        default=STORAGE_BACKEND,
+        help="Read inputs from AWS S3 or from the local object store",
+    )
+    parser.add_argument(
+        "--skip_cache",
+        action="store_true",
+        help="Send every prompt, ignoring the cached responses",
+    )
+    args = parser.parse_args()
+
+    sqs_client = create_sqs_client(args.queue_backend)
+    user_classification_queue_url = sqs_client.get_queue_url(
+        QueueName=SQS_USER_CLASSIFICATION
+    )["QueueUrl"]
+    reader = UserInputReader(
+        bucket=NEPTUNE_S3_BUCKET,
+        storage_backend=args.storage_backend,
+        region_name=NEPTUNE_AWS_REGION,
+        prefetch_users=args.max_users + args.prefetch_users,
+    )
+    cache = None if args.skip_cache else ResponseCache()
+
+    async def main():
+        # Clients live as long as the worker, and the limiters are created
+        # inside its event loop
+        engine = ClassificationEngine(
+            classifiers={
+                "gemini": GeminiClassifier(model=GEMINI_MODEL, cache=cache),
+                "gpt": GPTClassifier(model=OPENAI_MODEL, cache=cache),
+            },
+            limiters={
+                "gemini": ProviderLimiter(GEMINI_RPM, GEMINI_TPM),
+                "gpt": ProviderLimiter(OPENAI_RPM, OPENAI_TPM),
+            },
+            max_users=args.max_users,
+        )
+        await consume_classification_queue(
+            sqs_client,
+            user_classification_queue_url,
+            engine,
+            reader,
+            args.max_users,
+            args.prefetch_users,
+            args.batch_size,
         )
+
+    asyncio.run(main())
@@ -4,24 +4,39 @@ Script to get a determined user's followers
 
 import asyncio
 import json
-import time
 from argparse import ArgumentParser
 from datetime import datetime, timezone
-from pathlib import Path
 
-import boto3
 import tweepy
 import twikit
+from config_utils.checkpoint_store import CheckpointStore
 from config_utils.constants import (
+    DEDUP_BACKEND,
+    DEFAULT_NUM_FOLLOWERS,
     FIFTEEN_MINUTES,
+    FOLLOWER_IDS_PAGE_SIZE,
+    FOLLOWER_PAGE_BUFFER,
+    FRONTIER_CITY_BUDGET,
+    FRONTIER_MAX_DEPTH,
+    FRONTIER_RELEASE_SIZE,
+    HYDRATION_BATCH_SIZE,
     INFLUENCER_FOLLOWERS_THRESHOLD,
     NEPTUNE_ENDPOINT,
+    OUT_OF_CITY_USERS,
+    QUEUE_BACKEND,
     SQS_USER_FOLLOWERS,
     SQS_USER_TWEETS,
+    STUB_WRITE_BATCH_SIZE,
     TWENTYFIVE_MINUTES,
-    TWIKIT_COOKIES_DICT,
 )
+from config_utils.crawl_frontier import CrawlFrontier
+from config_utils.dedup_store import create_dedup_store
+from config_utils.follower_sampler import FollowerSampler
 from config_utils.neptune_handler import NeptuneHandler
+from config_utils.profile_store import ProfileStore
+from config_utils.queue_handler import create_sqs_client
+from config_utils.twikit_clients import get_twikit_client
+from config_utils.user_hydrator import twikit_get_users
 from config_utils.util import (
     api_v1_creator,
     check_location,
@@ -38,6 +53,13 @@ class UserFollowers:
         sqs_client,
         receipt_handle,
         neptune_handler,
+        dedup_store,
+        frontier,
+        checkpoint_store,
+        profile_store,
+        depth=0,
+        release_size=FRONTIER_RELEASE_SIZE,
+        out_of_city_users=OUT_OF_CITY_USERS,
     ):
         self.user_id = user_id
         self.location = location
@@ -45,7 +67,21 @@ class UserFollowers:
         self.sqs_client = sqs_client
         self.receipt_handle = receipt_handle
         self.neptune_handler = neptune_handler
+        self.dedup_store = dedup_store
+        self.frontier = frontier
+        self.checkpoint_store = checkpoint_store
+        self.profile_store = profile_store
+        self.depth = depth
+        self.release_size = release_size
+        self.out_of_city_users = out_of_city_users
         self.protected_account = False
+        self.up_to_date = False
+        self.extracted_followers = 0
+        self.newest_follower_id = None
+        self.existing_users_counter = 0
+        self.candidates_counter = 0
+        self.stubs_counter = 0
+        self.sampler = None
 
     def parse_x_users(self, user_list):
         """
@@ -149,45 +185,130 @@ class UserFollowers:
 
         return users_dict
 
-    async def twikit_get_followers(self, follower_count, account_num):
+    def parse_profiles(self, profiles):
         """
-        Gets a given user's followers
+        Builds follower dicts from profiles of the shared profile store
+
+        Args:
+        ----------
+            - profiles (list): list of profile dicts
+        Returns:
+        ----------
+            - user_dicts (list): list of dictionaries with users' info
+        """
+        user_dicts = []
+        for profile in profiles:
+            user_dict = dict(profile)
+            user_dict["target_location"] = self.location
+            user_dict["verified"] = "true" if profile["verified"] else "false"
+            user_dict["category"] = "null"
+            user_dict["treatment_arm"] = "null"
+            user_dict["retweeter_status"] = "pending"
+            user_dict["retweeter_last_processed"] = "null"
+            user_dict["follower_status"] = "pending"
+            user_dict["follower_last_processed"] = "null"
+            user_dict["last_tweeted_at"] = "null"
+            user_dict["extracted_at"] = datetime.now(timezone.utc).isoformat()
+            user_dict["last_updated"] = datetime.now(timezone.utc).isoformat()
+            # See if location matches to add city
+            location_match = check_location(
+                profile["profile_location"], self.location
+            )
+            user_dict["city"] = self.location if location_match else "null"
+            user_dicts.append(user_dict)
+
+        return user_dicts
+
+    def drop_known_followers(self, parsed_followers, known_follower_ids):
+        """
+        Keeps the followers that come before the first already known one.
+        Followers are returned newest first, so the ones after it were
+        already extracted in a previous crawl.
+
+        Args:
+        ----------
+            - parsed_followers (dict): dict of follower dicts, in page order
+            - known_follower_ids (set): ids of the followers in the graph
+        Returns:
+        ----------
+            - new_followers (dict)
+            - caught_up (bool): whether a known follower was reached
+        """
+        new_followers = {}
+        for follower_id, follower_dict in parsed_followers.items():
+            if follower_id in known_follower_ids:
+                return new_followers, True
+            new_followers[follower_id] = follower_dict
+
+        return new_followers, False
+
+    async def twikit_get_followers(
+        self, follower_count, account_num, page_queue, known_follower_ids=None
+    ):
+        """
+        Gets a given user's followers and puts each page on page_queue as
+        soon as it arrives, as a (followers_page, existing_follower_ids,
+        next_cursor, num_iter) tuple. A None item marks the end of the
+        extraction. In incremental mode, pagination stops at the first
+        follower that is already known.
 
         Args:
         ---------
             - follower_count (int)
             - account_num (int)
+            - page_queue (asyncio.Queue)
+            - known_follower_ids (set): ids of known followers, or None to
+            extract all the latest followers
         Returns:
         ---------
-            - followers_list(list): List of dicts with followers info
+            - finished (bool): False if the first request failed, in which
+            case the checkpoint is kept for the retry
         """
-        followers_dict = {}
         queue_url = self.sqs_client.get_queue_url(QueueName=SQS_USER_FOLLOWERS)[
             "QueueUrl"
         ]
-        num_iter = 0
-        extracted_followers = 0
-        client = twikit.Client("en-US")
-        cookies_dir = TWIKIT_COOKIES_DICT[f"account_{account_num}"]
-        cookies_dir = Path(__file__).parent.parent / cookies_dir
-        client.load_cookies(cookies_dir)
+        client = get_twikit_client(account_num)
+
+        # Resume from the last completed page of a previous attempt
+        task_key = f"followers#{self.user_id}"
+        cursor, num_iter, checkpoint = self.checkpoint_store.load(task_key)
+        if num_iter:
+            print(f"Resuming followers extraction after page {num_iter}")
+            self.extracted_followers = checkpoint["extracted"]
+            self.newest_follower_id = checkpoint["newest_follower_id"]
+            if cursor is None:
+                await page_queue.put(None)
+                return True
+        extracted_followers = self.extracted_followers
+        known_follower_ids = known_follower_ids or set()
+        seen_follower_ids = set()
+        caught_up = False
 
         flag = False
         for _ in range(3):
             try:
                 # try to fetch
                 followers = await client.get_user_followers(
-                    self.user_id, count=follower_count
+                    self.user_id, count=follower_count, cursor=cursor
                 )
                 if not followers:
-                    self.protected_account = True
-                    print("API call was successful but no output extracted")
-                    return []
+                    if not num_iter:
+                        self.protected_account = True
+                        print("API call was successful but no output extracted")
+                    # Otherwise the previous attempt stopped at the last page
+                    await page_queue.put(None)
+                    return True
                 flag = True
-                parsed_followers = self.parse_twikit_users(followers)
-                followers_dict = followers_dict | parsed_followers
-                extracted_followers += len(parsed_followers)
+                followers_page, caught_up = self.filter_followers_page(
+                    followers, known_follower_ids, seen_follower_ids
+                )
+                self.profile_store.put_many(followers_page)
+                self.sampler.record_page(followers_page)
+                extracted_followers += len(followers_page)
                 num_iter += 1
+                await page_queue.put(
+                    (followers_page, [], followers.next_cursor, num_iter)
+                )
                 break
             except twikit.errors.NotFound as error:
                 print(f"Followers: Not Found - {error}")
@@ -199,7 +320,7 @@ class UserFollowers:
                     ReceiptHandle=self.receipt_handle,
                     VisibilityTimeout=TWENTYFIVE_MINUTES,
                 )
-                time.sleep(FIFTEEN_MINUTES)
+                await asyncio.sleep(FIFTEEN_MINUTES)
                 continue
             except twikit.errors.BadRequest:
                 print("Followers: Bad Request - stopping early")
@@ -210,21 +331,26 @@ class UserFollowers:
 
         if not flag:
             print("No followers extracted despite 3 retry attempts")
-            return []
+            await page_queue.put(None)
+            return False
 
-        while extracted_followers < follower_count:
+        while not caught_up and self.sampler.should_continue(
+            extracted_followers
+        ):
             try:
-                if num_iter == 1:
-                    more_followers = await followers.next()
-                else:
-                    more_followers = await more_followers.next()
+                more_followers = await followers.next()
                 if more_followers:
-                    more_parsed_followers = self.parse_twikit_users(
-                        more_followers
+                    followers_page, caught_up = self.filter_followers_page(
+                        more_followers, known_follower_ids, seen_follower_ids
                     )
-                    followers_dict = followers_dict | more_parsed_followers
-                    extracted_followers += len(more_parsed_followers)
+                    self.profile_store.put_many(followers_page)
+                    self.sampler.record_page(followers_page)
+                    extracted_followers += len(followers_page)
                     num_iter += 1
+                    followers = more_followers
+                    await page_queue.put(
+                        (followers_page, [], followers.next_cursor, num_iter)
+                    )
                 else:
                     print("No more followers, moving on...")
                     break
@@ -235,7 +361,7 @@ class UserFollowers:
                     ReceiptHandle=self.receipt_handle,
                     VisibilityTimeout=FIFTEEN_MINUTES,
                 )
-                time.sleep(FIFTEEN_MINUTES)
+                await asyncio.sleep(FIFTEEN_MINUTES)
                 continue
             except twikit.errors.BadRequest:
                 print("Followers: Bad Request")
@@ -248,9 +374,334 @@ class UserFollowers:
                 break
             if num_iter % 5 == 0:
                 print(f"Processed {num_iter} follower batches, sleeping...")
-                time.sleep(1)
+                await asyncio.sleep(1)
+
+        if caught_up:
+            print("Reached followers extracted in a previous crawl")
+            self.up_to_date = extracted_followers == 0
+
+        await page_queue.put(None)
+        return True
+
+    async def twikit_request(self, request, *args, **kwargs):
+        """
+        Runs a twikit request with up to 3 attempts, waiting out rate
+        limits while keeping the message hidden
+
+        Returns:
+        ---------
+            - result: the request's result, None if every attempt failed
+        """
+        queue_url = self.sqs_client.get_queue_url(QueueName=SQS_USER_FOLLOWERS)[
+            "QueueUrl"
+        ]
+        for _ in range(3):
+            try:
+                return await request(*args, **kwargs)
+            except twikit.errors.TooManyRequests:
+                print("Followers: Too Many Requests")
+                self.sqs_client.change_message_visibility(
+                    QueueUrl=queue_url,
+                    ReceiptHandle=self.receipt_handle,
+                    VisibilityTimeout=TWENTYFIVE_MINUTES,
+                )
+                await asyncio.sleep(FIFTEEN_MINUTES)
+            except twikit.errors.TwitterException as e:
+                print(f"Followers: Twitter Exception - {e}")
+
+        return None
 
-        return list(followers_dict.values())
+    async def twikit_hydrate_followers(self, client, follower_ids):
+        """
+        Looks up the profiles of several followers, retrying up to 3 times
+        the ones that hit rate limits while keeping the message hidden
+
+        Returns:
+        ---------
+            - users (list): list of twikit.User
+        """
+        queue_url = self.sqs_client.get_queue_url(QueueName=SQS_USER_FOLLOWERS)[
+            "QueueUrl"
+        ]
+        users = []
+        for _ in range(3):
+            found_users, follower_ids = await twikit_get_users(
+                client, follower_ids
+            )
+            users.extend(found_users)
+            if not follower_ids:
+                return users
+            print("Followers: Too Many Requests")
+            self.sqs_client.change_message_visibility(
+                QueueUrl=queue_url,
+                ReceiptHandle=self.receipt_handle,
+                VisibilityTimeout=TWENTYFIVE_MINUTES,
+            )
+            await asyncio.sleep(FIFTEEN_MINUTES)
+
+        print(f"Unable to hydrate {len(follower_ids)} followers, skipping them")
+        return users
+
+    async def twikit_get_follower_ids(
+        self, follower_count, account_num, page_queue, known_follower_ids=None
+    ):
+        """
+        Same as twikit_get_followers, but pages follower ids, which come in
+        pages of up to FOLLOWER_IDS_PAGE_SIZE. Each page is checked against
+        the graph in a single query; only the missing ids are hydrated,
+        HYDRATION_BATCH_SIZE users per lookup, and the rest only get their
+        FOLLOWS edge.
+
+        Args:
+        ---------
+            - follower_count (int)
+            - account_num (int)
+            - page_queue (asyncio.Queue)
+            - known_follower_ids (set): ids of known followers, or None to
+            extract all the latest followers
+        Returns:
+        ---------
+            - finished (bool): False if the first request failed, in which
+            case the checkpoint is kept for the retry
+        """
+        client = get_twikit_client(account_num)
+
+        # Resume from the last completed page of a previous attempt
+        task_key = f"follower_ids#{self.user_id}"
+        cursor, num_iter, checkpoint = self.checkpoint_store.load(task_key)
+        if num_iter:
+            print(f"Resuming follower ids extraction after page {num_iter}")
+            self.extracted_followers = checkpoint["extracted"]
+            self.newest_follower_id = checkpoint["newest_follower_id"]
+            if cursor is None:
+                await page_queue.put(None)
+                return True
+        extracted_followers = self.extracted_followers
+        known_follower_ids = known_follower_ids or set()
+        caught_up = False
+
+        while not caught_up and self.sampler.should_continue(
+            extracted_followers
+        ):
+            ids_page = await self.twikit_request(
+                client.get_followers_ids,
+                user_id=self.user_id,
+                count=FOLLOWER_IDS_PAGE_SIZE,
+                cursor=cursor,
+            )
+            if ids_page is None:
+                print("Follower ids: request failed despite 3 attempts")
+                if not num_iter:
+                    await page_queue.put(None)
+                    return False
+                break
+            if not ids_page:
+                if not num_iter:
+                    self.protected_account = True
+                    print("API call was successful but no output extracted")
+                break
+            num_iter += 1
+
+            # Ids come newest first, stop at the first known follower
+            new_follower_ids = []
+            for follower_id in ids_page:
+                if str(follower_id) in known_follower_ids:
+                    caught_up = True
+                    break
+                new_follower_ids.append(str(follower_id))
+            new_follower_ids = new_follower_ids[
+                : self.sampler.budget - extracted_followers
+            ]
+            if (self.newest_follower_id is None) and new_follower_ids:
+                self.newest_follower_id = new_follower_ids[0]
+
+            existing_follower_ids = await asyncio.to_thread(
+                self.neptune_handler.get_existing_user_ids, new_follower_ids
+            )
+            unknown_follower_ids = [
+                follower_id
+                for follower_id in new_follower_ids
+                if follower_id not in existing_follower_ids
+            ]
+            # Profiles fetched recently by any stage are not looked up again
+            stored_profiles = self.profile_store.get_many(unknown_follower_ids)
+            stored_followers = self.parse_profiles(stored_profiles.values())
+            unknown_follower_ids = [
+                follower_id
+                for follower_id in unknown_follower_ids
+                if follower_id not in stored_profiles
+            ]
+            batches = [
+                unknown_follower_ids[index : index + HYDRATION_BATCH_SIZE]
+                for index in range(
+                    0, len(unknown_follower_ids), HYDRATION_BATCH_SIZE
+                )
+            ] or [[]]
+            extracted_followers += len(existing_follower_ids)
+            # Only the followers new to the graph count towards the yield
+            new_followers = []
+            for batch_num, follower_ids in enumerate(batches, start=1):
+                users = []
+                if follower_ids:
+                    users = await self.twikit_hydrate_followers(
+                        client, follower_ids
+                    )
+                followers_page = list(self.parse_twikit_users(users).values())
+                self.profile_store.put_many(followers_page)
+                # Edges to existing users are written with the first batch
+                first_batch = batch_num == 1
+                last_batch = batch_num == len(batches)
+                if first_batch:
+                    followers_page = stored_followers + followers_page
+                new_followers.extend(followers_page)
+                extracted_followers += len(followers_page)
+                await page_queue.put(
+                    (
+                        followers_page,
+                        list(existing_follower_ids) if first_batch else [],
+                        ids_page.next_cursor if last_batch else None,
+                        num_iter if last_batch else None,
+                    )
+                )
+
+            self.sampler.record_page(new_followers)
+            print(
+                f"Follower ids page {num_iter}: {len(new_follower_ids)} new followers"
+            )
+            cursor = ids_page.next_cursor
+            if not cursor:
+                break
+
+        if caught_up:
+            print("Reached followers extracted in a previous crawl")
+            self.up_to_date = extracted_followers == 0
+
+        await page_queue.put(None)
+        return True
+
+    def filter_followers_page(
+        self, followers, known_follower_ids, seen_follower_ids
+    ):
+        """
+        Parses a page of followers, dropping the ones already seen in
+        previous pages and everything from the first known follower on
+
+        Args:
+        ----------
+            - followers (list): page of User objects
+            - known_follower_ids (set): ids of the followers in the graph
+            - seen_follower_ids (set): ids from previous pages, updated
+        Returns:
+        ----------
+            - followers_page (list): list of new follower dicts
+            - caught_up (bool): whether a known follower was reached
+        """
+        parsed_followers, caught_up = self.drop_known_followers(
+            self.parse_twikit_users(followers), known_follower_ids
+        )
+        followers_page = []
+        for follower_id, follower_dict in parsed_followers.items():
+            if follower_id not in seen_follower_ids:
+                seen_follower_ids.add(follower_id)
+                followers_page.append(follower_dict)
+
+        return followers_page, caught_up
+
+    async def write_followers_pages(self, page_queue, task_key):
+        """
+        Consumes follower pages, writing each one to Neptune in a thread
+        while the next page is fetched. The checkpoint is only advanced
+        once a page has been written.
+
+        Args:
+        ----------
+            - page_queue (asyncio.Queue)
+            - task_key (str): checkpoint key
+        """
+        while True:
+            item = await page_queue.get()
+            if item is None:
+                break
+            followers_page, existing_follower_ids, next_cursor, num_iter = item
+            await asyncio.to_thread(
+                self.process_followers_page,
+                followers_page,
+                existing_follower_ids,
+            )
+            self.extracted_followers += len(followers_page) + len(
+                existing_follower_ids
+            )
+            if (self.newest_follower_id is None) and followers_page:
+                self.newest_follower_id = followers_page[0]["user_id"]
+            # Pages split in several batches are checkpointed on the last one
+            if num_iter is None:
+                continue
+            self.checkpoint_store.save(
+                task_key,
+                next_cursor,
+                num_iter,
+                {
+                    "extracted": self.extracted_followers,
+                    "newest_follower_id": self.newest_follower_id,
+                },
+            )
+
+    async def extract_and_process_followers(
+        self,
+        follower_count,
+        account_num,
+        known_follower_ids=None,
+        follower_ids_mode=False,
+        sampler=None,
+    ):
+        """
+        Runs the followers extraction and the graph writes as a pipeline,
+        keeping at most FOLLOWER_PAGE_BUFFER pages in memory
+
+        Args:
+        ---------
+            - follower_count (int)
+            - account_num (int)
+            - known_follower_ids (set)
+            - follower_ids_mode (bool): page follower ids and only hydrate
+            the users missing from the graph
+            - sampler (FollowerSampler): decides when to stop paging,
+            follower_count followers by default
+        Returns:
+        ---------
+            - extracted_followers (int): followers written to the graph
+        """
+        if follower_ids_mode:
+            task_key = f"follower_ids#{self.user_id}"
+            get_followers = self.twikit_get_follower_ids
+        else:
+            task_key = f"followers#{self.user_id}"
+            get_followers = self.twikit_get_followers
+        page_queue = asyncio.Queue(maxsize=FOLLOWER_PAGE_BUFFER)
+        self.sampler = sampler or FollowerSampler(follower_count)
+
+        # Gremlin runs its own event loop, so it is driven from threads
+        await asyncio.to_thread(self.neptune_handler.start)
+        try:
+            async with asyncio.TaskGroup() as task_group:
+                task_group.create_task(
+                    self.write_followers_pages(page_queue, task_key)
+                )
+                producer = task_group.create_task(
+                    get_followers(
+                        follower_count,
+                        account_num,
+                        page_queue,
+                        known_follower_ids,
+                    )
+                )
+        finally:
+            await asyncio.to_thread(self.neptune_handler.stop)
+
+        if producer.result():
+            self.checkpoint_store.delete(task_key)
+
+        return self.extracted_followers
 
     def x_get_followers(self, follower_count):
         """
@@ -284,85 +735,178 @@ class UserFollowers:
                 }
             )
 
-        return self.parse_x_users(normalized)
+        followers = self.parse_x_users(normalized)
+        self.profile_store.put_many(followers)
+        return followers
 
-    def send_to_queue(self, user_id, queue_name):
+    def send_to_queue(self, user_id, queue_name, depth):
         """
-        Sends twikit or X user to the corresponding queue
+        Sends twikit or X user to the corresponding queue, unless
+        they were already dispatched to it in the current crawl window
 
         Args:
             - user_id (str)
             - queue_name (str)
+            - depth (int): hops away from the city's root users
         """
-        queue_url = self.sqs_client.get_queue_url(QueueName=queue_name)[
-            "QueueUrl"
-        ]
+        if not self.dedup_store.claim(queue_name, user_id):
+            print(f"User {user_id} already dispatched to {queue_name}")
+            return
 
         message = {
             "user_id": user_id,
             "location": self.location,
+            "depth": depth,
         }
         try:
+            queue_url = self.sqs_client.get_queue_url(QueueName=queue_name)[
+                "QueueUrl"
+            ]
             self.sqs_client.send_message(
                 QueueUrl=queue_url,
                 MessageBody=json.dumps(message),
             )
         except Exception as err:
+            self.dedup_store.release(queue_name, user_id)
             print(f"Unable to send user {user_id} to  {queue_name} SQS: {err}")
 
-    def process_and_dispatch_followers(self, followers_list):
+    def release_candidates(self):
+        """
+        Sends the city's best pending candidates from the frontier to the
+        tweets and followers queues. Must be called with the Neptune client
+        started.
+
+        Returns:
+            - num_released (int)
         """
-        Process followers and save it to Neptune/SQS accordingly.
+        released = self.frontier.release(self.location, self.release_size)
+        for user_id, depth in released:
+            self.send_to_queue(user_id, SQS_USER_TWEETS, depth)
+            self.send_to_queue(user_id, SQS_USER_FOLLOWERS, depth)
+            props_dict = {
+                "follower_status": "queued",
+                "last_updated": datetime.now(timezone.utc).isoformat(),
+            }
+            self.neptune_handler.update_node_attributes(
+                label="User",
+                node_id=user_id,
+                props_dict=props_dict,
+            )
+
+        return len(released)
+
+    def process_followers_page(self, followers_page, existing_follower_ids):
+        """
+        Writes a page of followers and their edges to Neptune, pushing new
+        in-city users to the frontier. Must be called with the Neptune
+        client started.
 
         Args:
         ----------
-            - followers_list (list): List of user dicts
+            - followers_page (list): List of user dicts
+            - existing_follower_ids (list): followers already in the graph,
+            which only need their edge
         """
-        # Start Neptune client
-        self.neptune_handler.start()
+        if self.out_of_city_users == "stub":
+            self.process_followers_page_with_stubs(
+                followers_page, existing_follower_ids
+            )
+            return
 
-        existing_users_counter = 0
-        root_users_counter = 0
+        for follower_id in existing_follower_ids:
+            self.existing_users_counter += 1
+            self.neptune_handler.create_follower_edge(follower_id, self.user_id)
 
-        for follower_dict in followers_list:
+        for follower_dict in followers_page:
             if self.neptune_handler.user_exists(follower_dict["user_id"]):
-                existing_users_counter += 1
+                self.existing_users_counter += 1
             else:
                 self.neptune_handler.create_user_node(follower_dict)
-                if (
-                    self.further_extraction
-                    and (
-                        follower_dict["city"]
-                        == follower_dict["target_location"]
-                    )
-                    and (
-                        follower_dict["followers_count"]
-                        > INFLUENCER_FOLLOWERS_THRESHOLD
-                    )
-                    and (follower_dict["tweets_count"] > 0)
-                ):
-                    root_users_counter += 1
-                    self.send_to_queue(
-                        follower_dict["user_id"], SQS_USER_TWEETS
-                    )
-                    self.send_to_queue(
-                        follower_dict["user_id"], SQS_USER_FOLLOWERS
-                    )
-                    props_dict = {
-                        "follower_status": "queued",
-                        "last_updated": datetime.now(timezone.utc).isoformat(),
-                    }
-                    self.neptune_handler.update_node_attributes(
-                        label="User",
-                        node_id=follower_dict["user_id"],
-                        props_dict=props_dict,
-                    )
+                self.push_candidate(follower_dict)
 
             self.neptune_handler.create_follower_edge(
                 follower_dict["user_id"], self.user_id
             )
 
+    def process_followers_page_with_stubs(
+        self, followers_page, existing_follower_ids
+    ):
+        """
+        Same as process_followers_page, but followers outside the city,
+        which are never crawled, only get a stub node. Stubs and edges are
+        written STUB_WRITE_BATCH_SIZE at a time. Stubs whose location now
+        matches the city are promoted to full users.
+
+        Args:
+        ----------
+            - followers_page (list): List of user dicts
+            - existing_follower_ids (list): followers already in the graph
+        """
+        follower_ids = [
+            str(follower_dict["user_id"]) for follower_dict in followers_page
+        ]
+        known_ids = self.neptune_handler.get_existing_user_ids(follower_ids)
+        stub_ids = self.neptune_handler.get_stub_user_ids(list(known_ids))
+        self.existing_users_counter += len(existing_follower_ids) + len(
+            known_ids
+        )
+
+        stubs = []
+        for follower_dict in followers_page:
+            follower_id = str(follower_dict["user_id"])
+            in_city = follower_dict["city"] == follower_dict["target_location"]
+            if follower_id in known_ids:
+                if not (in_city and follower_id in stub_ids):
+                    continue
+                self.neptune_handler.promote_user_node(follower_dict)
+            elif in_city:
+                self.neptune_handler.create_user_node(follower_dict)
+            else:
+                stubs.append(follower_dict)
+                continue
+            self.push_candidate(follower_dict)
+
+        for index in range(0, len(stubs), STUB_WRITE_BATCH_SIZE):
+            self.neptune_handler.create_stub_user_nodes(
+                stubs[index : index + STUB_WRITE_BATCH_SIZE]
+            )
+        self.stubs_counter += len(stubs)
+
+        edge_ids = list(existing_follower_ids) + follower_ids
+        for index in range(0, len(edge_ids), STUB_WRITE_BATCH_SIZE):
+            self.neptune_handler.create_follower_edges(
+                edge_ids[index : index + STUB_WRITE_BATCH_SIZE], self.user_id
+            )
+
+    def push_candidate(self, follower_dict):
+        """
+        Pushes a new follower to the frontier if it is worth crawling
+        """
+        if (
+            self.further_extraction
+            and (follower_dict["city"] == follower_dict["target_location"])
+            and (
+                follower_dict["followers_count"]
+                > INFLUENCER_FOLLOWERS_THRESHOLD
+            )
+            and (follower_dict["tweets_count"] > 0)
+        ):
+            self.candidates_counter += self.frontier.push(
+                follower_dict, depth=self.depth + 1
+            )
+
+    def complete_followers_extraction(self):
+        """
+        Marks the root user's follower extraction as completed and releases
+        the best frontier candidates
+        """
+        # Start Neptune client
+        self.neptune_handler.start()
+
         props_dict = {}
+        # Followers come newest first, the next incremental crawl stops here
+        if self.newest_follower_id:
+            props_dict["follower_high_water_mark"] = self.newest_follower_id
         props_dict["follower_status"] = "completed"
         props_dict["follower_last_processed"] = datetime.now(
             timezone.utc
@@ -374,12 +918,55 @@ class UserFollowers:
             props_dict=props_dict,
         )
 
+        released_counter = 0
+        if self.further_extraction:
+            released_counter = self.release_candidates()
+
         # Stop Neptune client
         self.neptune_handler.stop()
 
         print(
-            f"### Root users identified: {root_users_counter}, Existing users: {existing_users_counter} ###"
+            f"### Frontier candidates: {self.candidates_counter}, Released users: {released_counter}, Existing users: {self.existing_users_counter}, Stubs: {self.stubs_counter} ###"
+        )
+
+
+def flush_frontier(
+    frontier, sqs_client, neptune_handler, dedup_store, release_size
+):
+    """
+    Releases the best pending candidates of every city. Run while the
+    queue is empty, since releases otherwise only follow a processed user.
+
+    Args:
+        - frontier (CrawlFrontier)
+        - sqs_client: SQS client
+        - neptune_handler (NeptuneHandler)
+        - dedup_store: dispatch dedup store
+        - release_size (int): candidates released per city
+    """
+    locations = frontier.pending_locations()
+    if not locations:
+        return
+
+    neptune_handler.start()
+    for location in locations:
+        dispatcher = UserFollowers(
+            user_id=None,
+            location=location,
+            further_extraction=True,
+            sqs_client=sqs_client,
+            receipt_handle=None,
+            neptune_handler=neptune_handler,
+            dedup_store=dedup_store,
+            frontier=frontier,
+            checkpoint_store=None,
+            profile_store=None,
+            release_size=release_size,
         )
+        released_counter = dispatcher.release_candidates()
+        if released_counter:
+            print(f"Released {released_counter} candidates of {location}")
+    neptune_handler.stop()
 
 
 if __name__ == "__main__":
@@ -387,7 +974,10 @@ if __name__ == "__main__":
         "Parameters to get followers data to generate a network"
     )
     parser.add_argument(
-        "--num_followers", type=int, help="Number of followers to get"
+        "--num_followers",
+        type=int,
+        default=DEFAULT_NUM_FOLLOWERS,
+        help="Number of followers to get",
     )
     parser.add_argument(
         "--extraction_type",
@@ -405,18 +995,81 @@ if __name__ == "__main__":
         action="store_true",
         help="Enable further extraction of retweeters and followers",
     )
+    parser.add_argument(
+        "--follower_ids",
+        action="store_true",
+        help="Page follower ids and only hydrate users missing from the graph",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only extract followers newer than the ones already in the graph",
+    )
+    parser.add_argument(
+        "--max_depth",
+        type=int,
+        default=FRONTIER_MAX_DEPTH,
+        help="Maximum hops away from the city's root users to crawl",
+    )
+    parser.add_argument(
+        "--city_budget",
+        type=int,
+        default=FRONTIER_CITY_BUDGET,
+        help="Maximum number of users released from the frontier per city",
+    )
+    parser.add_argument(
+        "--release_size",
+        type=int,
+        default=FRONTIER_RELEASE_SIZE,
+        help="Users released from the frontier after each processed user",
+    )
+    parser.add_argument(
+        "--out_of_city_users",
+        type=str,
+        choices=["full", "stub"],
+        default=OUT_OF_CITY_USERS,
+        help="Write followers outside the city as full users or as stubs",
+    )
+    parser.add_argument(
+        "--adaptive_sampling",
+        action="store_true",
+        help="Adapt the followers extracted per user to their in-city share",
+    )
+    parser.add_argument(
+        "--queue_backend",
+        type=str,
+        choices=["sqs", "local"],
+        default=QUEUE_BACKEND,
+        help="Consume from AWS SQS or from the local SQLite queues",
+    )
+    parser.add_argument(
+        "--dedup_backend",
+        type=str,
+        choices=["local", "dynamodb"],
+        default=DEDUP_BACKEND,
+        help="Store used to skip users already dispatched in this crawl window",
+    )
 
     print("Parsing arguments...")
     print()
     args = parser.parse_args()
 
-    sqs_client = boto3.client("sqs", region_name="us-west-1")
+    sqs_client = create_sqs_client(args.queue_backend)
     user_followers_queue_url = sqs_client.get_queue_url(
         QueueName=SQS_USER_FOLLOWERS
     )["QueueUrl"]
     neptune_handler = NeptuneHandler(NEPTUNE_ENDPOINT)
+    dedup_store = create_dedup_store(args.dedup_backend)
+    frontier = CrawlFrontier(
+        max_depth=args.max_depth, city_budget=args.city_budget
+    )
+    checkpoint_store = CheckpointStore()
+    profile_store = ProfileStore()
 
     user_counter = 0
+    # A single event loop for the worker's lifetime, so the twikit
+    # clients (and their connections) are reused across messages
+    runner = asyncio.Runner()
 
     while True:
         # Pass Queue Name and get its URL
@@ -433,11 +1086,20 @@ if __name__ == "__main__":
         except KeyError:
             # Empty queue
             print("Empty queue")
+            if args.further_extraction:
+                flush_frontier(
+                    frontier,
+                    sqs_client,
+                    neptune_handler,
+                    dedup_store,
+                    args.release_size,
+                )
             continue
 
         # Getting information from body message
         root_user_id = str(clean_data["user_id"])
         location = clean_data["location"]
+        depth = clean_data.get("depth", 0)
         user_counter += 1
 
         print()
@@ -452,16 +1114,63 @@ if __name__ == "__main__":
             sqs_client=sqs_client,
             receipt_handle=receipt_handle,
             neptune_handler=neptune_handler,
+            dedup_store=dedup_store,
+            frontier=frontier,
+            checkpoint_store=checkpoint_store,
+            profile_store=profile_store,
+            depth=depth,
+            release_size=args.release_size,
+            out_of_city_users=args.out_of_city_users,
+        )
+
+        known_follower_ids = None
+        if args.incremental:
+            neptune_handler.start()
+            known_follower_ids = neptune_handler.get_follower_ids(root_user_id)
+            high_water_mark = neptune_handler.extract_node_attribute(
+                label="User",
+                node_id=root_user_id,
+                attribute_name="follower_high_water_mark",
+            )
+            neptune_handler.stop()
+            if high_water_mark:
+                known_follower_ids.add(str(high_water_mark))
+            print(f"Known followers: {len(known_follower_ids)}")
+
+        followers_count = None
+        if args.adaptive_sampling:
+            neptune_handler.start()
+            followers_count = neptune_handler.extract_node_attribute(
+                label="User",
+                node_id=root_user_id,
+                attribute_name="followers_count",
+            )
+            neptune_handler.stop()
+        sampler = FollowerSampler(
+            num_followers=args.num_followers,
+            followers_count=followers_count,
+            adaptive=args.adaptive_sampling,
         )
 
         if args.extraction_type == "twikit":
             print("Initiating twikit extraction...")
-            followers_list = asyncio.run(
-                user_followers.twikit_get_followers(
-                    follower_count=args.num_followers,
-                    account_num=args.account_num,
+            try:
+                num_followers = runner.run(
+                    user_followers.extract_and_process_followers(
+                        follower_count=args.num_followers,
+                        account_num=args.account_num,
+                        known_follower_ids=known_follower_ids,
+                        follower_ids_mode=args.follower_ids,
+                        sampler=sampler,
+                    )
                 )
-            )
+            except Exception as error:
+                # The message is redelivered, and resumes from the last
+                # checkpointed page
+                print(
+                    f"Unable to extract followers of {root_user_id}: {error!r}"
+                )
+                continue
         elif args.extraction_type == "X":
             raise Exception(
                 "X API Followers endpoint is only supported for Enterprise"
@@ -470,10 +1179,12 @@ if __name__ == "__main__":
             #     follower_count=args.num_followers
             # )
 
-        print(f"### Total Followers extracted: {len(followers_list)} ###")
+        print(f"### Total Followers extracted: {num_followers} ###")
 
-        if (len(followers_list) == 0) and (
-            not user_followers.protected_account
+        if (
+            (num_followers == 0)
+            and (not user_followers.protected_account)
+            and (not user_followers.up_to_date)
         ):
             print("Follower extraction FAILED. Moving on to the next user.\n")
             props_dict = {
@@ -492,8 +1203,7 @@ if __name__ == "__main__":
             neptune_handler.stop()
             continue
 
-        print("Processing and dispatching followers...")
-        user_followers.process_and_dispatch_followers(followers_list)
+        user_followers.complete_followers_extraction()
 
         # Delete root user message from queue so it is not picked up again
         print("Deleting user message from queue")
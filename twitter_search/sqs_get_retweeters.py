@@ -4,24 +4,32 @@ Script to get a determined tweet's retweeters
 
 import asyncio
 import json
-import time
 from argparse import ArgumentParser
 from datetime import datetime, timezone
-from pathlib import Path
 
-import boto3
 import twikit
+from config_utils.checkpoint_store import CheckpointStore
 from config_utils.constants import (
+    DEDUP_BACKEND,
     FIFTEEN_MINUTES,
+    FRONTIER_CITY_BUDGET,
+    FRONTIER_MAX_DEPTH,
+    FRONTIER_RELEASE_SIZE,
     INFLUENCER_FOLLOWERS_THRESHOLD,
     NEPTUNE_ENDPOINT,
+    QUEUE_BACKEND,
+    RETWEETERS_PAGE_SIZE,
     SQS_USER_FOLLOWERS,
     SQS_USER_RETWEETERS,
     SQS_USER_TWEETS,
     TWENTYFIVE_MINUTES,
-    TWIKIT_COOKIES_DICT,
 )
+from config_utils.crawl_frontier import CrawlFrontier
+from config_utils.dedup_store import create_dedup_store
 from config_utils.neptune_handler import NeptuneHandler
+from config_utils.profile_store import ProfileStore
+from config_utils.queue_handler import create_sqs_client
+from config_utils.twikit_clients import get_twikit_client
 from config_utils.util import (
     check_location,
     client_creator,
@@ -31,13 +39,30 @@ from config_utils.util import (
 
 class UserRetweeters:
     def __init__(
-        self, user_id, location, further_extraction, sqs_client, neptune_handler
+        self,
+        user_id,
+        location,
+        further_extraction,
+        sqs_client,
+        neptune_handler,
+        dedup_store,
+        frontier,
+        checkpoint_store,
+        profile_store,
+        depth=0,
+        release_size=FRONTIER_RELEASE_SIZE,
     ):
         self.user_id = user_id
         self.location = location
         self.further_extraction = further_extraction
         self.sqs_client = sqs_client
         self.neptune_handler = neptune_handler
+        self.dedup_store = dedup_store
+        self.frontier = frontier
+        self.checkpoint_store = checkpoint_store
+        self.profile_store = profile_store
+        self.depth = depth
+        self.release_size = release_size
 
     def parse_x_users(self, user_list):
         """
@@ -157,24 +182,35 @@ class UserRetweeters:
         ---------
             - retweeters_list (list): List with retweeters info
         """
-        client = twikit.Client("en-US")
-        cookies_dir = TWIKIT_COOKIES_DICT[f"account_{account_num}"]
-        cookies_dir = Path(__file__).parent.parent / cookies_dir
-        client.load_cookies(cookies_dir)
-        queue_url = self.sqs_client.get_queue_url(
-            QueueName=SQS_USER_RETWEETERS
-        )["QueueUrl"]
-        retweeters_dict = {}
-        extracted_retweeters = 0
-        num_iter = 0
+        client = get_twikit_client(account_num)
+        response = await asyncio.to_thread(
+            self.sqs_client.get_queue_url, QueueName=SQS_USER_RETWEETERS
+        )
+        queue_url = response["QueueUrl"]
+
+        # Resume from the last completed page of a previous attempt
+        task_key = f"retweeters#{tweet_id}"
+        cursor, num_iter, retweeters_dict = self.checkpoint_store.load(task_key)
+        if num_iter:
+            print(f"Resuming retweeters extraction after page {num_iter}")
+            if cursor is None:
+                self.checkpoint_store.delete(task_key)
+                return list(retweeters_dict.values())
+        else:
+            retweeters_dict = {}
+        extracted_retweeters = len(retweeters_dict)
 
         flag = False
         for _ in range(3):
             try:
                 retweeters = await client.get_retweeters(
-                    tweet_id, count=num_retweeters
+                    tweet_id, count=num_retweeters, cursor=cursor
                 )
                 if not retweeters:
+                    if num_iter:
+                        # The previous attempt stopped at the last page
+                        self.checkpoint_store.delete(task_key)
+                        return list(retweeters_dict.values())
                     print("API call was successful but no output extracted")
                     return []
                 flag = True
@@ -182,30 +218,32 @@ class UserRetweeters:
                 retweeters_dict = retweeters_dict | parsed_retweeters
                 extracted_retweeters += len(parsed_retweeters)
                 num_iter += 1
+                self.checkpoint_store.save(
+                    task_key, retweeters.next_cursor, num_iter, retweeters_dict
+                )
                 break
             except twikit.errors.TooManyRequests:
                 print("Retweeters: Too Many Requests")
-                self.sqs_client.change_message_visibility(
+                await asyncio.to_thread(
+                    self.sqs_client.change_message_visibility,
                     QueueUrl=queue_url,
                     ReceiptHandle=receipt_handle,
                     VisibilityTimeout=TWENTYFIVE_MINUTES,
                 )
-                time.sleep(FIFTEEN_MINUTES)
+                await asyncio.sleep(FIFTEEN_MINUTES)
                 continue
             except Exception as e:
                 print(f"Retweeter extraction failed: {e}")
                 continue
 
         if not flag:
+            # The checkpoint is kept, so the retry resumes from it
             print("No retweeters extracted despite 3 retry attempts")
             return []
 
         while extracted_retweeters < num_retweeters:
             try:
-                if num_iter == 1:
-                    more_retweeters = await retweeters.next()
-                else:
-                    more_retweeters = await more_retweeters.next()
+                more_retweeters = await retweeters.next()
                 if more_retweeters:
                     more_parsed_retweeters = self.parse_twikit_users(
                         more_retweeters
@@ -213,17 +251,25 @@ class UserRetweeters:
                     retweeters_dict = retweeters_dict | more_parsed_retweeters
                     extracted_retweeters += len(more_parsed_retweeters)
                     num_iter += 1
+                    retweeters = more_retweeters
+                    self.checkpoint_store.save(
+                        task_key,
+                        retweeters.next_cursor,
+                        num_iter,
+                        retweeters_dict,
+                    )
                 else:
                     print("No more retweeters available")
                     break
             except twikit.errors.TooManyRequests:
                 print("Retweeters: Too Many Requests")
-                self.sqs_client.change_message_visibility(
+                await asyncio.to_thread(
+                    self.sqs_client.change_message_visibility,
                     QueueUrl=queue_url,
                     ReceiptHandle=receipt_handle,
                     VisibilityTimeout=TWENTYFIVE_MINUTES,
                 )
-                time.sleep(FIFTEEN_MINUTES)
+                await asyncio.sleep(FIFTEEN_MINUTES)
                 continue
             except twikit.errors.BadRequest:
                 print("Retweeters: Bad Request")
@@ -234,17 +280,28 @@ class UserRetweeters:
             if num_iter % 5 == 0:
                 print(f"Processed {num_iter} retweeters batches")
 
+        self.checkpoint_store.delete(task_key)
         return list(retweeters_dict.values())
 
     def x_get_single_tweet_retweeters(self, tweet_id, num_retweeters):
         """
         Pull up to 500 retweeters via v2, then parse.
         """
-        retweeters_list = []
-        next_token = None
         x_client = client_creator()
 
+        # Resume from the last completed page of a previous attempt
+        task_key = f"retweeters#{tweet_id}"
+        next_token, num_pages, retweeters_list = self.checkpoint_store.load(
+            task_key
+        )
+        if num_pages:
+            print(f"Resuming retweeters extraction after page {num_pages}")
+        else:
+            retweeters_list = []
+
         while len(retweeters_list) < num_retweeters:
+            if num_pages and not next_token:
+                break
             response = x_client.get_retweeters(
                 id=tweet_id,
                 max_results=num_retweeters,
@@ -266,40 +323,75 @@ class UserRetweeters:
             if not retweeters:
                 break
             retweeters_list.extend(retweeters)
+            num_pages += 1
+            next_token = response.meta.get("next_token")
+            self.checkpoint_store.save(
+                task_key, next_token, num_pages, retweeters_list
+            )
 
             if len(retweeters) >= num_retweeters:
                 break
 
-            next_token = response.meta.get("next_token")
-            if not next_token:
-                break
+        self.checkpoint_store.delete(task_key)
 
-        return self.parse_x_users(retweeters)
+        return self.parse_x_users(retweeters_list)
 
-    def send_to_queue(self, user_id, queue_name):
+    def send_to_queue(self, user_id, queue_name, depth):
         """
-        Sends twikit or X user to the corresponding queue
+        Sends twikit or X user to the corresponding queue, unless
+        they were already dispatched to it in the current crawl window
 
         Args:
             - user_id (str)
             - queue_name (str)
+            - depth (int): hops away from the city's root users
         """
-        queue_url = self.sqs_client.get_queue_url(QueueName=queue_name)[
-            "QueueUrl"
-        ]
+        if not self.dedup_store.claim(queue_name, user_id):
+            print(f"User {user_id} already dispatched to {queue_name}")
+            return
 
         message = {
             "user_id": user_id,
             "location": self.location,
+            "depth": depth,
         }
         try:
+            queue_url = self.sqs_client.get_queue_url(QueueName=queue_name)[
+                "QueueUrl"
+            ]
             self.sqs_client.send_message(
                 QueueUrl=queue_url,
                 MessageBody=json.dumps(message),
             )
         except Exception as err:
+            self.dedup_store.release(queue_name, user_id)
             print(f"Unable to send user {user_id} to  {queue_name} SQS: {err}")
 
+    def release_candidates(self):
+        """
+        Sends the city's best pending candidates from the frontier to the
+        tweets and followers queues. Must be called with the Neptune client
+        started.
+
+        Returns:
+            - num_released (int)
+        """
+        released = self.frontier.release(self.location, self.release_size)
+        for user_id, depth in released:
+            self.send_to_queue(user_id, SQS_USER_TWEETS, depth)
+            self.send_to_queue(user_id, SQS_USER_FOLLOWERS, depth)
+            props_dict = {
+                "follower_status": "queued",
+                "last_updated": datetime.now(timezone.utc).isoformat(),
+            }
+            self.neptune_handler.update_node_attributes(
+                label="User",
+                node_id=user_id,
+                props_dict=props_dict,
+            )
+
+        return len(released)
+
     def process_and_dispatch_retweeters(self, tweet_id, user_retweeters_list):
         """
         Process retweeters and save it to Neptune/SQS accordingly.
@@ -309,45 +401,52 @@ class UserRetweeters:
             - tweet_id (str)
             - user_retweeters_list (list): List of user dicts
         """
+        self.profile_store.put_many(user_retweeters_list)
+
         # Start Neptune client
         self.neptune_handler.start()
 
         existing_users_counter = 0
-        root_users_counter = 0
+        candidates_counter = 0
+
+        # Followers written as stubs become full users once they retweet
+        stub_ids = self.neptune_handler.get_stub_user_ids(
+            [
+                str(retweeter_dict["user_id"])
+                for retweeter_dict in user_retweeters_list
+            ]
+        )
 
         for retweeter_dict in user_retweeters_list:
-            if self.neptune_handler.user_exists(retweeter_dict["user_id"]):
+            if str(retweeter_dict["user_id"]) in stub_ids:
+                self.neptune_handler.promote_user_node(retweeter_dict)
+                new_user = True
+            elif self.neptune_handler.user_exists(retweeter_dict["user_id"]):
                 existing_users_counter += 1
+                new_user = False
+                if self.further_extraction:
+                    self.frontier.record_retweet(
+                        self.location, retweeter_dict["user_id"]
+                    )
             else:
                 self.neptune_handler.create_user_node(retweeter_dict)
-                if (
-                    self.further_extraction
-                    and (
-                        retweeter_dict["city"]
-                        == retweeter_dict["target_location"]
-                    )
-                    and (
-                        retweeter_dict["followers_count"]
-                        > INFLUENCER_FOLLOWERS_THRESHOLD
-                    )
-                    and (retweeter_dict["tweets_count"] > 0)
-                ):
-                    root_users_counter += 1
-                    self.send_to_queue(
-                        retweeter_dict["user_id"], SQS_USER_TWEETS
-                    )
-                    self.send_to_queue(
-                        retweeter_dict["user_id"], SQS_USER_FOLLOWERS
-                    )
-                    props_dict = {
-                        "follower_status": "queued",
-                        "last_updated": datetime.now(timezone.utc).isoformat(),
-                    }
-                    self.neptune_handler.update_node_attributes(
-                        label="User",
-                        node_id=retweeter_dict["user_id"],
-                        props_dict=props_dict,
-                    )
+                new_user = True
+
+            if (
+                new_user
+                and self.further_extraction
+                and (
+                    retweeter_dict["city"] == retweeter_dict["target_location"]
+                )
+                and (
+                    retweeter_dict["followers_count"]
+                    > INFLUENCER_FOLLOWERS_THRESHOLD
+                )
+                and (retweeter_dict["tweets_count"] > 0)
+            ):
+                candidates_counter += self.frontier.push(
+                    retweeter_dict, depth=self.depth + 1, retweets=1
+                )
 
             self.neptune_handler.create_retweeter_edge(
                 source_id=retweeter_dict["user_id"],
@@ -355,189 +454,411 @@ class UserRetweeters:
                 tweet_id=tweet_id,
             )
 
+        released_counter = 0
+        if self.further_extraction:
+            released_counter = self.release_candidates()
+
         # Stop Neptune client
         self.neptune_handler.stop()
 
         print(
-            f"Root users identified: {root_users_counter}, Existing users: {existing_users_counter}"
+            f"Frontier candidates: {candidates_counter}, Released users: {released_counter}, Existing users: {existing_users_counter}"
         )
 
 
-if __name__ == "__main__":
-    parser = ArgumentParser(
-        "Parameters to get Retweeters data to generate a network"
-    )
-    parser.add_argument(
-        "--num_retweeters", type=int, help="Number of retweeters to get"
-    )
-    parser.add_argument(
-        "--extraction_type",
-        type=str,
-        choices=["twikit", "X"],
-        help="Choose how to get user's tweets",
+def complete_retweeter_extraction(neptune_handler, user_id):
+    """
+    Marks a target user's retweeter extraction as completed
+
+    Args:
+        - neptune_handler (NeptuneHandler)
+        - user_id (str)
+    """
+    props_dict = {
+        "retweeter_status": "completed",
+        "retweeter_last_processed": datetime.now(timezone.utc).isoformat(),
+    }
+    props_dict["last_updated"] = props_dict["retweeter_last_processed"]
+    neptune_handler.start()
+    neptune_handler.update_node_attributes(
+        label="User",
+        node_id=user_id,
+        props_dict=props_dict,
     )
-    parser.add_argument(
-        "--account_num",
-        type=int,
-        help="Account number to use with twikit",
-    )
-    parser.add_argument(
-        "--further_extraction",
-        action="store_true",
-        help="Enable further extraction of retweeters and followers",
+    neptune_handler.stop()
+
+
+def get_retweeter_status(neptune_handler, user_id):
+    """
+    Gets a target user's retweeter_status
+
+    Args:
+        - neptune_handler (NeptuneHandler)
+        - user_id (str)
+    """
+    neptune_handler.start()
+    retweeter_status = neptune_handler.extract_node_attribute(
+        label="User",
+        node_id=user_id,
+        attribute_name="retweeter_status",
     )
+    neptune_handler.stop()
 
-    print("Parsing arguments...")
-    print()
-    args = parser.parse_args()
+    return retweeter_status
 
-    sqs_client = boto3.client("sqs", region_name="us-west-1")
-    user_retweeters_queue_url = sqs_client.get_queue_url(
-        QueueName=SQS_USER_RETWEETERS
-    )["QueueUrl"]
-    neptune_handler = NeptuneHandler(NEPTUNE_ENDPOINT)
 
-    tmp_user_id = None
-    user_counter = 0
-    tweet_counter = 0
+def flush_frontier(frontier, sqs_client, dedup_store, release_size):
+    """
+    Releases the best pending candidates of every city. Run while the
+    queue is empty, since releases otherwise only follow a processed user.
 
-    while True:
-        response = sqs_client.receive_message(
-            QueueUrl=user_retweeters_queue_url,
-            MaxNumberOfMessages=1,
-            WaitTimeSeconds=10,
-        )
-        try:
-            message = response["Messages"][0]
-            receipt_handle = message["ReceiptHandle"]
-            clean_data = json.loads(message["Body"])
+    Args:
+        - frontier (CrawlFrontier)
+        - sqs_client: SQS client
+        - dedup_store: dispatch dedup store
+        - release_size (int): candidates released per city
+    """
+    locations = frontier.pending_locations()
+    if not locations:
+        return
 
-        except KeyError:
-            # Empty queue
-            if tmp_user_id is not None:
-                print("----------------------------")
-                print("Updating retweeter status and last processed")
-                props_dict = {
-                    "retweeter_status": "completed",
-                    "retweeter_last_processed": datetime.now(
-                        timezone.utc
-                    ).isoformat(),
-                }
-                props_dict["last_updated"] = props_dict[
-                    "retweeter_last_processed"
-                ]
-                neptune_handler.start()
-                neptune_handler.update_node_attributes(
-                    label="User",
-                    node_id=tmp_user_id,
-                    props_dict=props_dict,
-                )
-                neptune_handler.stop()
-                print(f"### Total tweets processed: {tweet_counter} ###")
-                print()
-                tmp_user_id = None
-                target_user_id = None
-            print("Empty queue")
-            continue
-
-        # Getting information from body message
-        tweet_id = str(clean_data["tweet_id"])
-        target_user_id = str(clean_data["target_user_id"])
-        location = clean_data["location"]
-
-        # Check if target user has changed
-        if tmp_user_id != target_user_id:
-            neptune_handler.start()
-            if tmp_user_id is not None:
-                print("----------------------------")
-                print("Updating retweeter status and last processed")
-                props_dict = {
-                    "retweeter_status": "completed",
-                    "retweeter_last_processed": datetime.now(
-                        timezone.utc
-                    ).isoformat(),
-                }
-                props_dict["last_updated"] = props_dict[
-                    "retweeter_last_processed"
-                ]
-                neptune_handler.update_node_attributes(
-                    label="User",
-                    node_id=tmp_user_id,
-                    props_dict=props_dict,
-                )
-                print(f"### Total tweets processed: {tweet_counter} ###")
-            retweeter_status = neptune_handler.extract_node_attribute(
-                label="User",
-                node_id=target_user_id,
-                attribute_name="retweeter_status",
-            )
-
-            neptune_handler.stop()
+    neptune_handler = NeptuneHandler(NEPTUNE_ENDPOINT)
+    neptune_handler.start()
+    for location in locations:
+        dispatcher = UserRetweeters(
+            user_id=None,
+            location=location,
+            further_extraction=True,
+            sqs_client=sqs_client,
+            neptune_handler=neptune_handler,
+            dedup_store=dedup_store,
+            frontier=frontier,
+            checkpoint_store=None,
+            profile_store=None,
+            release_size=release_size,
+        )
+        released_counter = dispatcher.release_candidates()
+        if released_counter:
+            print(f"Released {released_counter} candidates of {location}")
+    neptune_handler.stop()
+
+
+async def process_message_group(
+    group_messages,
+    args,
+    sqs_client,
+    queue_url,
+    dedup_store,
+    frontier,
+    checkpoint_store,
+    profile_store,
+):
+    """
+    Extracts the retweeters of the tweets from a single message group
+    (i.e. a single target user), in the order they were queued.
+
+    The target user's retweeter_status is completed once the message
+    flagged as 'last_tweet' is processed, if every message of the group
+    was deleted. Otherwise the status stays 'queued' and the last message
+    is left in the queue too, so FIFO ordering redelivers it after the
+    failed ones and the user is completed once they all succeed.
+
+    Gremlin clients run their own event loop, and boto3 calls block, so
+    every Neptune and SQS call is made from a thread.
+
+    Args:
+        - group_messages (list): list of (receipt_handle, body dict) tuples
+        - args (Namespace): parsed command line arguments
+        - sqs_client: SQS client
+        - queue_url (str)
+        - dedup_store: dispatch dedup store
+        - frontier (CrawlFrontier)
+        - checkpoint_store (CheckpointStore)
+        - profile_store (ProfileStore)
+    """
+    target_user_id = str(group_messages[0][1]["target_user_id"])
+    location = group_messages[0][1]["location"]
+
+    # Each group starts and stops its own client
+    neptune_handler = NeptuneHandler(NEPTUNE_ENDPOINT)
+    retweeter_status = await asyncio.to_thread(
+        get_retweeter_status, neptune_handler, target_user_id
+    )
 
-            if not retweeter_status:
-                raise ValueError("retweeter_status cannot return NULL value")
+    if not retweeter_status:
+        raise ValueError("retweeter_status cannot return NULL value")
 
-            if retweeter_status == "pending":
-                print(
-                    f"Target user {target_user_id} not ready for retweeter extraction"
-                )
-                continue
+    if retweeter_status == "pending":
+        # Messages become visible again after the visibility timeout
+        print(
+            f"Target user {target_user_id} not ready for retweeter extraction"
+        )
+        return
 
-            user_counter += 1
-            tweet_counter = 0
+    # Keep the group's later messages hidden while earlier ones are processed
+    for receipt_handle, _ in group_messages[1:]:
+        await asyncio.to_thread(
+            sqs_client.change_message_visibility,
+            QueueUrl=queue_url,
+            ReceiptHandle=receipt_handle,
+            VisibilityTimeout=TWENTYFIVE_MINUTES,
+        )
 
-            print()
-            print(
-                f"Beginning retweeters extraction for User {user_counter} with ID {target_user_id}"
-            )
+    print(
+        f"Beginning retweeters extraction for {len(group_messages)} tweets of user {target_user_id}"
+    )
+    user_retweeters = UserRetweeters(
+        user_id=target_user_id,
+        location=location,
+        further_extraction=args.further_extraction,
+        sqs_client=sqs_client,
+        neptune_handler=neptune_handler,
+        dedup_store=dedup_store,
+        frontier=frontier,
+        checkpoint_store=checkpoint_store,
+        profile_store=profile_store,
+        depth=group_messages[0][1].get("depth", 0),
+        release_size=args.release_size,
+    )
 
-            # Creating new class object
-            user_retweeters = UserRetweeters(
-                user_id=target_user_id,
-                location=location,
-                further_extraction=args.further_extraction,
-                sqs_client=sqs_client,
-                neptune_handler=neptune_handler,
+    all_deleted = True
+    for receipt_handle, clean_data in group_messages:
+        last_tweet = clean_data.get("last_tweet", False)
+        tweet_id = str(clean_data["tweet_id"])
+        print(f"---- User {target_user_id} - Tweet {tweet_id} ----")
+        # Stop at the pages the tweet was budgeted for
+        num_retweeters = args.num_retweeters
+        if "expected_pages" in clean_data:
+            num_retweeters = min(
+                num_retweeters,
+                clean_data["expected_pages"] * RETWEETERS_PAGE_SIZE,
             )
 
-            # Re-aligning extraction focus on new target user
-            tmp_user_id = target_user_id
-
-        tweet_counter += 1
-        print(f"----Tweet {tweet_counter}---")
-
         if args.extraction_type == "twikit":
-            print("Initiating twikit extraction...")
-            user_retweeters_list = asyncio.run(
-                user_retweeters.twikit_get_single_tweet_retweeters(
+            user_retweeters_list = (
+                await user_retweeters.twikit_get_single_tweet_retweeters(
                     tweet_id=tweet_id,
-                    num_retweeters=args.num_retweeters,
+                    num_retweeters=num_retweeters,
                     account_num=args.account_num,
                     receipt_handle=receipt_handle,
                 )
             )
         elif args.extraction_type == "X":
-            print("Initiating X API extraction...")
-            user_retweeters_list = (
-                user_retweeters.x_get_single_tweet_retweeters(
-                    tweet_id=tweet_id, num_retweeters=args.num_retweeters
-                )
+            user_retweeters_list = await asyncio.to_thread(
+                user_retweeters.x_get_single_tweet_retweeters,
+                tweet_id=tweet_id,
+                num_retweeters=num_retweeters,
             )
 
-        print(f"Retweeters extracted: {len(user_retweeters_list)}")
+        print(
+            f"Retweeters extracted for {tweet_id}: {len(user_retweeters_list)}"
+        )
 
         if len(user_retweeters_list) == 0:
             print("Retweeter extraction FAILED. Moving on to the next tweet.")
+            all_deleted = False
             continue
 
         print("Processing and dispatching retweeters...")
-        user_retweeters.process_and_dispatch_retweeters(
-            tweet_id, user_retweeters_list
+        await asyncio.to_thread(
+            user_retweeters.process_and_dispatch_retweeters,
+            tweet_id,
+            user_retweeters_list,
         )
 
+        if last_tweet and not all_deleted:
+            print(
+                f"Earlier tweets of user {target_user_id} failed, keeping its last tweet queued"
+            )
+            continue
+
         # Delete tweet message from queue so it is not picked up again
-        print("Deleting tweet message from queue")
-        sqs_client.delete_message(
-            QueueUrl=user_retweeters_queue_url,
+        await asyncio.to_thread(
+            sqs_client.delete_message,
+            QueueUrl=queue_url,
             ReceiptHandle=receipt_handle,
         )
+
+        if last_tweet:
+            print(f"Updating retweeter status for user {target_user_id}")
+            await asyncio.to_thread(
+                complete_retweeter_extraction, neptune_handler, target_user_id
+            )
+
+
+async def consume_retweeters_queue(
+    args, sqs_client, dedup_store, frontier, checkpoint_store, profile_store
+):
+    """
+    Consumes the retweeters FIFO queue, processing up to args.num_groups
+    message groups (target users) concurrently. Tweets within a group are
+    still processed sequentially.
+
+    Args:
+        - args (Namespace): parsed command line arguments
+        - sqs_client: SQS client
+        - dedup_store: dispatch dedup store
+        - frontier (CrawlFrontier)
+        - checkpoint_store (CheckpointStore)
+        - profile_store (ProfileStore)
+    """
+    queue_url = sqs_client.get_queue_url(QueueName=SQS_USER_RETWEETERS)[
+        "QueueUrl"
+    ]
+    active_groups = {}
+
+    while True:
+        # Drop finished groups and surface their errors
+        for group_id, task in list(active_groups.items()):
+            if task.done():
+                del active_groups[group_id]
+                if task.exception():
+                    print(f"Group {group_id} failed: {task.exception()}")
+
+        free_slots = args.num_groups - len(active_groups)
+        if free_slots <= 0:
+            await asyncio.wait(
+                active_groups.values(), return_when=asyncio.FIRST_COMPLETED
+            )
+            continue
+
+        # Receive in a thread so running groups keep making progress
+        response = await asyncio.to_thread(
+            sqs_client.receive_message,
+            QueueUrl=queue_url,
+            MaxNumberOfMessages=min(free_slots, 10),
+            WaitTimeSeconds=10,
+        )
+        if "Messages" not in response:
+            print("Empty queue")
+            if args.further_extraction and not active_groups:
+                await asyncio.to_thread(
+                    flush_frontier,
+                    frontier,
+                    sqs_client,
+                    dedup_store,
+                    args.release_size,
+                )
+            continue
+
+        groups = {}
+        for message in response["Messages"]:
+            clean_data = json.loads(message["Body"])
+            group_id = str(clean_data["target_user_id"])
+            groups.setdefault(group_id, []).append(
+                (message["ReceiptHandle"], clean_data)
+            )
+
+        for group_id, group_messages in groups.items():
+            previous_task = active_groups.get(group_id)
+            active_groups[group_id] = asyncio.create_task(
+                run_after(
+                    previous_task,
+                    process_message_group(
+                        group_messages,
+                        args,
+                        sqs_client,
+                        queue_url,
+                        dedup_store,
+                        frontier,
+                        checkpoint_store,
+                        profile_store,
+                    ),
+                )
+            )
+
+
+async def run_after(previous_task, coroutine):
+    """
+    Awaits a group's previous task (if any) before running the coroutine,
+    so a group is never processed by two tasks at once
+    """
+    if previous_task is not None:
+        await asyncio.gather(previous_task, return_exceptions=True)
+    await coroutine
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        "Parameters to get Retweeters data to generate a network"
+    )
+    parser.add_argument(
+        "--num_retweeters", type=int, help="Number of retweeters to get"
+    )
+    parser.add_argument(
+        "--extraction_type",
+        type=str,
+        choices=["twikit", "X"],
+        help="Choose how to get user's tweets",
+    )
+    parser.add_argument(
+        "--account_num",
+        type=int,
+        help="Account number to use with twikit",
+    )
+    parser.add_argument(
+        "--further_extraction",
+        action="store_true",
+        help="Enable further extraction of retweeters and followers",
+    )
+    parser.add_argument(
+        "--num_groups",
+        type=int,
+        default=4,
+        help="Number of target users (message groups) processed concurrently",
+    )
+    parser.add_argument(
+        "--max_depth",
+        type=int,
+        default=FRONTIER_MAX_DEPTH,
+        help="Maximum hops away from the city's root users to crawl",
+    )
+    parser.add_argument(
+        "--city_budget",
+        type=int,
+        default=FRONTIER_CITY_BUDGET,
+        help="Maximum number of users released from the frontier per city",
+    )
+    parser.add_argument(
+        "--release_size",
+        type=int,
+        default=FRONTIER_RELEASE_SIZE,
+        help="Users released from the frontier after each processed user",
+    )
+    parser.add_argument(
+        "--queue_backend",
+        type=str,
+        choices=["sqs", "local"],
+        default=QUEUE_BACKEND,
+        help="Consume from AWS SQS or from the local SQLite queues",
+    )
+    parser.add_argument(
+        "--dedup_backend",
+        type=str,
+        choices=["local", "dynamodb"],
+        default=DEDUP_BACKEND,
+        help="Store used to skip users already dispatched in this crawl window",
+    )
+
+    print("Parsing arguments...")
+    print()
+    args = parser.parse_args()
+
+    sqs_client = create_sqs_client(args.queue_backend)
+    dedup_store = create_dedup_store(args.dedup_backend)
+    frontier = CrawlFrontier(
+        max_depth=args.max_depth, city_budget=args.city_budget
+    )
+    checkpoint_store = CheckpointStore()
+    profile_store = ProfileStore()
+
+    asyncio.run(
+        consume_retweeters_queue(
+            args,
+            sqs_client,
+            dedup_store,
+            frontier,
+            checkpoint_store,
+            profile_store,
+        )
+    )
@@ -9,23 +9,30 @@ Last Updated: May 2025
 import asyncio
 import datetime
 import json
+import math
 import time
 from argparse import ArgumentParser
-from pathlib import Path
 
-import boto3
-import botocore
 import twikit
 from config_utils.constants import (
+    DEDUP_BACKEND,
     FIFTEEN_MINUTES,
     NEPTUNE_ENDPOINT,
-    NEPTUNE_S3_BUCKET,
+    QUEUE_BACKEND,
+    RETWEET_RECENCY_HALF_LIFE,
+    RETWEETER_PAGE_BUDGET,
+    RETWEETERS_PAGE_SIZE,
     SQS_USER_RETWEETERS,
     SQS_USER_TWEETS,
+    STORAGE_BACKEND,
     TWENTYFIVE_MINUTES,
-    TWIKIT_COOKIES_DICT,
 )
+from config_utils.dedup_store import create_dedup_store
 from config_utils.neptune_handler import NeptuneHandler
+from config_utils.queue_handler import create_sqs_client
+from config_utils.s3_writer import S3Writer
+from config_utils.tweet_packs import write_tweet_pack
+from config_utils.twikit_clients import get_twikit_client
 from config_utils.util import (
     client_creator,
     convert_to_iso_format,
@@ -34,14 +41,26 @@ from config_utils.util import (
 
 class UserTweets:
     def __init__(
-        self, user_id, location, sqs_client, receipt_handle, neptune_handler
+        self,
+        user_id,
+        location,
+        sqs_client,
+        receipt_handle,
+        neptune_handler,
+        dedup_store,
+        depth=0,
+        retweeter_budget=RETWEETER_PAGE_BUDGET,
+        s3_writer=None,
     ):
         self.user_id = user_id
         self.location = location
         self.sqs_client = sqs_client
-        self.s3_client = boto3.client("s3", region_name="us-east-2")
+        self.s3_writer = s3_writer or S3Writer()
         self.receipt_handle = receipt_handle
         self.neptune_handler = neptune_handler
+        self.dedup_store = dedup_store
+        self.depth = depth
+        self.retweeter_budget = retweeter_budget
 
     @staticmethod
     def parse_twikit_tweets(tweets):
@@ -113,10 +132,7 @@ class UserTweets:
             - dict_list (list): list of dictionaries
         """
         # We need to get tweets first
-        client = twikit.Client("en-US")
-        cookies_dir = TWIKIT_COOKIES_DICT[f"account_{account_num}"]
-        cookies_dir = Path(__file__).parent.parent / cookies_dir
-        client.load_cookies(cookies_dir)
+        client = get_twikit_client(account_num)
         queue_url = self.sqs_client.get_queue_url(QueueName=SQS_USER_TWEETS)[
             "QueueUrl"
         ]
@@ -227,41 +243,52 @@ class UserTweets:
 
         return list(parsed_tweets_dict.values())
 
-    def insert_tweet_to_s3(self, tweet):
+    def insert_tweets_to_s3(self, tweets_list):
         """
-        Function to insert each user's tweets as
-        a txt files to S3
+        Function to insert the user's tweets to S3,
+        packed in a single object. The write runs in the
+        background, see S3Writer.flush
 
         These tweets are already filtered
         """
-        s3_path = f"networks/{self.location}/classification/{self.user_id}/input/tweet_{tweet['tweet_id']}.txt"
-        try:
-            self.s3_client.put_object(
-                Bucket=NEPTUNE_S3_BUCKET,
-                Key=s3_path,
-                Body=tweet["tweet_text"].encode("utf-8", errors="ignore"),
-            )
-        except botocore.exceptions.ClientError:
-            print(f"Unable to upload {tweet['tweet_id']} for {self.user_id}")
+        self.s3_writer.submit(
+            f"tweets of {self.user_id}",
+            write_tweet_pack,
+            self.location,
+            self.user_id,
+            tweets_list,
+        )
 
-    def send_to_queue(self, tweet_id, queue_name):
+    def send_to_queue(
+        self, tweet_id, queue_name, last_tweet=False, expected_pages=1
+    ):
         """
-        Sends tweet objects to the corresponding queue
+        Sends tweet objects to the corresponding queue. All the tweets
+        of a user share the same message group, so consumers can process
+        several users in parallel while keeping each user's tweets in order.
+        The tweet is claimed in the dedup store once the message is sent.
 
         Args:
             - tweet_id (str): The tweet id
             - queue_name (str): Queue Name
+            - last_tweet (bool): Marks the user's last dispatched tweet
+            - expected_pages (int): Retweeter pages the tweet should take
+
+        Returns:
+            - sent (bool)
         """
-        queue_url = self.sqs_client.get_queue_url(QueueName=queue_name)[
-            "QueueUrl"
-        ]
-        # TODO: Modify group
         message = {
             "tweet_id": tweet_id,
             "target_user_id": self.user_id,
             "location": self.location,
+            "last_tweet": last_tweet,
+            "depth": self.depth,
+            "expected_pages": expected_pages,
         }
         try:
+            queue_url = self.sqs_client.get_queue_url(QueueName=queue_name)[
+                "QueueUrl"
+            ]
             self.sqs_client.send_message(
                 QueueUrl=queue_url,
                 MessageBody=json.dumps(message),
@@ -271,22 +298,82 @@ class UserTweets:
             print(
                 f"Unable to send tweet {tweet_id} for {self.user_id} to {queue_name} SQS: {err}"
             )
+            return False
+
+        self.dedup_store.claim(queue_name, tweet_id)
+        return True
+
+    def select_retweeted_tweets(self, tweets_list):
+        """
+        Ranks the original tweets with retweets by retweet_count, discounted
+        by age, and keeps the best ones until the user's budget of expected
+        retweeter pages is spent. The last selected tweet is capped at the
+        pages left in the budget
+
+        Args:
+        ----------
+            - tweets_list (list): list of original tweet dicts
+        Returns:
+        ----------
+            - selected (list): list of (tweet_dict, expected_pages) tuples,
+            best ranked first
+        """
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+        def score(tweet_dict):
+            created_at = datetime.datetime.fromisoformat(
+                tweet_dict["created_at"]
+            )
+            age_days = max((now - created_at).total_seconds(), 0) / 86400
+            return tweet_dict["retweet_count"] * 0.5 ** (
+                age_days / RETWEET_RECENCY_HALF_LIFE
+            )
+
+        retweeted_tweets = [
+            tweet_dict
+            for tweet_dict in tweets_list
+            if tweet_dict["retweet_count"] > 0
+        ]
+        selected = []
+        remaining_pages = self.retweeter_budget
+        for tweet_dict in sorted(retweeted_tweets, key=score, reverse=True):
+            # A tweet larger than what is left gets the remaining pages, so
+            # the best ranked tweets are never skipped for smaller ones
+            expected_pages = min(
+                math.ceil(tweet_dict["retweet_count"] / RETWEETERS_PAGE_SIZE),
+                remaining_pages,
+            )
+            selected.append((tweet_dict, expected_pages))
+            remaining_pages -= expected_pages
+            if remaining_pages == 0:
+                break
+
+        return selected
 
     def process_and_dispatch_tweets(self, tweets_list):
         """
         Filter tweets and save it to S3/Neptune accordingly.
 
+        Tweets are sent in order and dispatching stops at the first failed
+        send, so the message flagged as last_tweet is always the last one
+        sent. The failed tweets and the ones after them are sent when the
+        user's message is redelivered, tweets already sent in the current
+        crawl window being skipped.
+
         Args:
         ----------
             - tweets_list (list): list of tweet dicts
+        Returns:
+        ----------
+            - dispatched (bool): False if a tweet could not be sent, and
+            the user's message should be redelivered
         """
         # Start Neptune client
         self.neptune_handler.start()
 
         timestamps = []
 
-        s3_counter = 0
-        filtered_tweet_counter = 0
+        original_tweets = []
 
         for tweet_dict in tweets_list:
             timestamp = datetime.datetime.fromisoformat(
@@ -294,13 +381,34 @@ class UserTweets:
             )
             timestamps.append(timestamp)
             if not tweet_dict["tweet_text"].startswith("RT @"):
-                self.insert_tweet_to_s3(tweet_dict)
-                s3_counter += 1
-                if tweet_dict["retweet_count"] > 0:
-                    filtered_tweet_counter += 1
-                    self.send_to_queue(
-                        tweet_dict["tweet_id"], queue_name=SQS_USER_RETWEETERS
-                    )
+                original_tweets.append(tweet_dict)
+        self.insert_tweets_to_s3(original_tweets)
+
+        selected_tweets = self.select_retweeted_tweets(original_tweets)
+        # Skip tweets already queued in the current crawl window
+        retweeted_tweets = [
+            (tweet_dict, expected_pages)
+            for tweet_dict, expected_pages in selected_tweets
+            if not self.dedup_store.is_claimed(
+                SQS_USER_RETWEETERS, tweet_dict["tweet_id"]
+            )
+        ]
+
+        # The last message lets consumers close the user's message group
+        filtered_tweet_counter = 0
+        dispatched = True
+        for index, (tweet_dict, expected_pages) in enumerate(
+            retweeted_tweets, start=1
+        ):
+            if not self.send_to_queue(
+                tweet_dict["tweet_id"],
+                queue_name=SQS_USER_RETWEETERS,
+                last_tweet=(index == len(retweeted_tweets)),
+                expected_pages=expected_pages,
+            ):
+                dispatched = False
+                break
+            filtered_tweet_counter += 1
 
         last_tweeted_at = max(timestamps).isoformat() if timestamps else "null"
 
@@ -308,7 +416,8 @@ class UserTweets:
         props_dict = {}
         if filtered_tweet_counter > 0:
             props_dict["retweeter_status"] = "queued"
-        else:
+        # Tweets already queued by an earlier delivery keep their status
+        elif not selected_tweets:
             props_dict["retweeter_status"] = "completed"
             props_dict["retweeter_last_processed"] = datetime.datetime.now(
                 datetime.timezone.utc
@@ -327,9 +436,11 @@ class UserTweets:
         self.neptune_handler.stop()
 
         print(
-            f"### Original tweets: {s3_counter}, Tweets with retweets: {filtered_tweet_counter} ###"
+            f"### Original tweets: {len(original_tweets)}, Tweets with retweets: {filtered_tweet_counter} ###"
         )
 
+        return dispatched
+
 
 if __name__ == "__main__":
     parser = ArgumentParser(
@@ -349,18 +460,50 @@ if __name__ == "__main__":
         type=int,
         help="Account number to use with twikit",
     )
+    parser.add_argument(
+        "--queue_backend",
+        type=str,
+        choices=["sqs", "local"],
+        default=QUEUE_BACKEND,
+        help="Consume from AWS SQS or from the local SQLite queues",
+    )
+    parser.add_argument(
+        "--dedup_backend",
+        type=str,
+        choices=["local", "dynamodb"],
+        default=DEDUP_BACKEND,
+        help="Store used to skip tweets already dispatched in this crawl window",
+    )
+    parser.add_argument(
+        "--retweeter_budget",
+        type=int,
+        default=RETWEETER_PAGE_BUDGET,
+        help="Retweeter pages to spend per user, on its most retweeted tweets",
+    )
+    parser.add_argument(
+        "--storage_backend",
+        type=str,
+        choices=["s3", "local"],
+        default=STORAGE_BACKEND,
+        help="Write tweets to AWS S3 or to the local object store",
+    )
 
     print("Parsing arguments...")
     print()
     args = parser.parse_args()
 
-    sqs_client = boto3.client("sqs", region_name="us-west-1")
+    sqs_client = create_sqs_client(args.queue_backend)
     user_tweets_queue_url = sqs_client.get_queue_url(QueueName=SQS_USER_TWEETS)[
         "QueueUrl"
     ]
     neptune_handler = NeptuneHandler(NEPTUNE_ENDPOINT)
+    dedup_store = create_dedup_store(args.dedup_backend)
+    s3_writer = S3Writer(args.storage_backend)
 
     user_counter = 0
+    # A single event loop for the worker's lifetime, so the twikit
+    # clients (and their connections) are reused across messages
+    runner = asyncio.Runner()
 
     while True:
         # Pass Queue Name and get its URL
@@ -390,12 +533,20 @@ if __name__ == "__main__":
         )
 
         user_tweets = UserTweets(
-            root_user_id, location, sqs_client, receipt_handle, neptune_handler
+            root_user_id,
+            location,
+            sqs_client,
+            receipt_handle,
+            neptune_handler,
+            dedup_store,
+            clean_data.get("depth", 0),
+            args.retweeter_budget,
+            s3_writer,
         )
 
         if args.extraction_type == "twikit":
             print("Initiating twikit extraction...")
-            tweets_list = asyncio.run(
+            tweets_list = runner.run(
                 user_tweets.twikit_get_user_tweets(
                     num_tweets=args.tweet_count,
                     account_num=args.account_num,
@@ -410,7 +561,20 @@ if __name__ == "__main__":
         print(f"### Total tweets extracted: {len(tweets_list)} ###")
 
         print("Processing and dispatching tweets...")
-        user_tweets.process_and_dispatch_tweets(tweets_list)
+        dispatched = user_tweets.process_and_dispatch_tweets(tweets_list)
+
+        # The tweets are written to S3 while the graph is updated
+        if s3_writer.flush():
+            # Left in the queue, the message is redelivered and the tweets
+            # are uploaded again
+            print(f"Unable to upload the tweets of {root_user_id}")
+            continue
+
+        if not dispatched:
+            # Left in the queue, the message is redelivered and the unsent
+            # tweets are dispatched again
+            print(f"Unable to dispatch the tweets of {root_user_id}")
+            continue
 
         # Delete root user message from queue so it is not picked up again
         print("Deleting user message from queue")
@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+
+# The scripts run from twitter_search/, and import its packages as top-level
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
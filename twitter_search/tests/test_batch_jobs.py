@@ -0,0 +1,88 @@
+"""
+Runs a classification batch job end to end against the local stub
+"""
+
+import asyncio
+
+import pytest
+from llm_classification.batch_jobs import (
+    ClassificationBatchJob,
+    LocalBatchClient,
+)
+from llm_classification.constants import BATCH_INSTRUCTIONS, BATCH_PROMPT
+from llm_classification.prompts import build_batch_prompt
+from llm_classification.response_cache import (
+    CachedClassifier,
+    ResponseCache,
+    hash_prompt,
+)
+
+
+class StubClassifier(CachedClassifier):
+    """
+    Builds batch requests like GPTClassifier, without the OpenAI client
+    """
+
+    def __init__(self, cache=None):
+        self.model = "stub-model"
+        self.prompt_version = 1
+        self.batch_prompt_version = 1
+        self.prompt_hash = hash_prompt()
+        self.batch_prompt_hash = hash_prompt(BATCH_INSTRUCTIONS, BATCH_PROMPT)
+        self.cache = cache
+
+    def build_batch_request(self, users):
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": BATCH_INSTRUCTIONS},
+                {"role": "user", "content": build_batch_prompt(users)},
+            ],
+        }
+
+
+def make_users(num_users):
+    return [
+        {
+            "user_id": str(user_id),
+            "description": f"Description of user {user_id}",
+            "tweets": [f"Tweet of user {user_id}"],
+        }
+        for user_id in range(num_users)
+    ]
+
+
+def test_job_runs_end_to_end(tmp_path):
+    batch_client = LocalBatchClient(root=tmp_path / "stub", delay=0)
+    job = ClassificationBatchJob(batch_client, "city", tmp_path / "jobs")
+    classifier = StubClassifier(ResponseCache(tmp_path / "cache.db"))
+
+    assert job.prepare(make_users(5), classifier, batch_size=2) == 3
+    job.submit()
+    assert asyncio.run(job.poll(poll_interval=0)) == "completed"
+    classifications, missing = job.read_results(classifier)
+
+    assert classifications == {str(user_id): "other" for user_id in range(5)}
+    assert missing == []
+    assert (tmp_path / "jobs" / "city" / "classifications.json").exists()
+
+    # A new job answers the same users from the cache, without requests
+    new_job = ClassificationBatchJob(batch_client, "again", tmp_path / "jobs")
+    assert new_job.prepare(make_users(5), classifier) == 0
+    assert new_job.read_results()[0] == classifications
+
+
+def test_in_progress_batch_is_not_prepared_again(tmp_path):
+    batch_client = LocalBatchClient(root=tmp_path / "stub", delay=3600)
+    job = ClassificationBatchJob(batch_client, "city", tmp_path / "jobs")
+    classifier = StubClassifier()
+    job.prepare(make_users(3), classifier)
+    job.submit()
+
+    # The job is resumed from its directory, e.g. after a crash
+    job = ClassificationBatchJob(batch_client, "city", tmp_path / "jobs")
+    assert job.batch_in_progress
+    with pytest.raises(ValueError):
+        job.prepare(make_users(3), classifier)
+    with pytest.raises(ValueError):
+        job.submit()
@@ -1,79 +1,47 @@
 """
 Script to upload all pending tweets from the users in the pilot cities to S3
+
+Uploads are recorded in a local manifest, so re-running a city only
+uploads the descriptions and tweets that changed since the last run.
 """
 
+import json
 from argparse import ArgumentParser
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
-import boto3
-import botocore
-from config_utils.constants import NEPTUNE_S3_BUCKET, NUM_WORKERS, REGION_NAME
+from config_utils.constants import NEPTUNE_S3_BUCKET, STORAGE_BACKEND
+from config_utils.s3_sync import S3Sync
+from config_utils.tweet_packs import user_input_prefix, write_tweet_pack
 from config_utils.util import load_json
-from tqdm import tqdm
 
 
-def _upload_one(args):
+def description_sync_item(location, user):
     """
-    Put a single object in S3
+    Builds the (key, body) tuple of a user's description
     """
-    s3_client.put_object(**args)
+    key = f"{user_input_prefix(location, user['user_id'])}description.txt"
+    return key, user["description"].encode("utf-8", errors="ignore")
 
 
-def insert_descriptions_to_s3(location, users_list):
+def tweets_sync_item(location, user_id, tweets_list):
     """
-    Function to insert each user's description as
-    a txt file to S3
+    Builds the sync item of a user's tweets. Each pack is written under a
+    new key, so the manifest tracks them under the user's "tweets" key,
+    with the tweets themselves as content.
+
+    These tweets are already filtered
     """
-    s3_client = boto3.client("s3", region_name=REGION_NAME)
-    for user in tqdm(users_list):
-        s3_path = f"networks/{location}/classification/{user['user_id']}/input/description.txt"
-        try:
-            s3_client.put_object(
-                Bucket=NEPTUNE_S3_BUCKET,
-                Key=s3_path,
-                Body=user["description"].encode("utf-8", errors="ignore"),
-            )
-        except botocore.exceptions.ClientError:
-            print(f"Unable to upload description for {user['user_id']}")
-            continue
+    content = json.dumps(
+        [[tweet["tweet_id"], tweet["tweet_text"]] for tweet in tweets_list]
+    ).encode("utf-8", errors="ignore")
 
+    def upload(s3_client, bucket, key, content):
+        write_tweet_pack(s3_client, location, user_id, tweets_list, bucket)
 
-def insert_tweets_to_s3(location, user_id, tweets_list):
-    """
-    Function to insert each user's tweets as
-    a txt files to S3
+    return f"{user_input_prefix(location, user_id)}tweets", content, upload
 
-    These tweets are already filtered
-    """
-    if not tweets_list:
-        return
-
-    jobs = []
-    for t in tweets_list:
-        key = f"networks/{location}/classification/{user_id}/input/tweet_{t['tweet_id']}.txt"
-        jobs.append(
-            {
-                "Bucket": NEPTUNE_S3_BUCKET,
-                "Key": key,
-                "Body": t["tweet_text"].encode("utf-8", errors="ignore"),
-            }
-        )
-
-    # Parallely uploading tweets
-    with ThreadPoolExecutor(max_workers=NUM_WORKERS) as pool:
-        futures = [pool.submit(_upload_one, job) for job in jobs]
-        for future in tqdm(
-            as_completed(futures), total=len(futures), desc="Uploading tweets"
-        ):
-            try:
-                future.result()
-            except Exception as e:
-                # handle/log individual upload errors
-                print("Upload failed:", e)
-
-
-def upload_user_tweets(location):
+
+def upload_user_tweets(location, force=False, storage_backend=STORAGE_BACKEND):
     """
     Reads user data from raw location JSON, then uploads
     tweets to S3
@@ -86,19 +54,17 @@ def upload_user_tweets(location):
     location_json = load_json(file_path)
 
     num_users = len(location_json)
-    users_list = []
+    descriptions = []
+    tweet_items = []
     print(f"Number of root users {num_users}")
 
-    for user_dict in tqdm(location_json):
-        tmp_dict = {}
+    for user_dict in location_json:
         original_tweets = []
         if "followers_count" not in user_dict:
             print(f"Skipping {user_dict['user_id']}")
             continue
 
-        tmp_dict["user_id"] = user_dict["user_id"]
-        tmp_dict["description"] = user_dict["description"]
-        users_list.append(tmp_dict)
+        descriptions.append(description_sync_item(location, user_dict))
 
         user_tweets = user_dict["tweets"]
         for user_tweet in user_tweets:
@@ -106,10 +72,21 @@ def upload_user_tweets(location):
             if not user_tweet["tweet_text"].startswith("RT @"):
                 original_tweets.append(user_tweet)
 
-        insert_tweets_to_s3(location, user_dict["user_id"], original_tweets)
+        if original_tweets:
+            tweet_items.append(
+                tweets_sync_item(
+                    location, user_dict["user_id"], original_tweets
+                )
+            )
+
+    s3_sync = S3Sync(NEPTUNE_S3_BUCKET, storage_backend, force=force)
+    print("Inserting tweets...")
+    counts = s3_sync.sync(tweet_items, desc="Uploading tweets")
+    print(f"Tweets: {counts}")
 
     print("Inserting descriptions...")
-    insert_descriptions_to_s3(location, users_list)
+    counts = s3_sync.sync_bodies(descriptions, desc="Uploading descriptions")
+    print(f"Descriptions: {counts}")
 
     print(f"Done with {location}")
 
@@ -120,8 +97,18 @@ if __name__ == "__main__":
     parser.add_argument(
         "--location", type=str, help="Location to read tweets from"
     )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Upload everything again, ignoring the upload manifest",
+    )
+    parser.add_argument(
+        "--storage_backend",
+        type=str,
+        choices=["s3", "local"],
+        default=STORAGE_BACKEND,
+        help="Upload to AWS S3 or to the local object store",
+    )
     args = parser.parse_args()
 
-    s3_client = boto3.client("s3", region_name=REGION_NAME)
-    print("Inserting tweets...")
-    upload_user_tweets(args.location)
+    upload_user_tweets(args.location, args.force, args.storage_backend)